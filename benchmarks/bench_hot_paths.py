@@ -0,0 +1,174 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Allows the modules package to be imported
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen") # GUI paths run without a display
+
+from modules import core
+from modules.totals import Totals
+from modules.export import csv_blocks, iter_records
+from benchmarks.synthetic import generate_rows, write_ledger
+
+# Times the ledger hot paths on synthetic ledgers and prints the results as JSON.
+#   python benchmarks/bench_hot_paths.py --rows 10000 100000 1000000 --output results.json
+
+# Item lists cost about 0.5 KB a row, so Item construction and read_csv_file are timed on at most this many rows
+item_sample_rows = 100000
+
+# Runs function repeat times and returns the fastest wall time in seconds
+def best_time(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def result(name, rows, seconds, operations=None):
+    operations = operations or rows
+    return {"name": name, "rows": rows, "operations": operations, "seconds": round(seconds, 6),
+            "per_second": round(operations / seconds) if seconds else None}
+
+# Times building Items from rows generated up front. The rows are freed when it returns, before the file benchmarks run
+def time_item_construction(rows, repeat):
+    raw_rows = list(generate_rows(rows))
+    return best_time(lambda: [core.Item(*row) for row in raw_rows], repeat)
+
+# Benchmarks that only need the core modules
+def core_benchmarks(csv_path, rows, repeat):
+    results = []
+    sample_rows = min(rows, item_sample_rows)
+    results.append(result("item_construction", sample_rows, time_item_construction(sample_rows, repeat)))
+
+    if rows <= item_sample_rows: # Larger files would hold every Item in memory at once
+        seconds = best_time(lambda: core.read_csv_file(csv_path), repeat)
+        results.append(result("read_csv_file", rows, seconds))
+
+    seconds = best_time(lambda: core.read_csv_ledger(csv_path), repeat)
+    results.append(result("read_csv_ledger", rows, seconds))
+
+    ledger, _ = core.read_csv_ledger(csv_path)
+
+    seconds = best_time(lambda: Totals().add_ledger(ledger), repeat)
+    results.append(result("totals_bulk", rows, seconds))
+
+    totals = Totals()
+    operations = min(rows, 100000)
+    def update_totals():
+        for row in range(operations):
+            totals.add_row(ledger, row)
+            totals.subtract_row(ledger, row)
+    seconds = best_time(update_totals, repeat)
+    results.append(result("totals_add_subtract", rows, seconds, operations * 2))
+
+    with tempfile.TemporaryDirectory() as folder:
+        target = os.path.join(folder, "ledger.csv")
+        seconds = best_time(lambda: core.write_ledger(target, ledger), repeat)
+        results.append(result("write_csv", rows, seconds))
+
+        target = os.path.join(folder, "ledger.mtl")
+        seconds = best_time(lambda: core.write_ledger(target, ledger), repeat)
+        results.append(result("write_binary", rows, seconds))
+
+        seconds = best_time(lambda: core.read_ledger(target), repeat)
+        results.append(result("open_binary", rows, seconds))
+
+    return results
+
+# Benchmarks that drive the Money_Tracker window under Qt's offscreen platform
+def gui_benchmarks(csv_path, rows, repeat):
+    from PySide6.QtWidgets import QApplication
+    from modules import UI
+
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    # Window that opens a fixed file and answers yes to every question instead of showing dialogs
+    class Benchmark_Tracker(UI.Money_Tracker):
+        def open_file_explorer(self):
+            self.selected_csv = self.active_file_path = self.benchmark_path
+
+        def save_file_question_window(self, title, text):
+            return True
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        window = Benchmark_Tracker()
+        window.benchmark_path = os.path.join(folder, "ledger.csv")
+        with open(csv_path, mode='rb') as source, open(window.benchmark_path, mode='wb') as target:
+            target.write(source.read())
+
+        def open_file():
+            window.open_file()
+            while window.loader is not None: # Waits for the worker thread to hand over every batch
+                app.processEvents()
+        seconds = best_time(open_file, repeat)
+        results.append(result("open_file", rows, seconds))
+
+        window.add_item(core.Item("Benchmark", "1.00", "Other", "Expenditure")) # A real row, so the journal matches the ledger
+        seconds = best_time(window.save_file, 1) # Journal append of a single change
+        results.append(result("save_file_one_change", rows, seconds, 1))
+
+        items = [core.Item(*row) for row in generate_rows(min(rows, 10000), seed=1)]
+        def add_items():
+            for item in items:
+                window.add_item_to_table(item)
+                window.add_to_total(len(window.model.ledger) - 1)
+        seconds = best_time(add_items, 1)
+        results.append(result("add_item_to_table", rows, seconds, len(items)))
+
+        with open(os.devnull, mode='w', newline='') as null_file:
+            def export_rows(): # The streamed csv blocks a save or export writes
+                for block in csv_blocks(iter_records(window.model.ledger)):
+                    null_file.write(block)
+            seconds = best_time(export_rows, repeat)
+        results.append(result("export_csv_blocks", len(window.model.ledger), seconds))
+
+        operations = min(rows, 1000)
+        def remove_items():
+            for _ in range(operations):
+                window.table.setCurrentIndex(window.model.index(0, 0))
+                window.remove_item()
+        seconds = best_time(remove_items, 1)
+        results.append(result("remove_item", rows, seconds, operations))
+
+        window.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ledger hot paths on synthetic data")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000], help="ledger sizes to test, e.g. 10000 1000000 10000000")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the fastest is reported")
+    parser.add_argument("--no-gui", action="store_true", help="skip the benchmarks that need PySide6")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": [],
+    }
+
+    with tempfile.TemporaryDirectory() as folder:
+        for rows in args.rows:
+            csv_path = os.path.join(folder, f"ledger_{rows}.csv")
+            write_ledger(csv_path, rows)
+            report["results"].extend(core_benchmarks(csv_path, rows, args.repeat))
+            if not args.no_gui:
+                report["results"].extend(gui_benchmarks(csv_path, rows, args.repeat))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, mode='w', encoding='utf-8') as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
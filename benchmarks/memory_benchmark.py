@@ -0,0 +1,55 @@
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Allows the modules package to be imported
+
+from modules.core import Item
+from modules.ledger import Ledger
+from benchmarks.synthetic import generate_rows
+
+# Row layout used before the column store, one object with a __dict__ per row and its own capitalized strings
+class Dict_Item:
+    def __init__(self, name, price, category, cashflow):
+        self.name = name.strip()
+        self.price = float(price) if "." in price else int(price)
+        self.category = category.strip().lower().capitalize()
+        self.cashflow = cashflow.strip().lower().capitalize()
+
+# Returns the number of bytes still allocated after build(rows) runs and its result is kept alive
+def measure(build, count):
+    gc.collect()
+    tracemalloc.start()
+    result = build(generate_rows(count)) # The generator itself is freed, only the built container remains
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+def build_item_list(rows):
+    return [Dict_Item(*row) for row in rows]
+
+def build_ledger(rows):
+    ledger = Ledger()
+    for row in rows:
+        ledger.append(Item(*row))
+    return ledger
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes per row of the ledger before and after the column store")
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    before = measure(build_item_list, args.rows)
+    after = measure(build_ledger, args.rows)
+
+    print(f"rows:              {args.rows}")
+    print(f"Item list:         {before / args.rows:8.1f} bytes/row")
+    print(f"Ledger columns:    {after / args.rows:8.1f} bytes/row")
+    print(f"reduction:         {before / after:8.2f}x")
+
+if __name__ == '__main__':
+    main()
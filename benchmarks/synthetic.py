@@ -0,0 +1,58 @@
+import argparse
+import csv
+import random
+
+from datetime import date
+
+# Generates synthetic Name,Price,Category,Cashflow ledgers for the benchmarks.
+# The mix roughly follows a personal account: lots of small grocery and restaurant expenses, a few large bills
+# and rent payments, and occasional wages coming in
+
+# category: (relative frequency, names, typical price, income share)
+profiles = {
+    "Groceries": (30, ("Woolworths", "Coles", "Aldi", "Farmers market", "Butcher"), 45.0, 0.0),
+    "Restaurants": (22, ("Uber Eats", "Cafe", "Pizza place", "Sushi train", "Pub dinner"), 28.0, 0.0),
+    "Entertainment": (10, ("Cinema", "Concert tickets", "Steam", "Bowling", "Museum"), 35.0, 0.0),
+    "Household": (9, ("Bunnings", "Ikea", "Kmart", "Cleaning supplies", "Hardware store"), 60.0, 0.0),
+    "Subscriptions": (8, ("Netflix", "Spotify", "Gym membership", "Cloud storage", "Newspaper"), 15.0, 0.0),
+    "Bills": (7, ("Power bill", "Water bill", "Internet", "Phone plan", "Car insurance"), 120.0, 0.0),
+    "Other": (7, ("Gift", "Pharmacy", "Parking", "Transfer", "Refund"), 40.0, 0.3),
+    "Rent": (4, ("Rent payment", "Bond", "Strata levy"), 550.0, 0.05),
+    "Wages": (3, ("Salary", "Bonus", "Freelance invoice", "Tax return"), 2400.0, 1.0),
+}
+
+category_names = tuple(profiles)
+category_weights = tuple(profile[0] for profile in profiles.values())
+
+first_day = date(2020, 1, 1).toordinal() # Dated rows are spread over the five years from here
+dated_days = 5 * 365
+
+# Yields rows as lists of strings in the same form csv.reader returns them, with a Date field when dated is set
+def generate_rows(count, seed=0, dated=False):
+    rng = random.Random(seed)
+    choices = rng.choices(category_names, weights=category_weights, k=count)
+    for category in choices:
+        _, names, typical_price, income_share = profiles[category]
+        price = max(0.01, rng.lognormvariate(0, 0.6) * typical_price) # Skewed towards small amounts with a long tail
+        cashflow = "Income" if rng.random() < income_share else "Expenditure"
+        row = [f"{rng.choice(names)} #{rng.randrange(1000)}", f"{price:.2f}", category, cashflow]
+        if dated:
+            row.append(date.fromordinal(first_day + rng.randrange(dated_days)).isoformat())
+        yield row
+
+# Writes a synthetic ledger csv file with count rows
+def write_ledger(path, count, seed=0, dated=False):
+    with open(path, mode='w', newline='', encoding='utf-8') as file:
+        csv.writer(file).writerows(generate_rows(count, seed, dated))
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic Name,Price,Category,Cashflow ledger")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dated", action="store_true", help="add a Date column spread over five years")
+    args = parser.parse_args()
+    write_ledger(args.path, args.rows, args.seed, args.dated)
+
+if __name__ == '__main__':
+    main()
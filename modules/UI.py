@@ -1,12 +1,44 @@
 import re
-import csv
 import os
+import sqlite3
+import struct
+import time
 
-from typing import Union
-from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+from array import array
+
+from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTableView,
                                QPushButton, QDialog, QLineEdit, QLabel, QComboBox, QAbstractItemView, QSizePolicy, 
-                               QHeaderView, QMessageBox, QFileDialog)
-from PySide6.QtGui import QAction
+                               QHeaderView, QMessageBox, QFileDialog, QProgressBar, QPlainTextEdit,
+                               QGroupBox, QTableWidget, QTableWidgetItem)
+from PySide6.QtGui import QAction, QKeySequence
+from PySide6.QtCore import Qt, QThreadPool, QTimer
+
+from modules.ledger_model import Ledger_Model
+from modules.csv_loader import CSV_Loader, Database_Loader, Import_Task, Save_Task
+from modules.ledger import categories, cashflows, format_cents, EXPENDITURE
+from modules.totals import Totals
+from modules.journal import Journal, add_change, remove_change, replay_journal
+from modules.binary_ledger import Mapped_Ledger, is_binary_ledger
+from modules.sqlite_store import SQLite_Store, is_database
+from modules.time_index import Time_Index, period_label
+from modules.history import History, Command, ADD, REMOVE, IMPORT, pack_row, unpack_row
+from modules.recovery import recovery_path, write_recovery, discard_recovery, find_recoveries, load_recovery
+from modules.rules import load_rules, default_rules
+from modules.user_categories import load_user_categories
+from modules.dedup import dedup_suffix
+from modules.export import export_file, export_format
+from modules import config, profiling
+from modules.profiling import timed
+from modules.core import Item
+
+# File dialog filters. Compressed csv ledgers open like plain ones
+ledger_filter = "Ledger files (*.csv *.csv.gz *.csv.zst *.mtl *.db)"
+export_filters = "CSV Files (*.csv);;Compressed CSV (*.csv.gz);;Zstandard CSV (*.csv.zst);;JSON Lines (*.jsonl);;Compressed JSON Lines (*.jsonl.gz)"
+
+# Returns the extension of a file dialog filter e.g. "Compressed CSV (*.csv.gz)" -> ".csv.gz", or default when it has none
+def filter_suffix(selected_filter, default):
+    match = re.search(r'\(\*(\.[\w.]+)\)', selected_filter)
+    return match.group(1) if match else default
 
 # Creates an error window popup
 def create_error_window(title, text):
@@ -17,54 +49,6 @@ def create_error_window(title, text):
     error_box.setStandardButtons(QMessageBox.Ok) # Gives an ok button for the user to press
     error_box.exec_()
 
-# Item object whose information will be used to populate the list
-class Item:
-
-    categories = ("wages", "rent", "bills", "subscriptions", "restaurants",
-                    "groceries", "household", "entertainment", "other")
-    
-    # Define paramaters of a certain type. Union[] allows either option
-    def __init__(self, name: str, price: Union[int, float], category: str, cashflow: str):
-        self.name = name.strip() if name and name != "" else "-" # Trailing whitespace removed from name and set to name or default of - 
-        self.price = self.check_if_positive(price)
-        self.category = self.check_category(category)
-        self.cashflow = self.check_cashflow(cashflow)
-
-    # Checks if the price is a float based on if a . is present
-    def check_if_float(self, price):
-        pattern = r'^[^.]*\.[^.]*$'  # Only one . can be present
-        if re.search(pattern, price):
-            price = float(price)
-            return price
-        else:
-            price = int(price)
-            return price
-    
-    # Checks if the price is positive by checking if it is lower than 0
-    def check_if_positive(self, price):
-        check_if_float_price = self.check_if_float(price)
-        
-        if check_if_float_price < 0:
-            raise ValueError("Expected a positive number")
-        else:
-            return check_if_float_price
-    
-    # Checks if the category passed is in the list of categories
-    def check_category(self, category):
-        cat = category.strip() # Removes trailing and leading whitespace
-        if cat.lower() in self.categories:
-            return cat.lower().capitalize() # Return capitalized version of category
-        else:
-            raise ValueError("Expected categories: Wages, Rent, Bills, Subscriptions, Restaurants, Groceries, Household, Entertainment, Other")
-
-    # Checks if the cashflow passed is income or expenditure
-    def check_cashflow(self, cashflow):
-        cash = cashflow.strip() # Removes trailing and leading whitespace
-        if cash.lower() == "income" or cash.lower() == "expenditure":
-            return cash.lower().capitalize() # Return capitalized version of cashflow
-        else:
-            raise ValueError("Expected: Income or Expenditure")
-
 # Popup box that appears when Add Item button is clicked
 class Add_Popup(QDialog):
     def __init__(self):
@@ -83,10 +67,12 @@ class Add_Popup(QDialog):
         price_label = QLabel("Price:    ")
         category_label = QLabel("Category: ")
         cashflow_label = QLabel("Cashflow: ")
+        date_label = QLabel("Date:     ")
         labels_layout.addWidget(name_label)  # Adds the labels to the layout
         labels_layout.addWidget(price_label)
         labels_layout.addWidget(category_label)
         labels_layout.addWidget(cashflow_label)
+        labels_layout.addWidget(date_label)
 
         input_layout = QVBoxLayout()  # Creates a layout for the user input items
         # Creates an editable area for the item name
@@ -97,11 +83,9 @@ class Add_Popup(QDialog):
         input_layout.addWidget(self.name_box)
         input_layout.addWidget(self.price_box)
 
-        category = ("Wages", "Rent", "Bills", "Subscriptions", "Restaurants",
-                    "Groceries", "Household", "Entertainment", "Other")
         self.category_menu = QComboBox()  # Creates a dropdown menu
-        # Adds the category list items to the dropdown menu
-        self.category_menu.addItems(category)
+        # Adds the category list items to the dropdown menu, including user defined categories
+        self.category_menu.addItems(categories)
         # Adds the dropdown to the input layout
         input_layout.addWidget(self.category_menu)
 
@@ -111,6 +95,11 @@ class Add_Popup(QDialog):
         # Adds the dropdown to the input layout
         input_layout.addWidget(self.cashflow_menu)
 
+        # Creates an editable area for the optional date
+        self.date_box = QLineEdit(self)
+        self.date_box.setPlaceholderText("YYYY-MM-DD (optional)")
+        input_layout.addWidget(self.date_box)
+
         # Creates a layout to hold the labels and input
         labels_input_layout = QHBoxLayout()
         # Adds the label layout to the parent
@@ -141,27 +130,142 @@ class Add_Popup(QDialog):
         # The selected category input name
         selected_category = self.category_menu.currentText()
         selected_cashflow = self.cashflow_menu.currentText()  # The selected cashflow input
+        date_input = self.date_box.text()  # The date input text, may be empty
 
-        # ValueError raised when int/float is not entered into price box. Error popup raised
+        # ValueError raised when int/float is not entered into price box or the date is not valid. Error popup raised
         try:
             self.item = Item(name_input, price_input, selected_category,
-                            selected_cashflow)  # Creates the item object
+                            selected_cashflow, date_input)  # Creates the item object
             self.close()  # Close the window after add is pressed
             return self.item
         except ValueError: # Display an error popup when numbers are not entered into the price box
-            create_error_window("Invalid Entry", "Please enter a number 0.0 or greater")
+            create_error_window("Invalid Entry", "Please enter a number 0.0 or greater and a date as YYYY-MM-DD or leave the date empty")
             
     def on_cancel(self):
         self.item = None  # Reset the self.item if cancel is pressed
         self.close()  # If cancel is pressed close the window
 
 
+# Dialog listing every row that was rejected while importing a file
+class Import_Report(QDialog):
+    def __init__(self, file_name, errors, rows_loaded, duplicates=(), note=""):
+        super().__init__()
+
+        self.setWindowTitle("Import Report")
+        self.setGeometry(700, 300, 600, 400)
+
+        summary = QLabel(f"{file_name}: {rows_loaded} rows imported, {len(errors)} problems found"
+                         + (f", {len(duplicates)} duplicates of rows already in the ledger" if duplicates else "")
+                         + ". The rows below were skipped." + (f" {note}" if note else "")
+                         + "\n\nExpected format: Name,Price,Category,Cashflow with an optional Date (YYYY-MM-DD)")
+        summary.setWordWrap(True)
+
+        report = QPlainTextEdit() # Read only text box holding one line per rejected field or skipped duplicate
+        report.setReadOnly(True)
+        report.setPlainText("\n".join([*(str(error) for error in errors), *duplicates]))
+
+        ok_button = QPushButton("Ok", self)
+        ok_button.clicked.connect(self.close)
+
+        main_layout = QVBoxLayout()
+        main_layout.addWidget(summary)
+        main_layout.addWidget(report)
+        main_layout.addWidget(ok_button)
+        self.setLayout(main_layout)
+
+# Dialog with the totals of each category per month or year, every cell comes from a range query on the Time_Index
+class Report_Window(QDialog):
+    def __init__(self, index, period):
+        super().__init__()
+
+        self.setWindowTitle("Monthly Report" if period == "month" else "Yearly Report")
+        self.setGeometry(700, 300, 800, 400)
+
+        rollup = index.rollup(EXPENDITURE, period)
+        used = sorted({category for _, cents in rollup for category in cents})
+
+        summary = QLabel(f"Expenditure per {period} by category" if rollup else "No rows have a date")
+        table = QTableWidget(len(rollup), len(used) + 1) # Only one row per period so a widget item per cell is fine here
+        table.setHorizontalHeaderLabels([categories[category] for category in used] + ["Total"])
+        table.setVerticalHeaderLabels([period_label(start, period) for start, _ in rollup])
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        for row, (_, cents) in enumerate(rollup):
+            for column, category in enumerate(used):
+                table.setItem(row, column, QTableWidgetItem(format_cents(cents.get(category, 0))))
+            table.setItem(row, len(used), QTableWidgetItem(format_cents(sum(cents.values()))))
+
+        ok_button = QPushButton("Ok", self)
+        ok_button.clicked.connect(self.close)
+
+        main_layout = QVBoxLayout()
+        main_layout.addWidget(summary)
+        main_layout.addWidget(table)
+        main_layout.addWidget(ok_button)
+        self.setLayout(main_layout)
+
+# Debug dialog listing the call counts and timings collected by modules/profiling.py
+class Stats_Window(QDialog):
+    def __init__(self):
+        super().__init__()
+
+        self.setWindowTitle("Performance Stats")
+        self.setGeometry(700, 300, 700, 400)
+
+        self.report = QPlainTextEdit() # Read only text box with one line per timed function
+        self.report.setReadOnly(True)
+        self.report.setLineWrapMode(QPlainTextEdit.NoWrap)
+
+        refresh_button = QPushButton("Refresh", self)
+        refresh_button.clicked.connect(self.refresh)
+        reset_button = QPushButton("Reset", self)
+        reset_button.clicked.connect(self.on_reset)
+        save_button = QPushButton("Save JSON..", self)
+        save_button.clicked.connect(self.on_save)
+        ok_button = QPushButton("Ok", self)
+        ok_button.clicked.connect(self.close)
+        for button in (reset_button, save_button):
+            button.setEnabled(profiling.enabled)
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(refresh_button)
+        button_layout.addWidget(reset_button)
+        button_layout.addWidget(save_button)
+        button_layout.addWidget(ok_button)
+
+        main_layout = QVBoxLayout()
+        main_layout.addWidget(self.report)
+        main_layout.addLayout(button_layout)
+        self.setLayout(main_layout)
+        self.refresh()
+
+    # Shows the current stats
+    def refresh(self):
+        if not profiling.enabled:
+            self.report.setPlainText("Instrumentation is off. Start Money Tracker with MONEY_TRACKER_INSTRUMENT=1 to collect timings.")
+            return
+        lines = [f"{'Function':<40}{'Calls':>10}{'Total ms':>12}{'Mean us':>12}{'Max us':>12}"]
+        for name, stat in profiling.snapshot().items():
+            lines.append(f"{name:<40}{stat['count']:>10}{stat['total_us'] / 1000:>12.1f}{stat['mean_us']:>12.1f}{stat['max_us']:>12.1f}")
+        self.report.setPlainText("\n".join(lines))
+
+    def on_reset(self):
+        profiling.reset()
+        self.refresh()
+
+    # Writes the stats with their histograms to a JSON file
+    def on_save(self):
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save Stats", "", "JSON Files (*.json)")
+        if file_name:
+            profiling.dump(file_name)
+
+
 class Money_Tracker(QMainWindow):
     def __init__(self):  # Initialises the main window for the UI
         super().__init__()
 
         self.active_window = [] # List to store the active window
         self.active_file_path = "" # String to store the active file path
+        self.dirty = False # True while the ledger has changes that have not been saved, shown as a * in the title
 
         self.setWindowTitle("Money Tracker - untitled")
         self.setGeometry(700, 300, 600, 500)  # x, y, width, height
@@ -169,10 +273,35 @@ class Money_Tracker(QMainWindow):
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
 
-        self.income_total = 0 # Used in the add_to_total method
-        self.expenditure_total = 0 # Used in the add_to_total method
+        self.totals = Totals() # Cents per category and cashflow, updated as rows are added and removed
+
+        self.journal = None # Journal of the active file, saves append the pending changes to it
+        self.store = None # SQLite_Store of the active .db file, saves write the pending changes to it row by row
+        self.pending_changes = [] # Adds and removes made since the last save
+        self.history = History(config.undo_depth) # Changes that can be undone, see MONEY_TRACKER_UNDO_DEPTH
 
-        self.rows_added = 0 # Used in save method
+        self.loader = None # CSV_Loader or Database_Loader of the file currently being opened
+        self.rejected_rows = [] # Row_Error list collected while the file loads
+        self.import_task = None # Import_Task of the files currently being imported
+        self.dedup = None # Dedup_Index of the ledger's rows, built by the first import that skips duplicates
+        self.time_index = None # Time_Index of the ledger's dated rows, built by the first report
+        self.export_task = None # Save_Task writing an export
+        self.save_task = None # Save_Task writing the whole ledger to the active file
+        self.rewrite_needed = False # Set when a change since the running save can only be saved by rewriting the file
+        self.autosave_task = None # Save_Task writing the recovery file
+        self.recovery_file = recovery_path(id(self)) # Unsaved changes are autosaved here, see MONEY_TRACKER_AUTOSAVE
+
+        # Rules that categorize opened and imported rows without a category, see MONEY_TRACKER_RULES.
+        # Loaded before the UI is set up so the category menus include the user defined categories
+        try:
+            load_user_categories()
+        except (OSError, ValueError) as error:
+            create_error_window("Invalid Categories", f"The user categories file could not be read:\n\n{error}")
+        try:
+            self.rules = default_rules()
+        except (OSError, ValueError) as error:
+            self.rules = None
+            create_error_window("Invalid Rules", f"The rules file could not be read:\n\n{error}")
 
         self.setup_menuBar() # Calls the setup_menuBar to create menu header options
         self.setup_ui() # Calls setup_ui to create graphical elements of the UI
@@ -182,12 +311,28 @@ class Money_Tracker(QMainWindow):
         self.open_action.triggered.connect(self.open_file)
         self.save_action.triggered.connect(self.save_file)
         self.save_as_action.triggered.connect(self.save_as_file)
+        self.import_action.triggered.connect(self.import_files)
+        self.export_action.triggered.connect(lambda: self.export_rows(summary=False))
+        self.export_summary_action.triggered.connect(lambda: self.export_rows(summary=True))
+        self.rules_action.triggered.connect(self.load_rules_file)
+        self.monthly_report_action.triggered.connect(lambda: self.show_report("month"))
+        self.yearly_report_action.triggered.connect(lambda: self.show_report("year"))
+        self.undo_action.triggered.connect(self.undo)
+        self.redo_action.triggered.connect(self.redo)
+        self.stats_action.triggered.connect(self.show_stats)
 
         # When add button is clicked the popup method runs
         self.add_button.clicked.connect(self.add_item_popup)
         # Runs the remove item method to remove the selected item
         self.remove_button.clicked.connect(self.remove_item)
 
+        # Autosaves unsaved changes to the recovery file so they survive a crash
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setInterval(config.autosave_seconds * 1000)
+        self.autosave_timer.timeout.connect(self.autosave)
+        if config.autosave_seconds:
+            self.autosave_timer.start()
+
     # Creates the menubar with options File->New/Open/Save/SaveAs
     def setup_menuBar(self):
         menubar = self.menuBar()
@@ -202,16 +347,46 @@ class Money_Tracker(QMainWindow):
         file_menu.addAction(self.save_action)
         self.save_as_action = QAction("Save As..", self)
         file_menu.addAction(self.save_as_action)
+        self.import_action = QAction("Import Files..", self)
+        file_menu.addAction(self.import_action)
+        self.export_action = QAction("Export..", self)
+        file_menu.addAction(self.export_action)
+        self.export_summary_action = QAction("Export Summary..", self)
+        file_menu.addAction(self.export_summary_action)
+        self.rules_action = QAction("Load Rules..", self)
+        file_menu.addAction(self.rules_action)
+        self.skip_duplicates_action = QAction("Skip Duplicates on Import", self) # Rows already in the ledger are not imported again
+        self.skip_duplicates_action.setCheckable(True)
+        self.skip_duplicates_action.setChecked(True)
+        file_menu.addAction(self.skip_duplicates_action)
+
+        edit_menu = menubar.addMenu("Edit")
+        self.undo_action = QAction("Undo", self)
+        self.undo_action.setShortcut(QKeySequence.Undo)
+        edit_menu.addAction(self.undo_action)
+        self.redo_action = QAction("Redo", self)
+        self.redo_action.setShortcut(QKeySequence.Redo)
+        edit_menu.addAction(self.redo_action)
+
+        report_menu = menubar.addMenu("Reports")
+        self.monthly_report_action = QAction("Monthly Report..", self)
+        report_menu.addAction(self.monthly_report_action)
+        self.yearly_report_action = QAction("Yearly Report..", self)
+        report_menu.addAction(self.yearly_report_action)
+
+        help_menu = menubar.addMenu("Help")
+        self.stats_action = QAction("Performance Stats..", self)
+        help_menu.addAction(self.stats_action)
 
     # Creates the graphical elements of the UI
     def setup_ui(self):
-        # Initial row boolean will be used to remove the row when first item is added
-        self.initial_row = True
-        self.table = QTableWidget(1, 4)  # Create a 1x4 table widget
+        self.model = Ledger_Model() # Model serving the rows of the ledger column store to the table
+        self.table = QTableView() # Virtualized view, only the visible rows are requested from the model
+        self.table.setModel(self.model)
         # Disable the edit triggers on the table so that cells cannot be edited
         self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
-        self.table.setHorizontalHeaderLabels(
-            ["Name", "Price", "Category", "Cashflow"])  # Sets column header lable
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows) # Selecting a cell selects the whole row
+        self.table.verticalHeader().setDefaultSectionSize(self.table.verticalHeader().minimumSectionSize()) # Fixed row heights
 
         # Table will expand to fit the available horizontal/veritcal space when window is resized
         self.table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
@@ -219,8 +394,49 @@ class Money_Tracker(QMainWindow):
         # Table headers/cells will stretch uniformly to fit the available space of the table widget which is the window size
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
 
-        self.income_label = QLabel("Income: 0.0") 
-        self.expenditure_label = QLabel("Expenditure: 0.0") 
+        # Clicking a header sorts by that column. The indicator starts unset so the rows first show in ledger order
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table.setSortingEnabled(True)
+
+        # Search box and category/cashflow filters above the table, answered from the model's index rather than a rescan
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search names")
+        self.search_box.setClearButtonEnabled(True)
+        self.category_filter_menu = QComboBox()
+        self.category_filter_menu.addItems(["All categories", *categories])
+        self.cashflow_filter_menu = QComboBox()
+        self.cashflow_filter_menu.addItems(("All cashflows",) + cashflows)
+        # Typing restarts a short timer so the rows are filtered once the typing pauses instead of on every keystroke
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(200)
+        self.search_timer.timeout.connect(self.apply_filter)
+        self.search_box.textChanged.connect(self.search_timer.start)
+        self.category_filter_menu.currentIndexChanged.connect(self.apply_filter)
+        self.cashflow_filter_menu.currentIndexChanged.connect(self.apply_filter)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(self.search_box)
+        filter_layout.addWidget(self.category_filter_menu)
+        filter_layout.addWidget(self.cashflow_filter_menu)
+
+        self.income_label = QLabel("Income: 0.00") 
+        self.expenditure_label = QLabel("Expenditure: 0.00") 
+
+        # Summary panel with the net balance and the totals of each category
+        summary_box = QGroupBox("Summary")
+        self.net_label = QLabel("Net balance: 0.00")
+        self.breakdown_label = QLabel()
+        summary_layout = QVBoxLayout()
+        summary_layout.addWidget(self.net_label)
+        summary_layout.addWidget(self.breakdown_label)
+        summary_box.setLayout(summary_layout)
+
+        # Label updates are batched so a bulk load repaints the totals once per interval instead of per row
+        self.totals_timer = QTimer(self)
+        self.totals_timer.setSingleShot(True)
+        self.totals_timer.setInterval(50)
+        self.totals_timer.timeout.connect(self.update_totals_display)
 
         # Creates add and remove buttons
         self.add_button = QPushButton("Add Item")
@@ -233,12 +449,40 @@ class Money_Tracker(QMainWindow):
 
         # Creates a vertical layout and adds the table widget to it
         v_layout = QVBoxLayout()
+        v_layout.addLayout(filter_layout)
         v_layout.addWidget(self.table)
         v_layout.addWidget(self.income_label)
         v_layout.addWidget(self.expenditure_label) 
+        v_layout.addWidget(summary_box)
         v_layout.addLayout(button_h_layout)
         self.central_widget.setLayout(v_layout)
 
+        # Progress bar and cancel button shown in the status bar while a file is loading
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.cancel_load_button = QPushButton("Cancel")
+        self.cancel_load_button.clicked.connect(self.cancel_loading)
+        self.statusBar().addPermanentWidget(self.progress_bar)
+        self.statusBar().addPermanentWidget(self.cancel_load_button)
+        self.set_loading(False)
+
+    # Stops the worker thread of a file that is still loading, waits for a running save and closes the database when the
+    # window closes. The recovery file is deleted as the window was closed on purpose
+    def closeEvent(self, event):
+        if self.loader is not None:
+            self.loader.cancel()
+        self.finish_saving()
+        self.save_dedup()
+        if self.export_task is not None:
+            self.export_task.done.wait()
+        self.autosave_timer.stop()
+        if self.autosave_task is not None:
+            self.autosave_task.done.wait()
+            self.autosave_task = None
+        discard_recovery(self.recovery_file)
+        self.set_store(None)
+        super().closeEvent(event)
+
     # Closes the active UI and creates a new UI when the New button is selected 
     def new_file(self):
         self.close() # Closes active window
@@ -250,7 +494,7 @@ class Money_Tracker(QMainWindow):
     # Creates a file explorer window to allow the user to choose a CSV
     def open_file_explorer(self):
         file_dialog = QFileDialog()
-        file_dialog.setNameFilter("CSV files (*.csv)") # Allows only .csv
+        file_dialog.setNameFilter(ledger_filter) # Allows only .csv, compressed .csv, binary .mtl and SQLite .db ledgers
         file_dialog.setWindowTitle("Select a CSV file to open")
         file_dialog.setFileMode(QFileDialog.ExistingFile) # Ensures the file selected exists
 
@@ -259,41 +503,6 @@ class Money_Tracker(QMainWindow):
             self.selected_csv = file_dialog.selectedFiles()[0]
             self.active_file_path = self.selected_csv # Sets the active file path variable to the opened file path
 
-    # Reads a csv file from the file_path and return a list of items
-    def read_csv_file(self, file_path):
-        item_list = []
-        with open(file_path, mode='r') as file: # Opens in read mode as file
-            csv_reader = csv.reader(file) # Reads the file
-            for row in csv_reader: # Gets the rows in the csv_reader
-                if any(row): # If a row exist (is not empty)
-                    item = Item(*row) # Unpacks the rows to pass information to the Item class
-                    item_list.append(item)
-        return item_list
-    
-    # Reads the csv file and checks if the last line is a newline/empty row. If not it adds one
-    def check_for_newline(self, csv_file):
-        # Open the file in read-write binary mode
-        with open(csv_file, "r+b") as file:
-            file.seek(0, os.SEEK_END)  # Move the pointer to the end of the file
-            if file.tell() == 0:  # Check if the file is empty
-                needs_newline = False
-            else:
-                file.seek(-1, os.SEEK_END)  # Move the pointer to the last byte
-                last_char = file.read(1)
-                needs_newline = last_char != b'\n'  # Check if the last character is not a newline
-            
-            if needs_newline:
-                file.write(b'\n')  # Write a newline character if it's not there
-
-    # Writes all the lines in the table to a csv_file
-    def write_rows_to_csv(self, csv_writer):
-        for row in range(self.table.rowCount()):
-            name = self.table.item(row, 0).text() # Gets the text value for each cell in the row
-            price = self.table.item(row, 1).text()
-            category = self.table.item(row, 2).text()
-            cashflow = self.table.item(row, 3).text()
-            csv_writer.writerow([name, price, category, cashflow]) # Write the items to the csv rows
-            
     # Creates a question window to confirm if you want to save the file
     def save_file_question_window(self, title, text):
         question_box = QMessageBox()
@@ -310,170 +519,732 @@ class Money_Tracker(QMainWindow):
         
     # Opens a selected csv file
     def open_file(self):
-        window_title = self.windowTitle()
-
         # Checks if the current file has unsaved information and runs the save file method before opening new file if user selects to save
-        if window_title[-1] == "*":
+        if self.dirty:
             user_selection = self.save_file_question_window("Unsaved File", "Would you like to save the current file before opening?")
             
             if user_selection == True:
                 self.save_file()
+                self.finish_saving() # The file is written before the table is cleared
             else:
                 pass
+        self.save_dedup()
         
+        self.selected_csv = None # Cleared so a cancelled dialog does not reopen the previous file
         self.open_file_explorer() # Opens the file explorer
-            
-        try: # Get the item_list from read_csv_file
-            items = self.read_csv_file(self.selected_csv)
-        except ValueError: # Error window if the information in the CSV does not align with expected
-            create_error_window("Invalid CSV", "Information in the CSV does not match expected format:\n\nName,Price,Category,Cashflow")
-        except AttributeError: # Do nothing if the user hits cancel
-            pass
-        except TypeError: # When an empty CSV is opened
-            self.table.setRowCount(0) # Remove all rows from the table before opening the file
-            self.income_total = 0 # Reset total values
-            self.expenditure_total = 0
-            self.income_label.setText("Income: 0.0") # Reset label text
-            self.expenditure_label.setText("Expenditure: 0.0")
-            file_name = os.path.basename(self.selected_csv) # Gets the file name.csv
-            self.setWindowTitle(f"Money Tracker - {file_name}") # Sets the window title to the file name
+
+        if not self.selected_csv: # Do nothing if the user hits cancel
+            return
+
+        self.cancel_loading() # Stops any file that is still loading
+        self.clear_filter()
+        self.model.clear() # Remove all rows from the table before opening the file
+        self.reset_totals()
+        self.set_dirty(False) # Sets the window title to the file name
+        self.journal = None
+        self.set_store(None)
+        self.pending_changes = []
+        self.clear_history()
+        self.dedup = None
+        self.time_index = None
+
+        if is_binary_ledger(self.selected_csv):
+            self.open_binary_file(self.selected_csv)
+            return
+
+        # Reads the file on a worker thread, rows are added to the table in batches as they arrive
+        if is_database(self.selected_csv):
+            self.loader = Database_Loader(self.selected_csv)
+        else:
+            self.loader = CSV_Loader(self.selected_csv, self.rules)
+        self.rejected_rows = []
+        self.loader.signals.batch_loaded.connect(self.on_batch_loaded)
+        self.loader.signals.rejected.connect(self.on_rows_rejected)
+        self.loader.signals.progress.connect(self.progress_bar.setValue)
+        self.loader.signals.failed.connect(self.on_load_failed)
+        self.loader.signals.finished.connect(self.on_load_finished)
+        self.set_loading(True)
+        QThreadPool.globalInstance().start(self.loader)
+
+    # Maps a binary .mtl ledger. Rows are read from the file only when the table scrolls to them
+    @timed("Money_Tracker.open_binary_file")
+    def open_binary_file(self, file_path):
+        try:
+            ledger = Mapped_Ledger(file_path)
+        except (ValueError, KeyError, OSError, struct.error) as error:
+            self.reset_file()
+            create_error_window("Invalid Ledger", f"The file could not be read:\n\n{error}")
+            return
+
+        self.model.set_ledger(ledger)
+        self.totals = Totals(ledger.totals) # The totals stored in the file are used so no rows have to be read
+        self.schedule_totals_update()
+        self.update_category_menu()
+        self.model.build_index_in_background() # Reads every name of the file, but off the GUI thread
+
+    # Keeps the SQLite_Store of a .db file once its rows have loaded, with the row ids the Database_Loader read
+    def open_database_file(self, file_path, ids):
+        try:
+            store = SQLite_Store(file_path)
+        except (sqlite3.DatabaseError, ValueError) as error: # e.g. the file was replaced while it loaded
+            self.reset_file()
+            create_error_window("Invalid Ledger", f"The file could not be read:\n\n{error}")
+            return
+        store.ids = ids
+        self.set_store(store)
+        self.update_category_menu()
+        self.model.build_index_in_background()
+
+    # Closes the SQLite_Store of the previous .db file and keeps the new one, or None
+    def set_store(self, store):
+        if self.store is not None and self.store is not store:
+            self.store.close()
+        self.store = store
+
+    # Shows or hides the progress bar and disables the actions that would change the ledger while a file loads
+    def set_loading(self, loading):
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(loading)
+        self.cancel_load_button.setVisible(loading)
+        for widget in (self.save_action, self.save_as_action, self.open_action, self.import_action, self.add_button, self.remove_button,
+                       self.search_box, self.category_filter_menu, self.cashflow_filter_menu):
+            widget.setEnabled(not loading)
+        self.update_undo_actions(loading)
+
+    # Checks the signal came from the current loader, batches from a cancelled loader can still be queued
+    def is_current_loader(self):
+        return self.loader is not None and self.sender() is self.loader.signals
+
+    # Adds a chunk of rows validated by the loader to the table and the totals
+    @timed("Money_Tracker.on_batch_loaded")
+    def on_batch_loaded(self, chunk):
+        if not self.is_current_loader():
+            return
+        self.add_ledger_to_total(chunk)
+        if self.time_index is not None: # A report was shown while the file loaded
+            self.time_index.add_ledger(chunk)
+        self.model.append_ledger(chunk)
+
+    # Collects the rejected rows so they can be listed once the load finishes
+    def on_rows_rejected(self, errors):
+        if not self.is_current_loader():
+            return
+        self.rejected_rows.extend(errors)
+
+    # Error window if the file could not be read at all. The partially loaded rows are dropped
+    def on_load_failed(self, error):
+        if not self.is_current_loader():
+            return
+        self.loader = None
+        self.set_loading(False)
+        self.reset_file()
+        title = "Invalid Ledger" if is_database(self.selected_csv) else "Invalid CSV"
+        create_error_window(title, f"The file could not be read:\n\n{error}")
+
+    def on_load_finished(self, cancelled):
+        if not self.is_current_loader():
+            return
+        loader = self.loader
+        self.loader = None
+        self.set_loading(False)
+        if cancelled: # A partially loaded file is not kept so it cannot be saved over the original
+            self.reset_file()
+            return
+        if isinstance(loader, Database_Loader):
+            self.open_database_file(self.selected_csv, loader.ids)
+            return
+
+        self.journal = Journal(self.selected_csv)
+        self.apply_journal() # Changes saved since the csv was last fully written
+        self.update_category_menu() # User defined categories the file was saved with
+        self.model.build_index_in_background() # Ready for the first search or sort
+
+        if self.rejected_rows: # The good rows are kept and the rejects are listed
+            # Journal row numbers only match the file while every row loads, so the next save rewrites the file instead
+            self.save_whole_file()
+            report = Import_Report(os.path.basename(self.selected_csv), self.rejected_rows, self.model.rowCount(),
+                                   note="Saving rewrites the file with only the rows that loaded, the skipped lines are removed from it.")
+            report.exec_()
+        self.rejected_rows = []
+
+    # Imports several csv/.mtl files at once, e.g. one per month, and adds their rows to the table with a Source column
+    def import_files(self):
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "Select files to import", "", ledger_filter)
+        if not file_paths: # Do nothing if the user hits cancel
+            return
+
+        if self.skip_duplicates_action.isChecked():
+            # The .dedup index of the active file is only valid for its saved rows
+            ledger_path = self.active_file_path if not self.dirty else ""
+            self.import_task = Import_Task(file_paths, self.rules, self.model.ledger, self.dedup, ledger_path)
         else:
-            self.table.setRowCount(0) # Remove all rows from the table before opening the file
-            self.income_total = 0 # Reset total values
-            self.expenditure_total = 0
-            self.initial_row = False # False means the first line wont be deleted, is used when adding to empty table
-            file_name = os.path.basename(self.selected_csv) # Gets the file name.csv
-            self.setWindowTitle(f"Money Tracker - {file_name}") # Sets the window title to the file name
-            for item in items: # Iterates through the items list
-                self.add_to_total(item.price, item.cashflow) # Updates the total information
-                self.add_item_to_table(item) # Adds the items to the table
+            self.import_task = Import_Task(file_paths, self.rules)
+        self.import_task.signals.progress.connect(self.progress_bar.setValue)
+        self.import_task.signals.finished.connect(self.on_import_finished)
+        self.import_task.signals.failed.connect(self.on_import_failed)
+        self.set_loading(True)
+        self.cancel_load_button.setVisible(False) # The worker processes cannot be stopped part way
+        QThreadPool.globalInstance().start(self.import_task)
+
+    # Adds the merged rows of the imported files to the table and lists any rejected rows and skipped duplicates
+    def on_import_finished(self, merged, errors):
+        task = self.import_task
+        self.import_task = None
+        self.set_loading(False)
+        first = len(self.model.ledger)
+        self.model.append_ledger(merged)
+        if task.index is not None:
+            self.dedup = task.index
+            self.dedup.add_keys(task.keys)
+        elif self.dedup is not None: # Imported without the check, the index still counts the rows
+            self.dedup.add_ledger(merged)
+        if self.time_index is not None:
+            self.time_index.add_ledger(merged)
+        merged_totals = Totals()
+        merged_totals.add_ledger(merged)
+        self.totals.add_totals(merged_totals)
+        self.schedule_totals_update()
+        self.update_category_menu()
+        self.model.build_index_in_background() # Indexes the imported rows
+        self.save_whole_file() # Many rows were added so the next save rewrites the whole file
+        if len(merged):
+            self.record(Command(IMPORT, first, (len(merged), merged_totals))) # Undone by cutting the rows off the end
+            self.set_dirty(True)
+
+        rejected = [f"{os.path.basename(file_path)}: {error}" for file_path, file_errors in errors.items() for error in file_errors]
+        duplicates = task.duplicates
+        skipped = [f"{duplicates.source(row)}: {','.join(duplicates.row(row))}" for row in range(len(duplicates))] if duplicates else []
+        if rejected or skipped:
+            report = Import_Report(f"{len(errors)} files", rejected, len(merged), skipped)
+            report.exec_()
+
+    # Replaces the rules used to categorize the rows of files opened or imported from now on
+    def load_rules_file(self):
+        file_name, _ = QFileDialog.getOpenFileName(self, "Select a rules file", "", "Rules files (*.csv *.txt)")
+        if not file_name: # Do nothing if the user hits cancel
+            return
+        try:
+            self.rules = load_rules(file_name)
+        except (OSError, ValueError) as error:
+            create_error_window("Invalid Rules", f"The rules file could not be read:\n\n{error}")
+            return
+        self.update_category_menu()
+        self.statusBar().showMessage(f"{len(self.rules)} rules loaded from {os.path.basename(file_name)}", 5000)
+
+    # Adds the categories added since the filter menu was built, e.g. by a rules file or an opened ledger
+    def update_category_menu(self):
+        self.category_filter_menu.addItems(categories[self.category_filter_menu.count() - 1:])
+
+    # Writes the duplicate index next to the active file when it matches the saved rows, so the next session does not rebuild it
+    def save_dedup(self):
+        if self.dedup is None or not self.dedup.changed or self.dirty or not self.active_file_path:
+            return
+        try:
+            self.dedup.save(self.active_file_path)
+        except OSError: # Only a cache, it is rebuilt by the next import
+            try:
+                os.remove(self.active_file_path + dedup_suffix)
+            except OSError:
+                pass
+
+    # Keeps the duplicate and time indexes in step with a row added or removed by hand, undo or redo
+    def index_row(self, row):
+        if self.dedup is not None:
+            self.dedup.add_row(self.model.ledger, row)
+        if self.time_index is not None:
+            self.time_index.add_row(self.model.ledger, row)
+
+    # Runs before the row is removed
+    def unindex_row(self, row):
+        if self.dedup is not None:
+            self.dedup.remove_row(self.model.ledger, row)
+        if self.time_index is not None:
+            self.time_index.remove_row(self.model.ledger, row)
+
+    def on_import_failed(self, error):
+        self.import_task = None
+        self.set_loading(False)
+        create_error_window("Invalid CSV", f"A file could not be imported:\n\n{error}")
+
+    # Replays the saved changes of the journal onto the loaded ledger. Changes that cannot be replayed are listed with
+    # the rejected rows and the next save rewrites the whole file, so new changes are not added to a journal that does not fit
+    @timed("Money_Tracker.apply_journal")
+    def apply_journal(self):
+        ledger, error = replay_journal(self.model.ledger, self.journal, self.rejected_rows)
+        if error is not None:
+            self.rejected_rows.append(error)
+            self.save_whole_file()
+            return
+        if ledger is self.model.ledger: # No changes
+            return
+        self.model.set_ledger(ledger) # One reset for every replayed change
+        self.time_index = None
+        self.totals.rebuild(ledger)
+        self.schedule_totals_update()
+
+    # Cancels the file that is currently loading
+    def cancel_loading(self):
+        if self.loader is not None:
+            self.loader.cancel()
+            self.loader = None
+            self.set_loading(False)
+            self.reset_file()
+
+    # Clears the table and totals and returns the window to an untitled file
+    def reset_file(self):
+        self.set_store(None)
+        self.clear_history()
+        self.dedup = None
+        self.time_index = None
+        self.clear_filter()
+        self.model.clear()
+        self.reset_totals()
+        self.active_file_path = ""
+        self.set_dirty(False)
 
     # Saves an exisitng csv file or save_as if it's a new file
+    @timed("Money_Tracker.save_file")
     def save_file(self):
-        window_title = self.windowTitle() # Gets window title
-        untitled = "Money Tracker - untitled" # Default window titles with/without changes
-        untitled_changes = "Money Tracker - untitled*"
-
         # Runs save_as if the file has yet to be named and saved
-        if window_title == untitled or window_title == untitled_changes:
+        if not self.active_file_path:
             self.save_as_file()
+            return
         
         # Runs the save file question window and if No nothing happens
         overwrite = self.save_file_question_window("Save File", "Are you sure you want to overwrite the existing data?")
 
         if overwrite == False:
             pass
-        else: # If user selects Yes from question window the file is overwritten
-            self.check_for_newline(self.active_file_path) # Checks if for an empty line/row at the end of the csv file
-
-            with open (self.active_file_path, mode='w', newline='') as csv_file:
-                csv_writer = csv.writer(csv_file)
-
-                try:
-                    self.write_rows_to_csv(csv_writer) # Writes all rows from the table to the active csv_file
-                except AttributeError:
-                    pass
-            
-            # Resets the title by removing the *
-            title = self.windowTitle()[:-1]
-            self.setWindowTitle(title)
+        else: # If user selects Yes from question window the changes are saved
+            ledger = self.model.ledger
+            try:
+                if self.store is not None and self.store.path == self.active_file_path: # Only the rows added or removed since the last save are written
+                    self.store.apply_changes(self.pending_changes)
+                elif self.journal is not None and self.journal.csv_path == self.active_file_path: # Only the changes since the last save are appended to the journal
+                    self.journal.append(self.pending_changes)
+                    if self.journal.needs_compaction(len(ledger)): # Folds the journal back into the csv on a worker thread
+                        self.journal.compact_in_background(ledger.copy())
+                else: # Binary ledgers, and files without a journal or database rows to update, are written whole
+                    self.save_in_background(self.active_file_path)
+                    return
+            except (ValueError, OSError, sqlite3.Error) as error: # e.g. a database row changed by another program
+                create_error_window("Save Failed", f"The changes could not be saved row by row, so the whole file is written instead:\n\n{error}")
+                self.save_whole_file()
+                self.save_in_background(self.active_file_path)
+                return
+            self.pending_changes = []
+            self.mark_saved()
 
     # Saves a user named csv file
+    @timed("Money_Tracker.save_as_file")
     def save_as_file(self):
         # Parent, window title, directory ("" is default), file filter, -  _ returns the filter
-        file_name, _ = QFileDialog.getSaveFileName(self, 
+        file_name, selected_filter = QFileDialog.getSaveFileName(self, 
                                                    "Save CSV File", 
                                                    "", 
-                                                   "CSV Files (*.csv)")
+                                                   "CSV Files (*.csv);;Compressed CSV (*.csv.gz);;Binary Ledger (*.mtl);;SQLite Database (*.db)")
         
-        # Checks if a .csv appears at the end of the file_name and adds one if it is not present
-        pattern = r'\.csv$'
-        if not re.search(pattern, file_name):
-            file_name += ".csv"
-        
-        if file_name:
-            with open(file_name, 'w', newline='') as csv_file: # Open file for writing, ensure consistent line endings, automatically close file
-                csv_writer = csv.writer(csv_file) # Create a CSV writer object linked to the opened file for writing
+        if not file_name: # Do nothing if the user hits cancel
+            return
+
+        if not is_binary_ledger(file_name) and not is_database(file_name):
+            # Checks if a .csv, .csv.gz or .csv.zst appears at the end of the file_name and adds the selected one if it is not present
+            pattern = r'\.csv(\.gz|\.zst)?$'
+            if not re.search(pattern, file_name, re.IGNORECASE):
+                file_name += filter_suffix(selected_filter, ".csv")
 
-                try:
-                    self.write_rows_to_csv(csv_writer) # Writes all rows from the table to the file_name csv file
-                except AttributeError:
-                    csv_writer.writerow([])
-        
         self.active_file_path = file_name # Sets the active file path variable to the saved file path
-        file = os.path.basename(file_name) # Gets just the file name not the whole path
-        self.setWindowTitle(f"Money Tracker - {file}") # Sets the window title to the file name
+        self.save_in_background(file_name) # Writes all rows to a temp file then renames it over file_name
+
+    # Writes the whole ledger to file_path on a worker thread. The snapshot is taken now, rows changed while it is
+    # written stay in pending_changes and are saved to the new file's journal or database rows by the next save
+    def save_in_background(self, file_path):
+        ledger = self.model.ledger
+        if self.journal is not None and self.journal.is_compacting(): # A compaction finishing later would replace the new file
+            self.journal.compactor.join()
+        self.journal = None
+        self.set_store(None)
+        self.pending_changes = []
+        self.rewrite_needed = False
+
+        snapshot = ledger if ledger.read_only else ledger.copy() # Mapped ledgers never change, others are copied in bulk
+        self.save_task = Save_Task(file_path, snapshot)
+        self.save_task.signals.finished.connect(self.on_save_finished)
+        self.save_task.signals.failed.connect(self.on_save_failed)
+        self.set_saving(True)
+        self.set_dirty(False) # The recovery file is kept until the file is written
+        QThreadPool.globalInstance().start(self.save_task)
+
+    # Checks the signal came from the running save, a save waited on by finish_saving can still have signals queued
+    def is_current_save(self):
+        return self.save_task is not None and self.sender() is self.save_task.signals
+
+    # Starts saving the file's changes row by row now that it holds the snapshot
+    def on_save_finished(self):
+        if not self.is_current_save():
+            return
+        file_path = self.save_task.path
+        self.save_task = None
+        self.set_saving(False)
+        if file_path == self.active_file_path and not self.rewrite_needed:
+            if is_database(file_path):
+                self.set_store(SQLite_Store(file_path))
+                self.store.load_ids()
+            elif not is_binary_ledger(file_path):
+                self.journal = Journal(file_path) # core.write_ledger deleted the old journal
+        if not self.dirty: # Nothing changed while the file was written
+            discard_recovery(self.recovery_file)
+            self.save_dedup()
+        self.statusBar().showMessage(f"Saved {os.path.basename(file_path)}", 3000)
+
+    # The rows are still in memory, so the file is marked as unsaved and the next save rewrites it whole
+    def on_save_failed(self, error):
+        if not self.is_current_save():
+            return
+        self.save_task = None
+        self.set_saving(False)
+        self.set_dirty(True)
+        create_error_window("Save Failed", f"The file could not be saved:\n\n{error}")
+
+    # Waits for a running save to finish, e.g. before the window closes or another file is opened
+    def finish_saving(self):
+        if self.save_task is None:
+            return
+        self.save_task.done.wait()
+        error = self.save_task.error
+        self.save_task = None # Its queued signals are ignored
+        self.set_saving(False)
+        if error is not None:
+            self.set_dirty(True)
+            create_error_window("Save Failed", f"The file could not be saved:\n\n{error}")
+
+    # Disables the actions that would start another save or replace the ledger while a save is written
+    def set_saving(self, saving):
+        for action in (self.save_action, self.save_as_action, self.open_action, self.import_action):
+            action.setEnabled(not saving)
+        if saving:
+            self.statusBar().showMessage(f"Saving {os.path.basename(self.save_task.path)}..")
+        else:
+            self.statusBar().clearMessage()
+
+    # Writes unsaved changes to the recovery file on a worker thread
+    def autosave(self):
+        if not self.dirty or self.autosave_task is not None or self.loader is not None:
+            return
+        ledger = self.model.ledger
+        snapshot = ledger if ledger.read_only else ledger.copy()
+        file_path = self.active_file_path
+        self.autosave_task = Save_Task(self.recovery_file, snapshot, lambda path, rows: write_recovery(path, rows, file_path))
+        self.autosave_task.signals.finished.connect(self.on_autosave_finished)
+        self.autosave_task.signals.failed.connect(self.on_autosave_failed)
+        QThreadPool.globalInstance().start(self.autosave_task)
+
+    def on_autosave_finished(self):
+        self.autosave_task = None
+        if not self.dirty: # Saved while the recovery file was written
+            discard_recovery(self.recovery_file)
+
+    # Autosave runs in the background, a failure is shown in the status bar instead of interrupting the user
+    def on_autosave_failed(self, error):
+        self.autosave_task = None
+        self.statusBar().showMessage(f"Autosave failed: {error}", 5000)
+
+    # Offers to restore the changes autosaved by a session that did not close cleanly. Each recovered ledger opens
+    # in a window of its own, the first in this window when it is still empty
+    def offer_recovery(self):
+        for path, note in find_recoveries():
+            file_name = os.path.basename(note.get("file") or "") or "untitled"
+            saved = time.strftime("%Y-%m-%d %H:%M", time.localtime(note.get("time", 0)))
+            recover = self.save_file_question_window("Recover Unsaved Changes",
+                                                     f"Unsaved changes to {file_name} were autosaved at {saved} before Money Tracker closed. "
+                                                     "Would you like to recover them?")
+            if recover:
+                try:
+                    ledger = load_recovery(path)
+                except (ValueError, KeyError, OSError, struct.error) as error:
+                    create_error_window("Invalid Recovery File", f"The changes could not be recovered:\n\n{error}")
+                    ledger = None
+                if ledger is not None:
+                    window = self
+                    if self.dirty or self.active_file_path or len(self.model.ledger):
+                        window = Money_Tracker()
+                        window.show()
+                        self.active_window.append(window)
+                    window.restore_ledger(ledger, note.get("file") or "")
+            discard_recovery(path)
+
+    # Shows a recovered ledger as unsaved changes to file_path. The next save rewrites the whole file
+    def restore_ledger(self, ledger, file_path):
+        self.model.set_ledger(ledger)
+        self.model.build_index_in_background()
+        self.dedup = None
+        self.time_index = None
+        self.totals.rebuild(ledger)
+        self.schedule_totals_update()
+        self.active_file_path = file_path
+        self.save_whole_file()
+        self.set_dirty(True)
 
     # Creates a popup window object which allows the user to add items
     def add_item_popup(self):
         popup = Add_Popup()
         popup.exec_()
-        try:
-            self.add_to_total(popup.item.price, popup.item.cashflow) # Runs the add_to_total method with price and cashflow item paramaters
-            self.add_item_to_table(popup.item) # Runs the add_item_to_table method to add the new item to the table
-            self.check_if_saved() # Checks if there is a * at the end of the window title and adds one if it is not present
-            self.rows_added += 1 # Adds +1 to the rows added variable
-        except AttributeError: # Does nothing when the user hits cancel
-            pass
+        if popup.item is None: # Does nothing when the user hits cancel
+            return
+        self.add_item(popup.item)
+
+    # Adds an item as a new row the way the user adds one: table, totals, search index, undo history and next save
+    def add_item(self, item):
+        self.add_item_to_table(item) # Runs the add_item_to_table method to add the new item to the table
+        row = len(self.model.ledger) - 1
+        self.add_to_total(row) # Adds the new row to the totals
+        self.index_row(row)
+        self.set_dirty(True) # Adds a * to the end of the window title
+        change = add_change(self.model.ledger, row)
+        self.pending_changes.append(change) # Recorded for the next save
+        self.record(Command(ADD, row, pack_row(self.model.ledger, row), change))
 
     # Adds an item to the table based on information from the item object passed
+    @timed("Money_Tracker.add_item_to_table")
     def add_item_to_table(self, item: object):
-        row_count = self.table.rowCount()  # Gets the number of rows
-        self.table.insertRow(row_count)  # Adds a row to the table
+        self.model.append_item(item) # The model stores the fields in the ledger and notifies the view
 
-        # Gets the data that will be populate a cell from the Item class and stores it in a list
-        data = [item.name, str(item.price), item.category, item.cashflow]
-
-        # Iterate through the data list and create QTableWidgetItem for each piece of data
-        for column, cell_data in enumerate(data):
-            item = QTableWidgetItem(cell_data)
-            self.table.setItem(row_count, column, item) # Add the item to the row/column
-
-        # Checks the initial_row boolean and if it is True it will remove the initial empty row and set the value to False
-        if self.initial_row == True:
-            self.table.removeRow(0)
-            self.initial_row = False
-
-    # Removes the currently selected row from the table widget
+    # Removes the currently selected row from the table
+    @timed("Money_Tracker.remove_item")
     def remove_item(self):
         try:
-            cell = self.table.currentItem() # Gets the selected item from the table
-            cell_text = cell.text() # If there is no cell text error is raised. This avoids NoneType errors for empty cells
-            row = self.table.currentRow() # Gets the current row value
-            self.subtract_from_total(row) # Runs the subtract from total method to update the total displays
-            self.table.removeRow(row) # Removes the selected row
-            self.table.setCurrentCell(row - 1, 0) # Sets the active cell to the row above the deleted row
-            self.check_if_saved() # Checks if there is a * at the end of the window title and adds one if it is not present
-            self.rows_added -= 1 if self.rows_added > 0 else 0 # -1 from the rows_added if button is pressed and rows added is over 0
+            index = self.table.currentIndex() # Gets the selected cell from the table
+            if not index.isValid(): # Nothing is selected or the table is empty
+                raise IndexError("No row selected")
+            row = index.row() # Gets the current row value of the view
+            source_row = self.model.source_row(row) # The ledger row may differ from the view row when filtered or sorted
+            packed = pack_row(self.model.ledger, source_row) # Kept so the remove can be undone
+            change = remove_change(self.model.ledger, source_row) # Holds the row's fields, so it is built before the remove
+            self.subtract_from_total(source_row) # Runs the subtract from total method to update the total displays
+            self.unindex_row(source_row)
+            self.model.remove_row(row) # Removes the selected row
+            self.pending_changes.append(change) # Recorded for the next save
+            self.record(Command(REMOVE, source_row, packed, change))
+            self.table.setCurrentIndex(self.model.index(max(row - 1, 0), 0)) # Sets the active cell to the row above the deleted row
+            self.set_dirty(True) # Adds a * to the end of the window title
         except: # Raise error window when removing empty cells or when no cells are available to remove
             create_error_window("Empty Cells", "No items to remove")
     
-    # Adds the price value to the income/expenditure total and updates the displayed value
-    def add_to_total(self, price, selected_cashflow):
-        if selected_cashflow.lower() == "income": # Adds to income value
-            self.income_total += float(price)
-            self.income_label.setText(f"Income: {str(self.income_total)}")
-        else: # Adds to expenditure value
-            self.expenditure_total += float(price)
-            self.expenditure_label.setText(f"Expenditure: {str(self.expenditure_total)}")
-
-    # Subtracts the price value from the income/expenditure total and updates the displayed value 
+    # Adds a command to the undo history
+    def record(self, command):
+        self.history.record(command)
+        self.update_undo_actions()
+
+    def clear_history(self):
+        self.history.clear()
+        self.update_undo_actions()
+
+    # Enables Undo and Redo only when there is something to undo or redo and no file is loading
+    def update_undo_actions(self, loading=False):
+        self.undo_action.setEnabled(not loading and self.history.can_undo())
+        self.redo_action.setEnabled(not loading and self.history.can_redo())
+
+    # Makes the next save rewrite the whole file, for changes the journal and database cannot replay row by row
+    def save_whole_file(self):
+        self.journal = None
+        self.set_store(None)
+        self.rewrite_needed = True # A save that is still being written does not hold this change
+
+    # Records the save entry of an undo or redo. Undoing the last unsaved change just drops its entry
+    def record_change(self, command, change):
+        if self.pending_changes and self.pending_changes[-1] is command.change:
+            self.pending_changes.pop()
+            command.change = None
+        elif change is None: # Cannot be written as an add or remove, e.g. a row put back in the middle
+            self.save_whole_file()
+            command.change = None
+        else:
+            self.pending_changes.append(change)
+            command.change = change
+
+    # Reverses the most recent change. Totals are updated by the rows that change rather than recalculated
+    @timed("Money_Tracker.undo")
+    def undo(self):
+        if not self.history.can_undo():
+            return
+        command = self.history.undo()
+        if command.kind == ADD:
+            change = remove_change(self.model.ledger, command.row)
+            self.subtract_from_total(command.row)
+            self.unindex_row(command.row)
+            self.model.remove_ledger_row(command.row)
+            self.record_change(command, change)
+        elif command.kind == REMOVE:
+            self.model.insert_ledger_row(command.row, *unpack_row(command.data))
+            self.add_to_total(command.row)
+            self.index_row(command.row)
+            last_row = command.row == len(self.model.ledger) - 1 # Only a row put back at the end can be saved as an add
+            self.record_change(command, add_change(self.model.ledger, command.row) if last_row else None)
+        else: # The imported rows are still the last rows, every later command has been undone
+            count, totals = command.data
+            command.data = (self.model.split_rows(command.row), totals) # Kept for redo
+            if self.dedup is not None:
+                self.dedup.remove_ledger(command.data[0])
+            if self.time_index is not None:
+                self.time_index.remove_ledger(command.data[0])
+            self.totals.subtract_totals(totals)
+            self.schedule_totals_update()
+            self.save_whole_file()
+        self.set_dirty(True)
+        self.update_undo_actions()
+
+    # Makes the most recently undone change again
+    @timed("Money_Tracker.redo")
+    def redo(self):
+        if not self.history.can_redo():
+            return
+        command = self.history.redo()
+        if command.kind == ADD:
+            self.model.insert_ledger_row(command.row, *unpack_row(command.data))
+            self.add_to_total(command.row)
+            self.index_row(command.row)
+            self.record_change(command, add_change(self.model.ledger, command.row))
+        elif command.kind == REMOVE:
+            change = remove_change(self.model.ledger, command.row)
+            self.subtract_from_total(command.row)
+            self.unindex_row(command.row)
+            self.model.remove_ledger_row(command.row)
+            self.record_change(command, change)
+        else:
+            rows, totals = command.data
+            self.model.append_ledger(rows)
+            if self.dedup is not None:
+                self.dedup.add_ledger(rows)
+            if self.time_index is not None:
+                self.time_index.add_ledger(rows)
+            command.data = (len(rows), totals) # Only the row count is kept while the rows are in the ledger
+            self.totals.add_totals(totals)
+            self.schedule_totals_update()
+            self.save_whole_file()
+        self.set_dirty(True)
+        self.update_undo_actions()
+
+    # Shows the expenditure per category for each month or year of the dated rows. The time index is built once and
+    # then kept up to date with every change, so later reports only run range queries
+    def show_report(self, period):
+        if self.time_index is None:
+            self.time_index = Time_Index(self.model.ledger)
+        report = Report_Window(self.time_index, period)
+        report.exec_()
+
+    # Writes the rows shown in the table, filtered and sorted as they are shown, or their totals to a csv or JSON Lines
+    # file on a worker thread. The rows are streamed from a snapshot of the ledger, not read back from the table
+    def export_rows(self, summary=False):
+        file_name, selected_filter = QFileDialog.getSaveFileName(self, "Export Summary" if summary else "Export Rows", "", export_filters)
+        if not file_name: # Do nothing if the user hits cancel
+            return
+        try:
+            export_format(file_name)
+        except ValueError: # No export extension, the one of the selected filter is added
+            file_name += filter_suffix(selected_filter, ".csv")
+
+        ledger = self.model.ledger
+        view = self.model.view
+        rows = len(view) if view is not None else len(ledger)
+        snapshot = (ledger if ledger.read_only else ledger.copy(), array('I', view) if view is not None else None)
+        self.export_task = Save_Task(file_name, snapshot, write=lambda path, snapshot: export_file(path, *snapshot, summary=summary))
+        message = f"Exported the totals of {rows} rows to" if summary else f"Exported {rows} rows to"
+        self.export_task.signals.finished.connect(lambda: self.on_export_finished(f"{message} {os.path.basename(file_name)}"))
+        self.export_task.signals.failed.connect(self.on_export_failed)
+        self.set_exporting(True)
+        QThreadPool.globalInstance().start(self.export_task)
+
+    def on_export_finished(self, message):
+        self.export_task = None
+        self.set_exporting(False)
+        self.statusBar().showMessage(message, 5000)
+
+    def on_export_failed(self, error):
+        self.export_task = None
+        self.set_exporting(False)
+        create_error_window("Export Failed", f"The file could not be written:\n\n{error}")
+
+    # One export runs at a time
+    def set_exporting(self, exporting):
+        self.export_action.setEnabled(not exporting)
+        self.export_summary_action.setEnabled(not exporting)
+
+    # Shows the timings collected while instrumentation is on
+    def show_stats(self):
+        stats_window = Stats_Window()
+        stats_window.exec_()
+
+    # Narrows the table to the search text and the selected category and cashflow
+    @timed("Money_Tracker.apply_filter")
+    def apply_filter(self):
+        self.search_timer.stop() # A menu change also applies text that is still waiting on the timer
+        category = self.category_filter_menu.currentIndex() - 1 # The first entry of each menu shows every row
+        cashflow = self.cashflow_filter_menu.currentIndex() - 1
+        self.model.set_filter(self.search_box.text(), category if category >= 0 else None, cashflow if cashflow >= 0 else None)
+
+    # Clears the search box, filters and sort so every row shows in ledger order
+    def clear_filter(self):
+        self.search_timer.stop()
+        for widget in (self.search_box, self.category_filter_menu, self.cashflow_filter_menu):
+            widget.blockSignals(True)
+        self.search_box.clear()
+        self.category_filter_menu.setCurrentIndex(0)
+        self.cashflow_filter_menu.setCurrentIndex(0)
+        for widget in (self.search_box, self.category_filter_menu, self.cashflow_filter_menu):
+            widget.blockSignals(False)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.model.clear_view()
+
+    # Adds a row of the ledger to the totals
+    @timed("Money_Tracker.add_to_total")
+    def add_to_total(self, row):
+        self.totals.add_row(self.model.ledger, row)
+        self.schedule_totals_update()
+
+    # Adds the prices of a chunk of rows to the totals in one pass
+    @timed("Money_Tracker.add_ledger_to_total")
+    def add_ledger_to_total(self, chunk):
+        self.totals.add_ledger(chunk)
+        self.schedule_totals_update()
+
+    # Resets the totals to 0
+    def reset_totals(self):
+        self.totals.clear()
+        self.schedule_totals_update()
+
+    # Subtracts a row of the ledger from the totals, runs before the row is removed
+    @timed("Money_Tracker.subtract_from_total")
     def subtract_from_total(self, row):
-        price_item = self.table.item(row, 1) # Gets the price QTableWidgetItem
-        price = price_item.text() # Gets the price text
-        cashflow_item = self.table.item(row, 3) # Gets the cashflow QTableWidgetItem
-        selected_cashflow = cashflow_item.text() # Gets the cashflow text
-
-        if selected_cashflow == "Income": # Subtracts from income value
-            self.income_total -= float(price)
-            self.income_label.setText(f"Income: {str(self.income_total)}")
-        else: # Subtracts from expenditure value
-            self.expenditure_total -= float(price)
-            self.expenditure_label.setText(f"Expenditure: {str(self.expenditure_total)}")
-
-    # If there is not a * at the end of the window title, adds one to indicate file has unsaved changes
-    def check_if_saved(self):
-        title = self.windowTitle()
-        pattern = r'\*$'
-        if not re.search(pattern, title):
-            self.setWindowTitle(f"{title}*")
\ No newline at end of file
+        self.totals.subtract_row(self.model.ledger, row)
+        self.schedule_totals_update()
+
+    # Coalesces label updates, any number of changes before the timer fires cause a single repaint
+    def schedule_totals_update(self):
+        if not self.totals_timer.isActive():
+            self.totals_timer.start()
+
+    # Updates the income/expenditure labels and the summary panel from the totals
+    @timed("Money_Tracker.update_totals_display")
+    def update_totals_display(self):
+        self.income_label.setText(f"Income: {format_cents(self.totals.income())}")
+        self.expenditure_label.setText(f"Expenditure: {format_cents(self.totals.expenditure())}")
+        self.net_label.setText(f"Net balance: {format_cents(self.totals.net())}")
+
+        breakdown = self.totals.by_category()
+        rows = "".join(f"<tr><td>{categories[category]}</td><td align='right'>{format_cents(income)}</td>"
+                       f"<td align='right'>{format_cents(expenditure)}</td></tr>"
+                       for category, (income, expenditure) in sorted(breakdown.items()))
+        self.breakdown_label.setText("<table width='100%'><tr><th align='left'>Category</th><th align='right'>Income</th>"
+                                     f"<th align='right'>Expenditure</th></tr>{rows}</table>")
+
+    # Records whether the ledger has unsaved changes and shows a * at the end of the window title when it does
+    def set_dirty(self, dirty):
+        self.dirty = dirty
+        file_name = os.path.basename(self.active_file_path) or "untitled"
+        self.setWindowTitle(f"Money Tracker - {file_name}{'*' if dirty else ''}")
+
+    # Clears the unsaved state once every change is in the file. The recovery file is no longer needed
+    def mark_saved(self):
+        self.set_dirty(False)
+        if self.autosave_task is None: # Otherwise deleted when the running autosave finishes
+            discard_recovery(self.recovery_file)
\ No newline at end of file
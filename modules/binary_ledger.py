@@ -0,0 +1,206 @@
+import json
+import mmap
+import os
+import struct
+
+from array import array
+from itertools import accumulate
+
+from modules.ledger import Ledger, categories, cashflows, add_category, category_table
+from modules.totals import Totals
+from modules.export import create_temp
+
+# Binary columnar ledger file (.mtl)
+#
+#   header     magic, row count, heap size, metadata size      32 bytes
+#   metadata   JSON with the category/cashflow names and totals, padded to 8 bytes
+#   prices     int64 cents                                     rows * 8 bytes
+#   offsets    uint64 start of each name in the heap           (rows + 1) * 8 bytes
+#   dates      int32 day number, 0 for no date                 rows * 4 bytes, not in MTLEDGR1 files
+#   category   uint8 code                                      rows bytes
+#   cashflow   uint8 code                                      rows bytes
+#   heap       utf-8 names back to back                        heap size bytes
+#
+# The columns are read through memoryviews over an mmap so opening a file does not copy or parse the rows
+magic = b"MTLEDGR2"
+undated_magic = b"MTLEDGR1" # Files written before the date column, still opened with every date empty
+header_format = "<8sQQQ"
+header_size = struct.calcsize(header_format)
+binary_suffix = ".mtl"
+
+# Rounds a size up to the next multiple of 8 so the 64 bit columns stay aligned
+def align(size):
+    return (size + 7) & ~7
+
+# Checks if a path is a binary ledger based on its extension
+def is_binary_ledger(path):
+    return path.lower().endswith(binary_suffix)
+
+# Name column of a mapped ledger, each name is decoded from the heap only when it is asked for
+class Name_Column:
+    __slots__ = ("offsets", "heap")
+
+    def __init__(self, offsets, heap):
+        self.offsets = offsets
+        self.heap = heap
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        return str(self.heap[self.offsets[row]:self.offsets[row + 1]], "utf-8")
+
+    def __iter__(self):
+        heap = self.heap
+        start = 0
+        for end in self.offsets[1:]:
+            yield str(heap[start:end], "utf-8")
+            start = end
+
+# Read only ledger whose columns are memoryviews over a memory mapped .mtl file.
+# Only the pages of the rows that are read are loaded from disk
+class Mapped_Ledger(Ledger):
+    __slots__ = ("file", "map", "totals")
+    read_only = True
+
+    def __init__(self, path):
+        self.file = open(path, mode='rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # mmap cannot map an empty file
+            self.file.close()
+            raise ValueError(f"{os.path.basename(path)} is not a binary ledger")
+        try:
+            file_magic, rows, heap_size, metadata_size, metadata = read_layout(self.map, os.path.basename(path))
+        except ValueError:
+            self.map.close()
+            self.file.close()
+            raise
+        view = memoryview(self.map)
+
+        offset = header_size + align(metadata_size)
+        self.prices = view[offset:offset + rows * 8].cast('q')
+        offset += rows * 8
+        offsets = view[offset:offset + (rows + 1) * 8].cast('Q')
+        offset += (rows + 1) * 8
+        if file_magic == magic:
+            self.dates = view[offset:offset + rows * 4].cast('i')
+            offset += rows * 4
+        else:
+            self.dates = memoryview(bytes(rows * 4)).cast('i')
+        self.categories = view[offset:offset + rows]
+        offset += rows
+        self.cashflows = view[offset:offset + rows]
+        offset += rows
+        self.names = Name_Column(offsets, view[offset:offset + heap_size])
+        self.sources = memoryview(bytes(rows * 2)).cast('H') # Sources are not stored, the zeroed pages are only allocated when read
+        self.source_names = [""]
+
+        # Codes written with a different category order are translated once, the rest of the file stays mapped.
+        # A file written before more categories were added uses the same codes for the ones it has
+        written_categories = metadata["categories"]
+        if written_categories != categories[:len(written_categories)]:
+            self.categories = memoryview(bytes(self.categories).translate(category_table(written_categories)))
+        if metadata["cashflows"] != list(cashflows):
+            self.cashflows = memoryview(bytes(self.cashflows).translate(code_table(metadata["cashflows"], cashflows)))
+
+        self.totals = {} # Cents per (category code, cashflow code) stored when the file was written
+        for category, cashflow, cents in metadata["totals"]:
+            key = (add_category(category), cashflows.index(cashflow))
+            self.totals[key] = cents
+
+    # A writable in-memory copy, used before the first add or remove
+    def copy(self) -> Ledger:
+        ledger = Ledger()
+        ledger.names = list(self.names)
+        ledger.prices.frombytes(self.prices.cast('B'))
+        ledger.categories.frombytes(self.categories)
+        ledger.cashflows.frombytes(self.cashflows)
+        ledger.dates.frombytes(self.dates.cast('B'))
+        ledger.sources.frombytes(self.sources.cast('B'))
+        return ledger
+
+# Checks the header, metadata and size of a mapped .mtl file and returns (magic, rows, heap size, metadata size, metadata).
+# A file that is cut short, or not a binary ledger, raises ValueError before any of its columns are read
+def read_layout(file_map, file_name):
+    if len(file_map) < header_size:
+        raise ValueError(f"{file_name} is not a binary ledger")
+    file_magic, rows, heap_size, metadata_size = struct.unpack_from(header_format, file_map)
+    if file_magic not in (magic, undated_magic):
+        raise ValueError(f"{file_name} is not a binary ledger")
+
+    date_size = 4 if file_magic == magic else 0
+    expected_size = header_size + align(metadata_size) + rows * (8 + 8 + date_size + 2) + 8 + heap_size
+    if len(file_map) != expected_size:
+        raise ValueError(f"{file_name} is damaged, its header describes {expected_size} bytes but the file has {len(file_map)}")
+
+    try:
+        metadata = json.loads(file_map[header_size:header_size + metadata_size])
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        metadata = None
+    if not (isinstance(metadata, dict)
+            and is_name_list(metadata.get("categories")) and is_name_list(metadata.get("cashflows"))
+            and isinstance(metadata.get("totals"), list)
+            and all(isinstance(total, list) and len(total) == 3 and isinstance(total[0], str) and isinstance(total[1], str)
+                    and type(total[2]) is int for total in metadata["totals"])):
+        raise ValueError(f"{file_name} is damaged, its metadata could not be read")
+    if not set(metadata["cashflows"]) <= set(cashflows) or not all(cashflow in cashflows for _, cashflow, _ in metadata["totals"]):
+        raise ValueError(f"{file_name} has unknown cashflows {metadata['cashflows']}")
+
+    # The name offsets must start at 0 and end at the heap size, the names of every row then lie inside the heap
+    offsets_start = header_size + align(metadata_size) + rows * 8
+    first, = struct.unpack_from("<Q", file_map, offsets_start)
+    last, = struct.unpack_from("<Q", file_map, offsets_start + rows * 8)
+    if first != 0 or last != heap_size:
+        raise ValueError(f"{file_name} is damaged, its names do not match the name heap")
+    return file_magic, rows, heap_size, metadata_size, metadata
+
+def is_name_list(names) -> bool:
+    return isinstance(names, list) and all(isinstance(name, str) and name.strip() for name in names)
+
+# Builds a bytes.translate table mapping the codes of the names in source to the codes of the same names in target
+def code_table(source, target):
+    table = bytearray(range(256))
+    for code, name in enumerate(source):
+        table[code] = target.index(name) # Unknown names raise ValueError
+    return bytes(table)
+
+# Writes a ledger to a .mtl file through a temp file and rename
+def write_binary(path, ledger):
+    encoded = [name.encode("utf-8") for name in ledger.names]
+    offsets = array('Q', [0])
+    offsets.extend(accumulate(map(len, encoded)))
+    heap = b"".join(encoded)
+
+    if isinstance(ledger, Mapped_Ledger):
+        totals = ledger.totals
+    else:
+        totals = Totals()
+        totals.add_ledger(ledger)
+        totals = totals.cents
+    metadata = json.dumps({
+        "categories": list(categories),
+        "cashflows": list(cashflows),
+        "totals": [[categories[category], cashflows[cashflow], cents] for (category, cashflow), cents in totals.items()],
+    }).encode("utf-8")
+
+    file_descriptor, temp_path = create_temp(path) # Keeps the mode of the file it replaces
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            file.write(struct.pack(header_format, magic, len(ledger), len(heap), len(metadata)))
+            file.write(metadata.ljust(align(len(metadata)), b" "))
+            file.write(memoryview(ledger.prices).cast('B'))
+            file.write(offsets.tobytes())
+            file.write(memoryview(ledger.dates).cast('B'))
+            file.write(bytes(ledger.categories))
+            file.write(bytes(ledger.cashflows))
+            file.write(heap)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,220 @@
+import argparse
+import json
+import sqlite3
+import sys
+
+from datetime import date
+
+from modules import core
+from modules.ledger import categories, cashflows, cashflow_codes, category_lookup, add_category, format_cents
+from modules.rules import load_rules, default_rules
+from modules.user_categories import load_user_categories
+
+# Command line tools for working with ledgers without starting the GUI. Nothing here imports Qt
+commands = ("validate", "summarize", "convert", "merge", "report", "export")
+
+# Prints every rejected row of a file and returns how many there were
+def print_errors(file_path, errors, stream=sys.stderr):
+    for error in errors:
+        print(f"{file_path}: {error}", file=stream)
+    return len(errors)
+
+# Returns the rules given with --rules, or the rules file named by MONEY_TRACKER_RULES when there is one
+def get_rules(args):
+    return load_rules(args.rules) if args.rules else default_rules()
+
+# Checks every row of each file and reports the bad ones. Exits with 1 if any row was rejected
+def validate(args):
+    rejected = 0
+    rules = get_rules(args)
+    for file_path in args.files:
+        ledger, errors = core.read_ledger(file_path, rules)
+        rejected += print_errors(file_path, errors, sys.stdout)
+        print(f"{file_path}: {len(ledger)} valid rows, {len(errors)} problems")
+    return 1 if rejected else 0
+
+# Prints the income, expenditure, net balance and category totals of a ledger
+def summarize(args):
+    rows, totals, errors = core.summarize_file(args.file, get_rules(args))
+    print_errors(args.file, errors)
+    breakdown = totals.by_category()
+
+    if args.json:
+        print(json.dumps({
+            "rows": rows,
+            "rejected": len(errors),
+            "income": format_cents(totals.income()),
+            "expenditure": format_cents(totals.expenditure()),
+            "net": format_cents(totals.net()),
+            "categories": {categories[category]: {"income": format_cents(income), "expenditure": format_cents(expenditure)}
+                           for category, (income, expenditure) in sorted(breakdown.items())},
+        }, indent=2))
+        return 0
+
+    print(f"Rows:        {rows}")
+    print(f"Income:      {format_cents(totals.income())}")
+    print(f"Expenditure: {format_cents(totals.expenditure())}")
+    print(f"Net balance: {format_cents(totals.net())}")
+    for category, (income, expenditure) in sorted(breakdown.items()):
+        print(f"  {categories[category]:<14} {format_cents(income):>14} {format_cents(expenditure):>14}")
+    return 0
+
+# Converts a ledger between csv, binary .mtl and SQLite .db, the format is picked from the file extensions
+def convert(args):
+    rows, errors = core.convert_file(args.source, args.target, get_rules(args))
+    print_errors(args.source, errors)
+    print(f"{args.target}: {rows} rows written, {len(errors)} rows skipped")
+    return 0
+
+# Concatenates the rows of several ledgers into one file, the files are parsed in parallel.
+# Rows of overlapping files that are already in an earlier file are skipped unless --keep-duplicates is given
+def merge(args):
+    from modules.multi_import import import_files
+    from modules.dedup import Dedup_Index
+
+    ledger, errors = import_files(args.sources, args.workers, rules=get_rules(args))
+    skipped = sum(print_errors(file_path, file_errors) for file_path, file_errors in errors.items())
+    index = Dedup_Index()
+    duplicates = 0
+    if not args.keep_duplicates:
+        ledger, keys, skipped_rows = index.filter(ledger)
+        index.add_keys(keys)
+        duplicates = len(skipped_rows)
+        for row in range(duplicates):
+            print(f"{skipped_rows.source(row)}: duplicate skipped: {','.join(skipped_rows.row(row))}", file=sys.stderr)
+    core.write_ledger(args.target, ledger)
+    if not args.keep_duplicates:
+        index.save(args.target) # Later imports into the merged file check against it without rebuilding it
+    print(f"{args.target}: {len(ledger)} rows written from {len(args.sources)} files, {skipped} rows skipped, {duplicates} duplicates skipped")
+    return 0
+
+# Prints the totals of each category per month or year for the dated rows of a ledger
+def report(args):
+    from modules.time_index import period_label
+
+    cashflow = cashflow_codes[args.cashflow.capitalize()]
+    rollup, errors = core.report_file(args.file, cashflow, args.period, args.start, args.end, get_rules(args))
+    print_errors(args.file, errors)
+
+    if args.json:
+        print(json.dumps({
+            "cashflow": cashflows[cashflow],
+            "period": args.period,
+            "periods": [{"period": period_label(start, args.period),
+                         "total": format_cents(sum(cents.values())),
+                         "categories": {categories[category]: format_cents(total) for category, total in sorted(cents.items())}}
+                        for start, cents in rollup],
+        }, indent=2))
+        return 0
+
+    if not rollup:
+        print(f"{args.file}: no dated rows")
+        return 0
+    used = sorted({category for _, cents in rollup for category in cents})
+    print(f"{'Period':<8}" + "".join(f"{categories[category]:>15}" for category in used) + f"{'Total':>15}")
+    for start, cents in rollup:
+        print(f"{period_label(start, args.period):<8}" + "".join(f"{format_cents(cents.get(category, 0)):>15}" for category in used)
+              + f"{format_cents(sum(cents.values())):>15}")
+    return 0
+
+# Streams the rows of a ledger, or their totals, to a csv or JSON Lines file, compressed when it ends in .gz or .zst.
+# The rows are read a chunk at a time, so memory stays the same however large the source is. They can be narrowed to a
+# category, cashflow and date range
+def export(args):
+    from modules.export import export_records, export_format, filter_records
+
+    export_format(args.target) # Checked before the source is read
+    rules = get_rules(args)
+    errors = []
+    records = core.iter_ledger_records(args.source, errors, rules)
+
+    category = None
+    if args.category is not None:
+        category = category_lookup.get(args.category.strip().lower())
+        if category is None: # Can be a category the source adds as its rows are read
+            category = add_category(args.category)
+            records = check_category(records, category, args.category)
+    cashflow = cashflow_codes[args.cashflow.capitalize()] if args.cashflow else None
+    if category is not None or cashflow is not None or args.start is not None or args.end is not None:
+        records = filter_records(records, category, cashflow, args.start, args.end)
+    try:
+        written = export_records(args.target, records, args.summary)
+    finally: # The rows read before an error are still reported
+        print_errors(args.source, errors)
+    print(f"{args.target}: {written} {'summary lines' if args.summary else 'rows'} written, {len(errors)} rows skipped")
+    return 0
+
+# Passes records through, then raises ValueError when none of them had the category. Raised before the export file
+# is written, as it is only renamed into place once every record has been read
+def check_category(records, category, name):
+    found = False
+    for record in records:
+        found = found or record[2] == category
+        yield record
+    if not found:
+        raise ValueError(f"'{name}' - Expected categories: {', '.join(other for code, other in enumerate(categories) if code != category)}")
+
+# Adds --rules to the commands that read csv rows
+def add_rules_argument(parser):
+    parser.add_argument("--rules", help="rules file that categorizes rows without a category (default: MONEY_TRACKER_RULES)")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="money_tracker.py", description="Money Tracker command line tools. Run without a command to start the GUI.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    validate_parser = subparsers.add_parser("validate", help="report every invalid row of one or more ledgers")
+    validate_parser.add_argument("files", nargs="+")
+    add_rules_argument(validate_parser)
+    validate_parser.set_defaults(handler=validate)
+
+    summarize_parser = subparsers.add_parser("summarize", help="print the totals of a ledger")
+    summarize_parser.add_argument("file")
+    summarize_parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    add_rules_argument(summarize_parser)
+    summarize_parser.set_defaults(handler=summarize)
+
+    convert_parser = subparsers.add_parser("convert", help="convert a ledger between .csv, .csv.gz, .mtl and .db")
+    convert_parser.add_argument("source")
+    convert_parser.add_argument("target")
+    add_rules_argument(convert_parser)
+    convert_parser.set_defaults(handler=convert)
+
+    merge_parser = subparsers.add_parser("merge", help="merge several ledgers into one file")
+    merge_parser.add_argument("target")
+    merge_parser.add_argument("sources", nargs="+")
+    merge_parser.add_argument("--workers", type=int, help="number of processes used to parse the files (default: one per CPU)")
+    merge_parser.add_argument("--keep-duplicates", action="store_true", help="keep rows that are already in an earlier file")
+    add_rules_argument(merge_parser)
+    merge_parser.set_defaults(handler=merge)
+
+    report_parser = subparsers.add_parser("report", help="print category totals per month or year of the dated rows")
+    report_parser.add_argument("file")
+    report_parser.add_argument("--period", choices=("month", "year"), default="month")
+    report_parser.add_argument("--cashflow", choices=("income", "expenditure"), default="expenditure")
+    report_parser.add_argument("--from", dest="start", type=date.fromisoformat, help="first date, YYYY-MM-DD")
+    report_parser.add_argument("--to", dest="end", type=date.fromisoformat, help="last date, YYYY-MM-DD")
+    report_parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    add_rules_argument(report_parser)
+    report_parser.set_defaults(handler=report)
+
+    export_parser = subparsers.add_parser("export", help="write the rows or totals of a ledger to .csv or .jsonl, optionally .gz or .zst compressed")
+    export_parser.add_argument("source")
+    export_parser.add_argument("target")
+    export_parser.add_argument("--summary", action="store_true", help="write the income and expenditure of each category instead of the rows")
+    export_parser.add_argument("--category", help="only rows of this category")
+    export_parser.add_argument("--cashflow", choices=("income", "expenditure"), help="only rows of this cashflow")
+    export_parser.add_argument("--from", dest="start", type=date.fromisoformat, help="first date, YYYY-MM-DD")
+    export_parser.add_argument("--to", dest="end", type=date.fromisoformat, help="last date, YYYY-MM-DD")
+    add_rules_argument(export_parser)
+    export_parser.set_defaults(handler=export)
+
+    return parser
+
+def main(argv):
+    args = build_parser().parse_args(argv)
+    try:
+        load_user_categories()
+        return args.handler(args)
+    except (OSError, EOFError, ValueError, sqlite3.DatabaseError) as error: # Missing files, files that are not ledgers or compressed files cut short
+        print(f"error: {error}", file=sys.stderr)
+        return 2
@@ -0,0 +1,67 @@
+import gzip
+import io
+
+from contextlib import contextmanager
+
+# Compressed csv files, picked from the file extension e.g. march.csv.gz. gzip is built in, .zst files need
+# Python 3.14's compression.zstd or the zstandard package and raise ValueError without either
+gzip_suffix = ".gz"
+zstd_suffix = ".zst"
+compression_suffixes = (gzip_suffix, zstd_suffix)
+gzip_level = 6 # Most of the saving of level 9 in a fraction of the time
+zstd_level = 3
+
+# Returns the compression suffix of a path, "" for a plain file
+def compression(path) -> str:
+    lower = path.lower()
+    for suffix in compression_suffixes:
+        if lower.endswith(suffix):
+            return suffix
+    return ""
+
+# Returns the path without its compression suffix, so march.csv.gz is read as a .csv
+def strip_compression(path) -> str:
+    return path[:len(path) - len(compression(path))]
+
+def zstd_module():
+    try:
+        from compression import zstd # Python 3.14
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        raise ValueError("Reading or writing .zst files needs the zstandard package: pip install zstandard") from None
+
+# Wraps a binary file opened for reading so the decompressed bytes are read from it. Closing the stream leaves file open
+def decompress(file, path):
+    kind = compression(path)
+    if kind == gzip_suffix:
+        return gzip.GzipFile(fileobj=file, mode='rb')
+    if kind == zstd_suffix:
+        zstd = zstd_module()
+        if hasattr(zstd, "ZstdFile"):
+            return zstd.ZstdFile(file, mode='r')
+        return io.BufferedReader(zstd.ZstdDecompressor().stream_reader(file, closefd=False)) # Buffered so it can be read by line
+    return file
+
+# Wraps a binary file opened for writing so the bytes written to it are compressed. Closing the stream ends the
+# compressed data and leaves file open so it can be synced
+def compress(file, path):
+    kind = compression(path)
+    if kind == gzip_suffix:
+        return gzip.GzipFile(fileobj=file, mode='wb', compresslevel=gzip_level, mtime=0)
+    if kind == zstd_suffix:
+        zstd = zstd_module()
+        if hasattr(zstd, "ZstdFile"):
+            return zstd.ZstdFile(file, mode='w', level=zstd_level)
+        return zstd.ZstdCompressor(level=zstd_level).stream_writer(file, closefd=False)
+    return file
+
+# Opens a plain or compressed csv file as utf-8 text for the csv module
+@contextmanager
+def open_text(path):
+    with open(path, mode='rb') as file, decompress(file, path) as stream:
+        yield io.TextIOWrapper(stream, encoding='utf-8', newline='')
@@ -0,0 +1,33 @@
+import os
+
+# Settings read from environment variables when the module is first imported, with the defaults used when a variable
+# is not set or is not a number
+#   MONEY_TRACKER_UNDO_DEPTH    number of changes that can be undone, the oldest are dropped past this
+#   MONEY_TRACKER_INSTRUMENT    set to 1 to time the hot paths, see modules/profiling.py
+#   MONEY_TRACKER_STATS         JSON file the timings are written to when the program exits
+#   MONEY_TRACKER_PROFILE       cProfile stats file, the whole session runs under cProfile when this is set
+#   MONEY_TRACKER_AUTOSAVE      seconds between autosaves of unsaved changes to a recovery file, 0 turns autosave off
+#   MONEY_TRACKER_RECOVERY      folder the recovery files are written to
+#   MONEY_TRACKER_RULES         rules file used to categorize imported rows, see modules/rules.py
+#   MONEY_TRACKER_CATEGORIES    file of user defined categories, see modules/user_categories.py
+
+# Returns an environment variable as a whole number of at least minimum, or default
+def int_setting(name: str, default: int, minimum: int = 0) -> int:
+    try:
+        return max(int(os.environ.get(name, default)), minimum)
+    except ValueError:
+        return default
+
+# Returns True when an environment variable is set to anything other than empty, 0, false or no
+def flag_setting(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() not in ("", "0", "false", "no")
+
+undo_depth = int_setting("MONEY_TRACKER_UNDO_DEPTH", 1000, minimum=1)
+instrument = flag_setting("MONEY_TRACKER_INSTRUMENT")
+stats_path = os.environ.get("MONEY_TRACKER_STATS") or None
+profile_path = os.environ.get("MONEY_TRACKER_PROFILE") or None
+autosave_seconds = int_setting("MONEY_TRACKER_AUTOSAVE", 60)
+data_folder = os.path.join(os.path.expanduser("~"), ".money_tracker") # Default home of the files below
+recovery_folder = os.environ.get("MONEY_TRACKER_RECOVERY") or os.path.join(data_folder, "recovery")
+rules_path = os.environ.get("MONEY_TRACKER_RULES") or os.path.join(data_folder, "rules.csv")
+categories_path = os.environ.get("MONEY_TRACKER_CATEGORIES") or os.path.join(data_folder, "categories.txt")
@@ -0,0 +1,292 @@
+import csv
+import os
+import re
+
+from datetime import date
+from itertools import islice
+from typing import Union
+
+from modules.ledger import Ledger, categories, category_lookup
+from modules.validator import validate_rows
+from modules.journal import Journal, replay_journal, journal_error, plan_changes, record_fields
+from modules.export import write_atomic, csv_blocks, iter_records
+from modules.compressed_io import open_text
+from modules.time_index import Time_Index
+from modules.binary_ledger import Mapped_Ledger, is_binary_ledger, write_binary
+from modules.sqlite_store import SQLite_Store, is_database
+from modules.totals import Totals
+from modules.profiling import timed
+
+# Ledger model, csv/binary file I/O and totals without any Qt dependency.
+# Used by the GUI and by the command line tools in modules/cli.py
+
+price_pattern = re.compile(r'^[^.]*\.[^.]*$') # Only one . can be present, compiled once instead of per price
+date_pattern = re.compile(r'^\s*(\d{4})-(\d{2})-(\d{2})\s*$') # YYYY-MM-DD
+
+# Item object whose information will be used to populate the list
+class Item:
+    __slots__ = ("name", "price", "category", "cashflow", "date") # No per-instance __dict__, keeps each item small
+
+    # Define paramaters of a certain type. Union[] allows either option
+    @timed("Item")
+    def __init__(self, name: str, price: Union[int, float], category: str, cashflow: str, date: Union[str, date, None] = None):
+        self.name = name.strip() if name and name != "" else "-" # Trailing whitespace removed from name and set to name or default of - 
+        self.price = self.check_if_positive(price)
+        self.category = self.check_category(category)
+        self.cashflow = self.check_cashflow(cashflow)
+        self.date = self.check_date(date) # Optional, old 4 column files have no date
+
+    # Checks if the price is a float based on if a . is present
+    def check_if_float(self, price):
+        if price_pattern.search(price):
+            price = float(price)
+            return price
+        else:
+            price = int(price)
+            return price
+    
+    # Checks if the price is positive by checking if it is lower than 0
+    def check_if_positive(self, price):
+        check_if_float_price = self.check_if_float(price)
+        
+        if check_if_float_price < 0:
+            raise ValueError("Expected a positive number")
+        else:
+            return check_if_float_price
+    
+    # Checks if the category passed is in the list of categories, including the user defined ones
+    def check_category(self, category):
+        cat = category.strip() # Removes trailing and leading whitespace
+        code = category_lookup.get(cat.lower())
+        if code is not None:
+            return categories[code] # Return the category as it is spelt in the list
+        else:
+            raise ValueError(f"Expected categories: {', '.join(categories)}")
+
+    # Checks if the cashflow passed is income or expenditure
+    def check_cashflow(self, cashflow):
+        cash = cashflow.strip() # Removes trailing and leading whitespace
+        if cash.lower() == "income" or cash.lower() == "expenditure":
+            return cash.lower().capitalize() # Return capitalized version of cashflow
+        else:
+            raise ValueError("Expected: Income or Expenditure")
+
+    # Checks the date is empty or a real YYYY-MM-DD date and returns it as a date object or None
+    def check_date(self, day):
+        if day is None or isinstance(day, date):
+            return day
+        if not day.strip():
+            return None
+        match = date_pattern.match(day)
+        if match is None:
+            raise ValueError("Expected a date: YYYY-MM-DD")
+        return date(*map(int, match.groups())) # Raises ValueError for days that do not exist e.g. 2023-02-30
+
+# Reads a csv file from the file_path and return a list of items. Compressed .csv.gz/.csv.zst files are read the same way
+@timed("read_csv_file")
+def read_csv_file(file_path):
+    item_list = []
+    with open_text(file_path) as file: # Opens in read mode as file
+        csv_reader = csv.reader(file) # Reads the file
+        for row in csv_reader: # Gets the rows in the csv_reader
+            if any(row): # If a row exist (is not empty)
+                item = Item(*row) # Unpacks the rows to pass information to the Item class
+                item_list.append(item)
+    return item_list
+
+# Returns the line number of each row of a chunk that starts at first_line. Only needed when a quoted field holds
+# line breaks, so a row can span several lines of the file
+def row_line_numbers(rows, first_line) -> list:
+    line_numbers = []
+    line = first_line
+    for row in rows:
+        line_numbers.append(line)
+        line += 1
+        for field in row:
+            if "\n" in field or "\r" in field: # \r\n is a single line break
+                line += field.count("\n") + field.count("\r") - field.count("\r\n")
+    return line_numbers
+
+# Groups the rows of csv text lines into chunks of (lines, rows). lines is the line number of the first row when every
+# row is a single line, the row at index i is then on line lines + i, otherwise it is the list of line numbers of the
+# rows. Empty rows are kept so the rows line up with the file, validate_rows skips them.
+# Chunks start at first_size rows and grow 4x each time up to chunk_size
+def iter_row_chunks(lines, chunk_size=50000, first_size=None):
+    csv_reader = csv.reader(lines)
+    size = first_size or chunk_size
+    while True:
+        first_line = csv_reader.line_num + 1
+        rows = list(islice(csv_reader, size)) # Read by the csv module without a Python step per row
+        if not rows:
+            return
+        if csv_reader.line_num - first_line + 1 == len(rows):
+            yield first_line, rows
+        else:
+            yield row_line_numbers(rows, first_line), rows
+        size = min(size * 4, chunk_size)
+
+# Reads and validates a csv file chunk by chunk and replays its journal. Rules categorize rows without a category.
+# Returns the Ledger of good rows and the Row_Error list of the rejected ones
+@timed("read_csv_ledger")
+def read_csv_ledger(file_path, rules=None):
+    ledger = Ledger()
+    errors = []
+    with open_text(file_path) as file: # Decompressed as it is read when the file ends in .gz or .zst
+        for lines, rows in iter_row_chunks(file):
+            chunk, chunk_errors = validate_rows(rows, rules, lines)
+            ledger.extend_ledger(chunk)
+            errors.extend(chunk_errors)
+    ledger, journal_error = replay_journal(ledger, Journal(file_path), errors) # Changes saved since the csv was last fully written
+    if journal_error is not None:
+        errors.append(journal_error)
+    return ledger, errors
+
+# Opens a csv, binary .mtl or SQLite .db ledger. Returns the ledger and the Row_Error list
+def read_ledger(file_path, rules=None):
+    if is_binary_ledger(file_path):
+        return Mapped_Ledger(file_path), []
+    if is_database(file_path):
+        if not os.path.exists(file_path): # sqlite3 would create an empty database instead
+            raise FileNotFoundError(f"No such file: '{file_path}'")
+        with SQLite_Store(file_path, read_only=True) as store:
+            return store.load(), []
+    return read_csv_ledger(file_path, rules)
+
+# Validates every row of a csv without keeping them. Returns the number of rows that load, and the journal fields of
+# the rows that look like one removed by changes, by row number. Rejected rows are added to errors
+def scan_csv(file_path, rules, changes, errors):
+    wanted = set() # Fields of the remove entries
+    for change in changes:
+        if isinstance(change, list) and len(change) > 2 and change[0] != "add":
+            try:
+                wanted.add(tuple(change[2:]))
+            except TypeError: # A damaged entry that no row matches
+                pass
+    names = {fields[0] for fields in wanted}
+    row_count = 0
+    matches = {}
+    with open_text(file_path) as file:
+        for lines, rows in iter_row_chunks(file):
+            chunk, chunk_errors = validate_rows(rows, rules, lines)
+            errors.extend(chunk_errors)
+            for row, name in enumerate(chunk.names):
+                if name in names:
+                    fields = record_fields(next(iter_records(chunk, (row,))))
+                    if tuple(fields) in wanted:
+                        matches[row_count + row] = fields
+            row_count += len(chunk)
+    return row_count, matches
+
+# Yields the records of a csv ledger a validated chunk at a time, so the rows are never all in memory, with its journal
+# replayed as read_csv_ledger does. Rejected rows, and a journal that is not replayed, are added to errors.
+# Journal removes are numbered from the rows that loaded, so a journal with removes is checked in a first pass
+def iter_csv_records(file_path, errors, rules=None):
+    journal = Journal(file_path)
+    changes = journal.read()
+    rejected = []
+    removes = set()
+    added = []
+    reason = None
+    scanned = any(not isinstance(change, list) or change[:1] != ["add"] for change in changes)
+    if scanned:
+        row_count, matches = scan_csv(file_path, rules, changes, rejected)
+        if rejected:
+            reason = "rows of the file were rejected"
+        else:
+            try:
+                removes, added = plan_changes(row_count, changes, matches)
+            except ValueError as error:
+                reason = str(error)
+
+    row_count = 0
+    with open_text(file_path) as file:
+        for lines, rows in iter_row_chunks(file):
+            chunk, chunk_errors = validate_rows(rows, rules, lines)
+            if not scanned:
+                rejected.extend(chunk_errors)
+            if removes:
+                yield from (record for row, record in enumerate(iter_records(chunk), row_count) if row not in removes)
+            else:
+                yield from iter_records(chunk)
+            row_count += len(chunk)
+    errors.extend(rejected)
+
+    if changes and not scanned: # Only adds, they follow the rows
+        if rejected:
+            reason = "rows of the file were rejected"
+        else:
+            try:
+                _, added = plan_changes(row_count, changes, {})
+            except ValueError as error:
+                reason = str(error)
+    if reason is not None:
+        errors.append(journal_error(journal, changes, reason))
+    else:
+        yield from added
+
+# Yields the (name, cents, category code, cashflow code, day) records of a csv, binary .mtl or SQLite .db ledger in
+# row order without loading the ledger: csv rows are validated a chunk at a time, database rows come from a cursor and
+# binary rows from the file's memory map. Rejected rows are added to errors
+def iter_ledger_records(file_path, errors, rules=None):
+    if is_binary_ledger(file_path):
+        yield from iter_records(Mapped_Ledger(file_path))
+    elif is_database(file_path):
+        if not os.path.exists(file_path): # sqlite3 would create an empty database instead
+            raise FileNotFoundError(f"No such file: '{file_path}'")
+        with SQLite_Store(file_path, read_only=True) as store:
+            for row in store.iter_rows():
+                yield row[1:]
+    else:
+        yield from iter_csv_records(file_path, errors, rules)
+
+# Writes a ledger as csv, binary .mtl or SQLite .db based on the file extension. The file is replaced atomically.
+# A csv is streamed from the ledger columns, compressed when the file ends in .gz or .zst
+@timed("write_ledger")
+def write_ledger(file_path, ledger):
+    if is_binary_ledger(file_path):
+        write_binary(file_path, ledger)
+    elif is_database(file_path):
+        with SQLite_Store(file_path) as store:
+            store.replace(ledger)
+    else:
+        write_atomic(file_path, csv_blocks(iter_records(ledger)))
+        Journal(file_path).discard() # The csv now holds every change
+
+# Returns the Totals of a ledger. Binary ledgers already store their totals
+def summarize(ledger):
+    if isinstance(ledger, Mapped_Ledger):
+        return Totals(ledger.totals)
+    totals = Totals()
+    totals.add_ledger(ledger)
+    return totals
+
+# Returns the number of rows, the Totals and the Row_Error list of a ledger file.
+# Binary ledgers store their totals and databases total their rows with an indexed query, so neither has its rows read
+def summarize_file(file_path, rules=None):
+    if is_database(file_path):
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"No such file: '{file_path}'")
+        with SQLite_Store(file_path, read_only=True) as store:
+            return store.count(), store.totals(), []
+    ledger, errors = read_ledger(file_path, rules)
+    return len(ledger), summarize(ledger), errors
+
+# Returns the Time_Index.rollup of a ledger file's dated rows and the Row_Error list.
+# Databases answer it with a grouped query over their date index, so their rows are not read
+def report_file(file_path, cashflow, period="month", start=None, end=None, rules=None):
+    if is_database(file_path):
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"No such file: '{file_path}'")
+        with SQLite_Store(file_path, read_only=True) as store:
+            return store.rollup(cashflow, period, start, end), []
+    ledger, errors = read_ledger(file_path, rules)
+    return Time_Index(ledger).rollup(cashflow, period, start, end), errors
+
+# Converts a ledger file between csv, binary .mtl and SQLite .db. Returns the number of rows written and the Row_Error list
+def convert_file(source_path, target_path, rules=None):
+    if is_database(target_path) and not is_binary_ledger(source_path) and not is_database(source_path):
+        with SQLite_Store(target_path) as store: # A csv is streamed into the database chunk by chunk
+            return store.import_csv(source_path, replace=True, rules=rules)
+    ledger, errors = read_ledger(source_path, rules)
+    write_ledger(target_path, ledger)
+    return len(ledger), errors
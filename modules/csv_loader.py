@@ -0,0 +1,219 @@
+import gc
+import io
+import os
+import threading
+
+from array import array
+
+from PySide6.QtCore import QObject, QRunnable, Signal
+
+from modules.validator import validate_rows
+from modules.core import iter_row_chunks, write_ledger
+from modules.multi_import import import_files
+from modules.dedup import open_index
+from modules.compressed_io import decompress
+from modules.ledger import Ledger
+from modules.sqlite_store import SQLite_Store, is_empty_database
+from modules.ledger_index import Ledger_Index
+
+# Returns the message shown for an error a task failed with, its type when it has no message e.g. a bare struct.error
+def error_message(error) -> str:
+    return str(error) or type(error).__name__
+
+# Signals emitted by the CSV_Loader. QRunnable is not a QObject so it cannot own signals itself
+class Loader_Signals(QObject):
+    batch_loaded = Signal(object) # A Ledger chunk of validated rows ready to be added to the table
+    rejected = Signal(list) # Row_Error list for the bad rows of a chunk
+    progress = Signal(int) # Percentage of the file read so far
+    failed = Signal(str) # Error message when the file itself could not be read
+    finished = Signal(bool) # True if the load was cancelled before the end of the file
+
+# Reads a csv file in chunks on a worker thread, validates each chunk in one pass and hands the good rows over in batches
+class CSV_Loader(QRunnable):
+    first_batch_size = 500 # Small first batch so the first rows appear straight away
+    max_batch_size = 50000 # Later batches grow up to this size to keep the number of signals low
+
+    def __init__(self, file_path, rules=None):
+        super().__init__()
+        self.setAutoDelete(False) # The window keeps a reference to the loader so it can cancel it
+
+        self.file_path = file_path
+        self.rules = rules # Rules that categorize rows without a category, or None
+        self.signals = Loader_Signals()
+        self.cancelled = False
+        self.file = None # The file on disk, its position is the progress of a compressed file as well
+
+    # Asks the worker to stop at the next batch boundary
+    def cancel(self):
+        self.cancelled = True
+
+    # Validates a batch of rows and sends the results to the GUI thread. lines numbers the rows, see iter_row_chunks
+    def emit_batch(self, lines, rows, file_size):
+        chunk, errors = validate_rows(rows, self.rules, lines)
+        if len(chunk):
+            self.signals.batch_loaded.emit(chunk)
+        if errors:
+            self.signals.rejected.emit(errors)
+        self.signals.progress.emit(min(self.file.tell() * 100 // file_size, 100)) # Read ahead can pass the last row
+
+    def run(self):
+        try:
+            file_size = os.path.getsize(self.file_path) or 1 # Avoids dividing by 0 on empty files
+
+            # .csv.gz and .csv.zst files are decompressed as they are read
+            with open(self.file_path, mode='rb') as self.file, decompress(self.file, self.file_path) as file:
+                text = io.TextIOWrapper(file, encoding='utf-8', newline='') # Decoded by the io module rather than line by line
+                for lines, rows in iter_row_chunks(text, self.max_batch_size, self.first_batch_size):
+                    if self.cancelled:
+                        break
+                    self.emit_batch(lines, rows, file_size)
+
+            self.signals.progress.emit(100)
+            self.signals.finished.emit(self.cancelled)
+        except Exception as error: # Any error must reach the window, it stays in its loading state until the task ends
+            self.signals.failed.emit(error_message(error))
+
+# Reads the rows of a SQLite ledger on a worker thread and hands them over in batches like the CSV_Loader. The worker
+# opens its own read-only connection, a sqlite3 connection can only be used by the thread that opened it. The row id of
+# each row is kept in self.ids so the window's SQLite_Store does not have to read them again
+class Database_Loader(QRunnable):
+    first_batch_size = CSV_Loader.first_batch_size
+    max_batch_size = CSV_Loader.max_batch_size
+
+    def __init__(self, file_path):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.file_path = file_path
+        self.signals = Loader_Signals() # rejected is never emitted, a row that cannot be read fails the whole load
+        self.cancelled = False
+        self.ids = array('q')
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            # An empty file is opened for writing so it gets the rows table, as a new database does
+            with SQLite_Store(self.file_path, read_only=not is_empty_database(self.file_path)) as store:
+                row_count = store.count() or 1 # Avoids dividing by 0 on empty databases
+                batch_size = self.first_batch_size
+                chunk = Ledger()
+                append_row = chunk.append_row
+                add_id = self.ids.append
+                for row_id, name, cents, category, cashflow, day in store.iter_rows():
+                    append_row(name, cents, category, cashflow, day=day)
+                    add_id(row_id)
+                    if len(chunk) == batch_size:
+                        if self.cancelled:
+                            break
+                        self.signals.batch_loaded.emit(chunk)
+                        self.signals.progress.emit(len(self.ids) * 100 // row_count)
+                        batch_size = self.max_batch_size
+                        chunk = Ledger()
+                        append_row = chunk.append_row
+                if len(chunk) and not self.cancelled:
+                    self.signals.batch_loaded.emit(chunk)
+
+            self.signals.progress.emit(100)
+            self.signals.finished.emit(self.cancelled)
+        except Exception as error: # e.g. a file that is not a SQLite database, or a row another program wrote
+            self.signals.failed.emit(error_message(error))
+
+# Signals emitted by the Import_Task
+class Import_Signals(QObject):
+    progress = Signal(int) # Percentage of the files parsed so far
+    finished = Signal(object, object) # Merged Ledger and {path: Row_Error list}
+    failed = Signal(str) # Error message when a file could not be read
+
+# Imports several files through a process pool. The pool is driven from a worker thread so the window stays responsive.
+# With a ledger the rows already in it are skipped, see modules.dedup. The ledger is only read, the window does not
+# change it while the import runs
+class Import_Task(QRunnable):
+    def __init__(self, file_paths, rules=None, ledger=None, index=None, ledger_path=""):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.file_paths = file_paths
+        self.rules = rules
+        self.ledger = ledger
+        self.ledger_path = ledger_path # Saved file of the ledger, its .dedup index is read instead of building one
+        self.index = index # Dedup_Index of the ledger, built by the task when None
+        self.keys = None # Keys of the imported rows, added to the index once the rows are in the ledger
+        self.duplicates = None # Ledger of the skipped rows
+        self.signals = Import_Signals()
+
+    def report_progress(self, done, total):
+        self.signals.progress.emit(done * 100 // total)
+
+    def run(self):
+        try:
+            # Spawned workers do not inherit the GUI process and its threads, they only import the core modules
+            merged, errors = import_files(self.file_paths, progress=self.report_progress, start_method="spawn", rules=self.rules)
+            if self.ledger is not None:
+                if self.index is None:
+                    self.index = open_index(self.ledger, self.ledger_path)
+                merged, self.keys, self.duplicates = self.index.filter(merged)
+            self.signals.finished.emit(merged, errors)
+        except Exception as error: # e.g. a damaged .mtl or .db, or a worker process that died
+            self.signals.failed.emit(error_message(error))
+
+# Signals emitted by a Save_Task
+class Save_Signals(QObject):
+    finished = Signal()
+    failed = Signal(str) # Error message when the file could not be written
+
+# Writes a snapshot of the ledger on a worker thread so the window stays responsive while a large file is saved.
+# The snapshot is a copy taken on the GUI thread, rows changed while it is written are left for the next save
+class Save_Task(QRunnable):
+    def __init__(self, path, snapshot, write=write_ledger):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.path = path
+        self.snapshot = snapshot
+        self.write = write
+        self.signals = Save_Signals()
+        self.error = None # Message of the error the write failed with
+        self.done = threading.Event() # Set once the write has finished or failed, closing the window waits on it
+
+    def run(self):
+        try:
+            self.write(self.path, self.snapshot)
+            self.signals.finished.emit()
+        except Exception as error:
+            self.error = error_message(error)
+            self.signals.failed.emit(self.error)
+        finally:
+            self.done.set()
+
+# Builds the Ledger_Index of a ledger on a worker thread once a file has loaded, or adds the rows of an import to an
+# existing index, so the next search or sort does not do it on the GUI thread. Rows appended while it runs are indexed
+# by the model later, the model waits on done before it removes or inserts a row
+class Index_Task(QRunnable):
+    def __init__(self, ledger, index=None):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.ledger = ledger
+        self.index = index # The Ledger_Index, None until done is set when a new one is built or when the build failed
+        self.done = threading.Event()
+
+    def run(self):
+        # The index is millions of small objects that hold no cycles. Full collections triggered while they are
+        # allocated would stop the GUI thread for longer and longer, so collection is paused until the build ends
+        # and the objects that exist then are moved out of the collector's reach with freeze
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            if self.index is None:
+                self.index = Ledger_Index(self.ledger)
+            else:
+                self.index.add_rows(self.index.indexed, len(self.ledger))
+        except Exception: # Left to the GUI thread, which builds the index again and shows the error
+            self.index = None
+        finally:
+            gc.freeze()
+            if collecting:
+                gc.enable()
+            self.done.set()
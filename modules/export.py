@@ -0,0 +1,194 @@
+import csv
+import io
+import json
+import os
+import stat
+
+from itertools import islice
+
+from modules.ledger import categories, cashflows, format_cents, format_day
+from modules.totals import Totals
+from modules.compressed_io import compress, strip_compression
+
+# Streams ledger rows, or their totals, to csv or JSON Lines files, optionally gzip or zstd compressed
+# e.g. 2023.csv.gz, filtered.jsonl. Rows are formatted straight from the ledger columns a block at a time and each
+# block is a single large write, so memory stays the same however many rows are written.
+#
+#   csv      Name,Price,Category,Cashflow[,Date], the ledger csv format, so an exported .csv or .csv.gz opens as a ledger
+#   jsonl    {"name": "Coffee", "price": 3.50, "category": "Restaurants", "cashflow": "Expenditure", "date": "2024-01-02"}
+#
+# Summaries have one line per category with its income and expenditure, then a Total line
+block_rows = 16384 # Rows formatted per block, about 1 MB of csv
+export_formats = (".csv", ".jsonl")
+summary_header = ("Category", "Income", "Expenditure")
+
+# Returns ".csv" or ".jsonl" for a path, looking past a compression suffix. Raises ValueError for other files
+def export_format(path) -> str:
+    lower = strip_compression(path).lower()
+    for suffix in export_formats:
+        if lower.endswith(suffix):
+            return suffix
+    raise ValueError(f"'{os.path.basename(path)}' - Expected a .csv or .jsonl file, optionally compressed as .gz or .zst")
+
+# Yields (name, cents, category code, cashflow code, day) for the given ledger rows in order, every row when rows is None
+def iter_records(ledger, rows=None):
+    if rows is None:
+        return zip(ledger.names, ledger.prices, ledger.categories, ledger.cashflows, ledger.dates)
+    names, prices, category_codes, cashflow_codes, dates = ledger.names, ledger.prices, ledger.categories, ledger.cashflows, ledger.dates
+    return ((names[row], prices[row], category_codes[row], cashflow_codes[row], dates[row]) for row in rows)
+
+# Yields the records with the category and cashflow codes, dated from start to end inclusive.
+# None matches every record, an undated record only matches when no dates are given
+def filter_records(records, category=None, cashflow=None, start=None, end=None):
+    start_day = start.toordinal() if start is not None else None
+    end_day = end.toordinal() if end is not None else None
+    for record in records:
+        _, _, category_code, cashflow_code, day = record
+        if category is not None and category_code != category or cashflow is not None and cashflow_code != cashflow:
+            continue
+        if start_day is not None and (not day or day < start_day) or end_day is not None and (not day or day > end_day):
+            continue
+        yield record
+
+# Yields the records as blocks of csv text in the ledger csv format
+def csv_blocks(records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    days = {} # Day numbers repeat across rows so each one is formatted once
+    records = iter(records)
+    while True:
+        block = []
+        add = block.append
+        for name, cents, category, cashflow, day in islice(records, block_rows):
+            if day:
+                day_text = days.get(day)
+                if day_text is None:
+                    day_text = days[day] = format_day(day)
+                add((name, format_cents(cents), categories[category], cashflows[cashflow], day_text))
+            else:
+                add((name, format_cents(cents), categories[category], cashflows[cashflow]))
+        if not block:
+            return
+        writer.writerows(block)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+# Yields the records as blocks of JSON Lines. Prices are written as exact decimal numbers e.g. 12.50
+def jsonl_blocks(records):
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    category_text = {} # Encoded as they are first used, a streamed source can add categories as it is read
+    cashflow_text = [encode(cashflow) for cashflow in cashflows]
+    days = {0: "null"}
+    records = iter(records)
+    while True:
+        lines = []
+        add = lines.append
+        for name, cents, category, cashflow, day in islice(records, block_rows):
+            day_text = days.get(day)
+            if day_text is None:
+                day_text = days[day] = f'"{format_day(day)}"'
+            text = category_text.get(category)
+            if text is None:
+                text = category_text[category] = encode(categories[category])
+            add(f'{{"name": {encode(name)}, "price": {format_cents(cents)}, "category": {text}, '
+                f'"cashflow": {cashflow_text[cashflow]}, "date": {day_text}}}\n')
+        if not lines:
+            return
+        yield "".join(lines)
+
+# Returns the Totals of the given ledger rows, added up in one pass
+def record_totals(records) -> Totals:
+    totals = Totals()
+    sums = totals.cents
+    get = sums.get
+    for _, cents, category, cashflow, _ in records:
+        key = (category, cashflow)
+        sums[key] = get(key, 0) + cents
+    return totals
+
+# Returns [(category name, income cents, expenditure cents)] in category order followed by the Total line
+def summary_lines(totals) -> list:
+    lines = [(categories[category], income, expenditure) for category, (income, expenditure) in sorted(totals.by_category().items())]
+    lines.append(("Total", totals.income(), totals.expenditure()))
+    return lines
+
+def summary_csv_blocks(totals):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(summary_header)
+    writer.writerows((category, format_cents(income), format_cents(expenditure)) for category, income, expenditure in summary_lines(totals))
+    yield buffer.getvalue()
+
+def summary_jsonl_blocks(totals):
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    yield "".join(f'{{"category": {encode(category)}, "income": {format_cents(income)}, "expenditure": {format_cents(expenditure)}}}\n'
+                  for category, income, expenditure in summary_lines(totals))
+
+# Creates a new temp file in the same folder as path and returns its file descriptor, open for writing, and its path.
+# The temp file takes the mode of the file at path, or the umask default when there is none yet, so a rename over
+# path keeps the file's permissions instead of the 0600 of tempfile.mkstemp
+def create_temp(path):
+    folder = os.path.dirname(os.path.abspath(path))
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    while True:
+        temp_path = os.path.join(folder, f".{os.urandom(6).hex()}.tmp")
+        try:
+            file_descriptor = os.open(temp_path, flags, 0o666)
+            break
+        except FileExistsError: # Another temp file has the name, a new one is picked
+            continue
+    try:
+        os.chmod(temp_path, stat.S_IMODE(os.stat(path).st_mode))
+    except FileNotFoundError:
+        pass
+    except BaseException:
+        os.close(file_descriptor)
+        os.remove(temp_path)
+        raise
+    return file_descriptor, temp_path
+
+# Writes text blocks to a temp file in the same folder as path, compressed when path ends in .gz or .zst,
+# and returns the temp file path
+def write_temp(path, blocks):
+    file_descriptor, temp_path = create_temp(path)
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            stream = compress(file, path)
+            for block in blocks:
+                stream.write(block.encode("utf-8"))
+            if stream is not file:
+                stream.close() # Ends the compressed data, the file itself stays open to be synced
+            file.flush()
+            os.fsync(file.fileno()) # Data is on disk before a rename makes it visible
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path
+
+# Writes text blocks to a temp file and renames it over path so a crash never leaves a half written file
+def write_atomic(path, blocks):
+    os.replace(write_temp(path, blocks), path)
+
+# Writes records, or their summary, to a csv or JSON Lines file picked from the path. records can be any iterable,
+# e.g. rows streamed from a file, and are written as they arrive. Returns the number of rows or summary lines written
+def export_records(path, records, summary=False) -> int:
+    jsonl = export_format(path) == ".jsonl"
+    if summary:
+        totals = record_totals(records)
+        write_atomic(path, summary_jsonl_blocks(totals) if jsonl else summary_csv_blocks(totals))
+        return len(totals.by_category()) + 1
+
+    written = 0
+    def counted(records): # Counts the rows as they stream past, rows can be a generator e.g. of filtered rows
+        nonlocal written
+        for written, record in enumerate(records, start=1):
+            yield record
+    write_atomic(path, (jsonl_blocks if jsonl else csv_blocks)(counted(records)))
+    return written
+
+# Writes the given rows of a ledger, or their summary, to a csv or JSON Lines file picked from the path.
+# rows are ledger row numbers in the order they are written, e.g. a filtered and sorted view, every row when None.
+# Returns the number of rows or summary lines written
+def export_file(path, ledger, rows=None, summary=False) -> int:
+    return export_records(path, iter_records(ledger, rows), summary)
@@ -0,0 +1,67 @@
+import struct
+
+from collections import deque
+
+# Undo/redo history of the changes made to a ledger. Each change is recorded as a small Command holding the ledger row
+# it touched and, for single rows, the fields packed into bytes, never a copy of the table.
+# The stacks are bounded deques so the oldest commands are dropped once the depth is reached
+ADD = 0 # A row was appended at command.row
+REMOVE = 1 # The row at command.row was removed
+IMPORT = 2 # command.data rows were appended from command.row onwards, e.g. a multi-file import
+
+row_format = struct.Struct("<qiBBH") # cents, day, category code, cashflow code, source code, then the utf-8 name
+
+# Packs the fields of a ledger row into bytes
+def pack_row(ledger, row: int) -> bytes:
+    return row_format.pack(ledger.prices[row], ledger.dates[row], ledger.categories[row], ledger.cashflows[row],
+                           ledger.sources[row]) + ledger.names[row].encode("utf-8")
+
+# Unpacks the bytes of pack_row into (name, cents, category code, cashflow code, source code, day)
+def unpack_row(packed: bytes) -> tuple:
+    cents, day, category, cashflow, source = row_format.unpack_from(packed)
+    return str(packed[row_format.size:], "utf-8"), cents, category, cashflow, source, day
+
+# A single undoable change. data is the packed row for ADD and REMOVE and, for IMPORT, the number of rows and their
+# Totals, plus the removed rows while the import is undone. change is the save entry the command made, if any
+class Command:
+    __slots__ = ("kind", "row", "data", "change")
+
+    def __init__(self, kind: int, row: int, data, change=None):
+        self.kind = kind
+        self.row = row
+        self.data = data
+        self.change = change
+
+class History:
+    __slots__ = ("undo_stack", "redo_stack")
+
+    def __init__(self, depth: int):
+        self.undo_stack = deque(maxlen=depth) # Appending past maxlen drops the oldest command
+        self.redo_stack = deque(maxlen=depth)
+
+    # Records a new change, anything that was undone can no longer be redone
+    def record(self, command: Command):
+        self.undo_stack.append(command)
+        self.redo_stack.clear()
+
+    def can_undo(self) -> bool:
+        return bool(self.undo_stack)
+
+    def can_redo(self) -> bool:
+        return bool(self.redo_stack)
+
+    # Returns the command to undo and moves it to the redo stack
+    def undo(self) -> Command:
+        command = self.undo_stack.pop()
+        self.redo_stack.append(command)
+        return command
+
+    # Returns the command to redo and moves it back to the undo stack
+    def redo(self) -> Command:
+        command = self.redo_stack.pop()
+        self.undo_stack.append(command)
+        return command
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
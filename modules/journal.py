@@ -0,0 +1,250 @@
+import json
+import os
+import threading
+
+from bisect import bisect_left, bisect_right, insort
+from datetime import date
+
+from modules.ledger import categories, cashflows, cashflow_codes, add_category, format_day
+from modules.validator import Row_Error
+from modules.export import write_temp, csv_blocks, iter_records
+
+journal_suffix = ".journal" # The journal sits next to the csv file e.g. march.csv.journal
+
+# Builds the journal entry for a row that was added to the ledger. The date is only written for dated rows
+def add_change(ledger, row):
+    change = ["add", ledger.names[row], ledger.prices[row], ledger.category(row), ledger.cashflow(row)]
+    if ledger.dates[row]:
+        change.append(ledger.date(row))
+    return change
+
+# Builds the journal entry for a row that is about to be removed from the ledger. The fields of the row are kept with
+# its number so a replay can check it removes the same row
+def remove_change(ledger, row):
+    return ["remove", row, *add_change(ledger, row)[1:]]
+
+# Returns the (name, cents, category code, cashflow code, day) record of an add entry
+def change_record(change):
+    _, name, cents, category, cashflow, *day = change # Entries written before dates existed have no date
+    return name, cents, add_category(category), cashflow_codes[cashflow], date.fromisoformat(day[0]).toordinal() if day else 0
+
+# Returns the fields a journal entry holds for a record, as add_change writes them
+def record_fields(record) -> list:
+    name, cents, category, cashflow, day = record
+    fields = [name, cents, categories[category], cashflows[cashflow]]
+    if day:
+        fields.append(format_day(day))
+    return fields
+
+# Replays journal entries onto a ledger in the order they were made. Raises ValueError when an entry does not fit the
+# ledger, e.g. the row at a removed row number is another row
+def apply_changes(ledger, changes):
+    for change in changes:
+        try:
+            if change[0] == "add":
+                name, cents, category, cashflow, day = change_record(change)
+                ledger.append_row(name, cents, category, cashflow, day=day)
+                continue
+            row = change[1]
+            if not isinstance(row, int):
+                raise TypeError
+        except (KeyError, IndexError, TypeError):
+            raise ValueError(f"Damaged journal entry {change}")
+        if not 0 <= row < len(ledger) or len(change) > 2 and remove_change(ledger, row) != change: # Entries written before rows were checked only have the number
+            raise ValueError(f"Row {row + 1} is not the row that was removed")
+        ledger.remove(row)
+
+# Replays journal entries onto the row numbers of a ledger of row_count rows, for a ledger that is streamed instead of
+# loaded. fields holds the journal fields of the ledger rows the entries may remove, see add_change. Returns the set of
+# ledger rows the changes remove and the records of the added rows that are kept. Raises ValueError like apply_changes
+def plan_changes(row_count, changes, fields):
+    removed = [] # Sorted numbers of the removed rows, added rows are numbered on from row_count
+    added = []
+    for change in changes:
+        try:
+            if change[0] == "add":
+                added.append(change_record(change))
+                continue
+            row = change[1]
+            if not isinstance(row, int):
+                raise TypeError
+        except (KeyError, IndexError, TypeError):
+            raise ValueError(f"Damaged journal entry {change}")
+        if not 0 <= row < row_count + len(added) - len(removed):
+            raise ValueError(f"Row {row + 1} is not the row that was removed")
+        number = row # Moves past the rows removed before it until it is the row'th row still there
+        while True:
+            moved = row + bisect_right(removed, number)
+            if moved == number:
+                break
+            number = moved
+        row_fields = record_fields(added[number - row_count]) if number >= row_count else fields.get(number, [])
+        if len(change) > 2 and ["remove", row, *row_fields] != change: # Entries written before rows were checked only have the number
+            raise ValueError(f"Row {row + 1} is not the row that was removed")
+        insort(removed, number)
+    split = bisect_left(removed, row_count)
+    removed_adds = set(removed[split:])
+    return set(removed[:split]), [record for number, record in enumerate(added, row_count) if number not in removed_adds]
+
+# Row_Error listed when the changes of a journal are not replayed
+def journal_error(journal, changes, reason) -> Row_Error:
+    return Row_Error(0, "Journal", os.path.basename(journal.path),
+                     f"{len(changes)} saved changes were not applied, {reason}. They are dropped when the file is next saved")
+
+# Replays the journal of a csv onto the ledger loaded from it. Journal row numbers count the rows that loaded when the
+# changes were made, so the changes are not replayed when this load rejected rows, or when any entry does not fit.
+# Returns the ledger with the changes, or the loaded ledger and a Row_Error saying why they were left out
+def replay_journal(ledger, journal, rejected):
+    changes = journal.read()
+    if not changes:
+        return ledger, None
+    if rejected:
+        return ledger, journal_error(journal, changes, "rows of the file were rejected")
+    replayed = ledger.copy() # A failed replay leaves the loaded rows as they were
+    try:
+        apply_changes(replayed, changes)
+    except ValueError as error:
+        return ledger, journal_error(journal, changes, str(error))
+    return replayed, None
+
+# Identifies one version of a file by its size and modification time
+def file_stamp(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+# Append-only change journal of adds and removes made since the csv file was last fully written.
+# Each line is a JSON list, ["add", name, cents, category, cashflow, optional YYYY-MM-DD] or ["remove", row, followed by
+# the same fields of the removed row].
+# The first line records the stamp of the csv file the changes apply to, a journal for any other version is ignored
+class Journal:
+    compact_min_changes = 1000 # Compaction runs once the journal holds this many changes
+    compact_ratio = 4 # and at least one change for every compact_ratio rows in the ledger
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.path = csv_path + journal_suffix
+        self.next_path = self.path + ".next" # Journal for the csv a compaction is swapping in, see compact
+        self.count = 0 # Number of changes in the journal file
+        self.lock = threading.Lock() # Serialises appends with the end of a compaction
+        self.compactor = None # Thread running the current compaction
+
+    # Returns the changes stored in the journal. A missing or stale journal has no changes
+    def read(self):
+        with self.lock:
+            self.count = 0
+            self.finish_compaction()
+            try:
+                with open(self.path, mode='r', encoding='utf-8') as file:
+                    lines = file.read().split("\n")
+            except FileNotFoundError:
+                return []
+
+            try:
+                base = json.loads(lines[0]).get("base")
+                if base != file_stamp(self.csv_path): # Journal belongs to another version of the csv
+                    return []
+            except (ValueError, AttributeError, OSError):
+                return []
+
+            changes = []
+            try:
+                for line in lines[1:-1]: # The last element is either empty or a line torn by a crash mid append
+                    changes.append(json.loads(line))
+            except ValueError:
+                pass # Keeps the changes read before the first unreadable line
+
+            if len(changes) != len(lines) - 2 or lines[-1]: # Drops a torn tail so later appends follow a complete line
+                self.rewrite(base, [json.dumps(change) for change in changes])
+            self.count = len(changes)
+            return changes
+
+    # Writes a journal file with a header for base and the given change lines
+    def write_file(self, path, base, lines):
+        with open(path, mode='w', encoding='utf-8') as file:
+            file.write(json.dumps({"base": base}) + "\n" + "".join(line + "\n" for line in lines))
+            file.flush()
+            os.fsync(file.fileno())
+
+    # Replaces the journal with a header for base and the given change lines
+    def rewrite(self, base, lines):
+        temp_journal = self.path + ".tmp"
+        self.write_file(temp_journal, base, lines)
+        os.replace(temp_journal, self.path)
+
+    # Finishes a compaction that stopped between swapping in the csv and its journal. The next journal is used when it
+    # belongs to the csv on disk, otherwise the csv was never swapped in and the current journal still applies
+    def finish_compaction(self):
+        try:
+            with open(self.next_path, mode='r', encoding='utf-8') as file:
+                base = json.loads(file.readline()).get("base")
+        except FileNotFoundError:
+            return
+        except (ValueError, AttributeError, OSError):
+            base = None
+        try:
+            if base is not None and base == file_stamp(self.csv_path):
+                os.replace(self.next_path, self.path)
+            else:
+                os.remove(self.next_path)
+        except OSError:
+            pass
+
+    # Appends changes to the journal and flushes them to disk
+    def append(self, changes):
+        if not changes:
+            return
+        with self.lock:
+            lines = "".join(json.dumps(change) + "\n" for change in changes)
+            if self.count == 0: # Starts a fresh journal, replacing any stale one
+                lines = json.dumps({"base": file_stamp(self.csv_path)}) + "\n" + lines
+                mode = 'w'
+            else:
+                mode = 'a'
+            with open(self.path, mode=mode, encoding='utf-8') as file:
+                file.write(lines)
+                file.flush()
+                os.fsync(file.fileno())
+            self.count += len(changes)
+
+    # Deletes the journal, used after the csv file has been fully rewritten
+    def discard(self):
+        with self.lock:
+            for path in (self.path, self.next_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.count = 0
+
+    # Checks if the journal has grown enough to be worth folding back into the csv file
+    def needs_compaction(self, row_count):
+        return self.count >= max(self.compact_min_changes, row_count // self.compact_ratio) and not self.is_compacting()
+
+    def is_compacting(self):
+        return self.compactor is not None and self.compactor.is_alive()
+
+    # Rewrites the csv file from a snapshot of the ledger on a background thread and drops the changes the snapshot already holds
+    def compact_in_background(self, snapshot):
+        included = self.count # Changes made up to the snapshot
+        self.compactor = threading.Thread(target=self.compact, args=(snapshot, included), name="journal-compaction")
+        self.compactor.start()
+
+    def compact(self, snapshot, included):
+        temp_csv = write_temp(self.csv_path, csv_blocks(iter_records(snapshot))) # The slow part runs without the lock
+        try:
+            with self.lock:
+                # Changes appended while the snapshot was written are carried over into a journal for the new csv
+                with open(self.path, mode='r', encoding='utf-8') as file:
+                    lines = file.read().split("\n")[1:-1]
+                remaining = lines[included:]
+
+                # The journal for the new csv is written before the csv is swapped in. A crash between the two renames
+                # leaves it as the next journal, which read picks up since its base is the new csv
+                base = file_stamp(temp_csv) # A rename keeps the size and modification time
+                self.write_file(self.next_path, base, remaining)
+                os.replace(temp_csv, self.csv_path)
+                os.replace(self.next_path, self.path)
+                self.count = len(remaining)
+        finally:
+            if os.path.exists(temp_csv): # The csv was not swapped in, so the current journal still applies
+                os.remove(temp_csv)
+                if os.path.exists(self.next_path):
+                    os.remove(self.next_path)
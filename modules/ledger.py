@@ -0,0 +1,255 @@
+import os
+import sys
+
+from array import array
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Union
+
+# Column headers shared by the table view and the csv files. Date is optional, rows without one are written with 4 fields
+headers = ("Name", "Price", "Category", "Cashflow", "Date")
+source_header = "Source" # Extra table column shown for ledgers built from several files, it is not saved to csv
+
+# Category and cashflow names, the ledger stores the index into these sequences instead of the text.
+# The built in categories come first, user defined ones, e.g. from a rules file or the user categories file, are added
+# after them by add_category
+categories = ["Wages", "Rent", "Bills", "Subscriptions", "Restaurants",
+              "Groceries", "Household", "Entertainment", "Other"]
+builtin_category_count = len(categories) # User defined categories have codes from here on
+cashflows = ("Income", "Expenditure")
+max_categories = 256 # Codes are stored in 1 byte
+
+category_codes = {category: code for code, category in enumerate(categories)}
+cashflow_codes = {cashflow: code for code, cashflow in enumerate(cashflows)}
+# Lookup from csv text to a category code. The canonical spelling is included so most rows skip strip/lower
+category_lookup = {category.lower(): code for code, category in enumerate(categories)}
+category_lookup.update(category_codes)
+
+INCOME = cashflow_codes["Income"]
+EXPENDITURE = cashflow_codes["Expenditure"]
+
+# Returns the code of a category, adding it to the categories when it is not known yet
+def add_category(name: str) -> int:
+    code = category_codes.get(name)
+    if code is None:
+        name = name.strip()
+        if not name:
+            raise ValueError("A category needs a name")
+        code = category_lookup.get(name.lower())
+        if code is not None: # Another spelling of a known category
+            return code
+        if len(categories) >= max_categories:
+            raise ValueError(f"No more than {max_categories} categories can be used")
+        code = len(categories)
+        categories.append(name)
+        category_codes[name] = code
+        category_lookup[name] = category_lookup[name.lower()] = code
+    return code
+
+# Builds a bytes.translate table from the codes of a category list written elsewhere, e.g. a file or another process,
+# to the codes used here. Names that are not known yet are added
+def category_table(names) -> bytes:
+    table = bytearray(range(256))
+    for code, name in enumerate(names):
+        table[code] = add_category(name)
+    return bytes(table)
+
+# Converts a price (int, float or numeric string) to a whole number of cents
+def to_cents(price: Union[int, float, str]) -> int:
+    return int((Decimal(str(price)) * 100).to_integral_value(ROUND_HALF_UP))
+
+# Formats a number of cents as price text with two decimal places e.g. 1250 -> 12.50
+def format_cents(cents: int) -> str:
+    sign = "-" if cents < 0 else ""
+    whole, part = divmod(abs(cents), 100)
+    return f"{sign}{whole}.{part:02d}"
+
+# Converts a date to the day number stored in the ledger, 0 means the row has no date
+def to_day(day: Union[date, None]) -> int:
+    return day.toordinal() if day is not None else 0
+
+# Formats a stored day number as YYYY-MM-DD, or an empty string for a row without a date
+def format_day(day: int) -> str:
+    return date.fromordinal(day).isoformat() if day else ""
+
+# In-memory column store holding the ledger rows. Each field is kept in its own column so no per-row objects are created.
+# Prices are whole cents in a 64 bit array, categories and cashflows are 1 byte codes, dates are day numbers (0 for none)
+# and names are interned strings
+class Ledger:
+    __slots__ = ("names", "prices", "categories", "cashflows", "dates", "sources", "source_names")
+    read_only = False # Mapped ledgers are read only and are copied before the first change
+
+    def __init__(self):
+        self.names = [] # One column per field, index n in each column makes up row n
+        self.prices = array('q')
+        self.categories = array('B')
+        self.cashflows = array('B')
+        self.dates = array('i') # date.toordinal() of each row, 0 when the row has no date
+        self.sources = array('H') # Index into source_names of the file a row was imported from
+        # Full path of each imported file, so files with the same name in different folders stay apart.
+        # Code 0 is used for rows that were added by hand or opened directly
+        self.source_names = [""]
+
+    # Number of rows in the ledger
+    def __len__(self):
+        return len(self.names)
+
+    # Appends a row that is already in stored form to the end of the ledger
+    def append_row(self, name: str, cents: int, category_code: int, cashflow_code: int, source_code: int = 0, day: int = 0):
+        self.names.append(sys.intern(name)) # Repeated names share a single string
+        self.prices.append(cents)
+        self.categories.append(category_code)
+        self.cashflows.append(cashflow_code)
+        self.dates.append(day)
+        self.sources.append(source_code)
+
+    # Inserts a row that is already in stored form before the given row, used when a removed row is restored
+    def insert_row(self, row: int, name: str, cents: int, category_code: int, cashflow_code: int, source_code: int = 0, day: int = 0):
+        self.names.insert(row, sys.intern(name))
+        self.prices.insert(row, cents)
+        self.categories.insert(row, category_code)
+        self.cashflows.insert(row, cashflow_code)
+        self.dates.insert(row, day)
+        self.sources.insert(row, source_code)
+
+    # Appends an Item object to the end of the ledger
+    def append(self, item: object):
+        self.append_row(item.name, to_cents(item.price), category_codes[item.category], cashflow_codes[item.cashflow],
+                        day=to_day(getattr(item, "date", None)))
+
+    # Appends a list of Item objects to the end of the ledger
+    def extend(self, items: list):
+        for item in items:
+            self.append(item)
+
+    # Appends every row of another ledger, the columns are copied in bulk
+    def extend_ledger(self, other: "Ledger"):
+        self.names.extend(other.names)
+        self.prices.extend(other.prices)
+        self.categories.extend(other.categories)
+        self.cashflows.extend(other.cashflows)
+        self.dates.extend(other.dates)
+
+        # Source codes are translated into this ledger's source names, unless both use the same codes
+        table = [self.source_code(source_name) for source_name in other.source_names]
+        if table == list(range(len(table))):
+            self.sources.extend(other.sources)
+        else:
+            self.sources.extend(table[code] for code in other.sources)
+
+    # Returns the code of a source file name, adding it if it is new
+    def source_code(self, source_name: str) -> int:
+        try:
+            return self.source_names.index(source_name)
+        except ValueError:
+            self.source_names.append(source_name)
+            return len(self.source_names) - 1
+
+    # Checks if any row came from an imported file, the table only shows the Source column when it did
+    def has_sources(self) -> bool:
+        return len(self.source_names) > 1
+
+    # Sets every row of the ledger to come from the file at source_name, used by the multi-file import
+    def set_source(self, source_name: str):
+        self.source_names = ["", source_name]
+        self.sources = array('H', [1]) * len(self)
+
+    # Returns a copy of the ledger, the name strings are shared and the number columns are copied in bulk
+    def copy(self) -> "Ledger":
+        ledger = Ledger()
+        ledger.extend_ledger(self)
+        return ledger
+
+    # Removes the row at the given index from every column
+    def remove(self, row: int):
+        del self.names[row]
+        del self.prices[row]
+        del self.categories[row]
+        del self.cashflows[row]
+        del self.dates[row]
+        del self.sources[row]
+
+    # Cuts the rows from first to the end off the ledger and returns them as a new ledger with the same source names
+    def split(self, first: int) -> "Ledger":
+        tail = Ledger()
+        tail.names = self.names[first:]
+        tail.prices = self.prices[first:]
+        tail.categories = self.categories[first:]
+        tail.cashflows = self.cashflows[first:]
+        tail.dates = self.dates[first:]
+        tail.sources = self.sources[first:]
+        tail.source_names = list(self.source_names)
+        del self.names[first:]
+        del self.prices[first:]
+        del self.categories[first:]
+        del self.cashflows[first:]
+        del self.dates[first:]
+        del self.sources[first:]
+        return tail
+
+    # Returns a new ledger holding the given rows in order, with the same source names
+    def take(self, rows) -> "Ledger":
+        ledger = Ledger()
+        ledger.names = [self.names[row] for row in rows]
+        ledger.prices = array('q', [self.prices[row] for row in rows])
+        ledger.categories = array('B', [self.categories[row] for row in rows])
+        ledger.cashflows = array('B', [self.cashflows[row] for row in rows])
+        ledger.dates = array('i', [self.dates[row] for row in rows])
+        ledger.sources = array('H', [self.sources[row] for row in rows])
+        ledger.source_names = list(self.source_names)
+        return ledger
+
+    # Removes every row from the ledger
+    def clear(self):
+        self.names.clear()
+        del self.prices[:]
+        del self.categories[:]
+        del self.cashflows[:]
+        del self.dates[:]
+        del self.sources[:]
+        self.source_names = [""]
+
+    # Returns the category name of a row
+    def category(self, row: int) -> str:
+        return categories[self.categories[row]]
+
+    # Returns the cashflow name of a row
+    def cashflow(self, row: int) -> str:
+        return cashflows[self.cashflows[row]]
+
+    # Returns the date of a row as YYYY-MM-DD, or an empty string
+    def date(self, row: int) -> str:
+        return format_day(self.dates[row])
+
+    # Returns the name of the file a row was imported from, without its folder, or an empty string
+    def source(self, row: int) -> str:
+        return os.path.basename(self.source_names[self.sources[row]])
+
+    # Returns the display text of a single cell
+    def cell(self, row: int, column: int) -> str:
+        if column == 0:
+            return self.names[row]
+        elif column == 1:
+            return format_cents(self.prices[row])
+        elif column == 2:
+            return categories[self.categories[row]]
+        elif column == 3:
+            return cashflows[self.cashflows[row]]
+        elif column == 4:
+            return format_day(self.dates[row])
+        else:
+            return self.source(row)
+
+    # Returns a row as a list of strings in Name,Price,Category,Cashflow order, with the Date last when the row has one.
+    # Undated rows keep the 4 field form so files without dates are written exactly as before
+    def row(self, row: int) -> list:
+        fields = [self.names[row], format_cents(self.prices[row]),
+                  categories[self.categories[row]], cashflows[self.cashflows[row]]]
+        if self.dates[row]:
+            fields.append(format_day(self.dates[row]))
+        return fields
+
+    # Yields every row in order, used when writing the ledger to a csv file
+    def rows(self):
+        for row in range(len(self)):
+            yield self.row(row)
@@ -0,0 +1,295 @@
+import re
+import sys
+
+from array import array
+from bisect import bisect_left, insort
+from itertools import islice
+
+from modules.ledger import categories, cashflows
+
+token_pattern = re.compile(r'\w+') # Words of a name that can be searched by prefix
+
+max_order_inserts = 64 # Appending more rows than this drops the sorted orders instead of inserting each row
+short_tail = 256 # Shorter runs of row numbers are renumbered in a list rather than by step_rows
+
+# Adds delta, 1 or -1, to the row numbers in rows[start:] that are greater than above.
+# The array is read as one big integer with a lane per row number, so the compare and add run in C over the whole
+# array instead of once per row in Python. Row numbers stay below the top bit of a lane, adding (top bit - 1 - above)
+# to a lane sets its top bit exactly when its row number is greater than above
+def step_rows(rows, above, delta, start=0):
+    count = len(rows) - start
+    if count <= 0:
+        return
+    bits = rows.itemsize * 8
+    ones = int.from_bytes((array(rows.typecode, [1]) * count).tobytes(), sys.byteorder)
+    lanes = int.from_bytes(memoryview(rows)[start:].tobytes(), sys.byteorder)
+    moved = ((lanes + ones * ((1 << (bits - 1)) - 1 - above)) >> (bits - 1)) & ones # 1 in each lane that moves
+    lanes = lanes + moved if delta > 0 else lanes - moved
+    rows[start:] = array(rows.typecode, lanes.to_bytes(count * rows.itemsize, sys.byteorder))
+
+# Removes row from the sorted array at mapping[key]. Returns True when the array is left empty and was deleted
+def remove_sorted(mapping, key, row) -> bool:
+    rows = mapping[key]
+    del rows[bisect_left(rows, row)]
+    if rows:
+        return False
+    del mapping[key]
+    return True
+
+# Inserts row into the sorted array at mapping[key]. Returns True when the array is new
+def insert_sorted(mapping, key, row) -> bool:
+    rows = mapping.get(key)
+    if rows is None:
+        mapping[key] = array('I', [row])
+        return True
+    rows.insert(bisect_left(rows, row), row)
+    return False
+
+# Search, filter and sort indexes over a ledger.
+#   postings     (category code, cashflow code) -> rows in ascending order
+#   groups       (name, category code, cashflow code) -> rows, names repeat so this is much smaller than the ledger
+#   name_keys    name -> the (category code, cashflow code) pairs it has a group for
+#   tokens       sorted lower case words of every name, searched by prefix with bisect
+#   orders       rows sorted by a column, built the first time the column is sorted
+# The indexes are built once and kept up to date as rows are appended, removed and inserted. A remove or insert patches
+# the arrays in place, renumbering the rows after it, so the index never has to be rebuilt from the ledger
+class Ledger_Index:
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.postings = {}
+        self.groups = {}
+        self.name_keys = {}
+        self.orders = {}
+        self.tokens = []
+        self.token_names = {}
+        self.indexed = 0 # Rows below this are in the index
+        self.add_rows(0, len(ledger))
+
+    # Indexes the rows first to end-1, used on build and after rows are appended to the ledger
+    def add_rows(self, first, end):
+        ledger = self.ledger
+        postings = self.postings
+        groups = self.groups
+        name_keys = self.name_keys
+        new_names = []
+        for row, name, category, cashflow in zip(range(first, end), islice(ledger.names, first, end),
+                                                 ledger.categories[first:end], ledger.cashflows[first:end]):
+            key = (category, cashflow)
+            rows = postings.get(key)
+            if rows is None:
+                rows = postings[key] = array('I')
+            rows.append(row)
+
+            rows = groups.get((name, category, cashflow))
+            if rows is None:
+                rows = groups[(name, category, cashflow)] = array('I')
+                keys = name_keys.get(name)
+                if keys is None:
+                    name_keys[name] = [key]
+                    new_names.append(name)
+                else:
+                    keys.append(key)
+            rows.append(row)
+
+        if new_names:
+            for name in new_names:
+                for token in token_pattern.findall(name.lower()):
+                    names = self.token_names.get(token)
+                    if names is None:
+                        self.token_names[token] = [name]
+                    else:
+                        names.append(name)
+            self.tokens = sorted(self.token_names)
+        self.indexed = end
+        if end - first <= max_order_inserts:
+            for row in range(first, end):
+                self.insert_order(row)
+        else:
+            self.orders.clear() # Sorted orders are rebuilt on the next sort
+
+    # Takes a row out of the index, runs before the row is removed from the ledger. The rows after it move up by one
+    def remove_row(self, row):
+        if row >= self.indexed: # Not indexed yet, the rows that are indexed keep their numbers
+            return
+        ledger = self.ledger
+        name, category, cashflow = ledger.names[row], ledger.categories[row], ledger.cashflows[row]
+        key = (category, cashflow)
+        remove_sorted(self.postings, key, row)
+        if remove_sorted(self.groups, (name, category, cashflow), row):
+            self.remove_group(name, key)
+        self.shift_rows(row + 1, -1)
+        for rows in self.orders.values():
+            del rows[rows.index(row)]
+            step_rows(rows, row, -1)
+        self.indexed -= 1
+
+    # Adds a row that was inserted into the ledger before the row that had its number, which moves down by one
+    def insert_row(self, row):
+        if row > self.indexed: # Added with the other rows that are not indexed yet
+            return
+        self.shift_rows(row, 1)
+        for rows in self.orders.values():
+            step_rows(rows, row - 1, 1)
+        ledger = self.ledger
+        name, category, cashflow = ledger.names[row], ledger.categories[row], ledger.cashflows[row]
+        key = (category, cashflow)
+        insert_sorted(self.postings, key, row)
+        if insert_sorted(self.groups, (name, category, cashflow), row):
+            self.add_group(name, key)
+        self.indexed += 1
+        self.insert_order(row)
+
+    # Takes the rows from first to the end out of the index, runs when they are cut off the ledger
+    def remove_rows_from(self, first):
+        if first >= self.indexed:
+            return
+        for key, rows in list(self.postings.items()):
+            del rows[bisect_left(rows, first):]
+            if not rows:
+                del self.postings[key]
+        for (name, category, cashflow), rows in list(self.groups.items()):
+            if rows[-1] >= first:
+                del rows[bisect_left(rows, first):]
+                if not rows:
+                    del self.groups[(name, category, cashflow)]
+                    self.remove_group(name, (category, cashflow))
+        for column, rows in self.orders.items():
+            self.orders[column] = array('I', [row for row in rows if row < first])
+        self.indexed = first
+
+    # Adds delta to the row numbers from first on in every posting and group, each array is sorted so only its tail moves
+    def shift_rows(self, first, delta):
+        for mapping in (self.postings, self.groups):
+            for rows in mapping.values():
+                if rows[-1] >= first:
+                    position = bisect_left(rows, first)
+                    if len(rows) - position < short_tail: # Most groups are a few rows, a list is quicker to set up
+                        rows[position:] = array('I', [row + delta for row in rows[position:]])
+                    else:
+                        step_rows(rows, first - 1, delta, position)
+
+    # Records a new (name, category, cashflow) group of a name, adding the name's words when it is a new name
+    def add_group(self, name, key):
+        keys = self.name_keys.get(name)
+        if keys is not None:
+            keys.append(key)
+            return
+        self.name_keys[name] = [key]
+        for token in token_pattern.findall(name.lower()):
+            names = self.token_names.get(token)
+            if names is None:
+                self.token_names[token] = [name]
+                insort(self.tokens, token)
+            else:
+                names.append(name)
+
+    # Forgets an emptied group of a name, and the name's words once it has no groups left
+    def remove_group(self, name, key):
+        keys = self.name_keys[name]
+        keys.remove(key)
+        if keys:
+            return
+        del self.name_keys[name]
+        for token in token_pattern.findall(name.lower()):
+            names = self.token_names[token]
+            names.remove(name)
+            if not names:
+                del self.token_names[token]
+                del self.tokens[bisect_left(self.tokens, token)]
+
+    # Puts a row into the sorted orders built so far, at its place by the column and then by row
+    def insert_order(self, row):
+        for column, rows in self.orders.items():
+            row_key = self.order_key(column)
+            value = row_key(row)
+            low, high = 0, len(rows)
+            while low < high:
+                middle = (low + high) // 2
+                if row_key(rows[middle]) < value:
+                    low = middle + 1
+                else:
+                    high = middle
+            rows.insert(low, row)
+
+    # Returns a function that gives the place of a row in the order of a column, ties are kept in row order
+    def order_key(self, column):
+        if column == 0: # Names are ordered without case and then by spelling, see order
+            names = self.ledger.names
+            return lambda row: (names[row].lower(), names[row], row)
+        sort_key = self.sort_key(column)
+        return lambda row: (sort_key(row), row)
+
+    # Returns the set of names that have a word starting with prefix
+    def names_with_prefix(self, prefix):
+        names = set()
+        position = bisect_left(self.tokens, prefix)
+        while position < len(self.tokens) and self.tokens[position].startswith(prefix):
+            names.update(self.token_names[self.tokens[position]])
+            position += 1
+        return names
+
+    # Returns the rows matching every search word and the category/cashflow codes in ascending row order,
+    # or None when nothing is filtered
+    def filter_rows(self, text="", category=None, cashflow=None):
+        words = token_pattern.findall(text.lower())
+        if words: # Names are matched first, only the rows of matching names are looked at
+            names = self.names_with_prefix(words[0])
+            for word in words[1:]:
+                names &= self.names_with_prefix(word)
+            rows = array('I')
+            for name in names: # Whole groups are kept or skipped, the rows themselves are not looked at
+                for key_category, key_cashflow in self.name_keys[name]:
+                    if (category is None or key_category == category) and (cashflow is None or key_cashflow == cashflow):
+                        rows.extend(self.groups[(name, key_category, key_cashflow)])
+            return array('I', sorted(rows))
+
+        if category is None and cashflow is None:
+            return None
+        runs = [rows for (key_category, key_cashflow), rows in self.postings.items()
+                if (category is None or key_category == category) and (cashflow is None or key_cashflow == cashflow)]
+        if len(runs) == 1:
+            return array('I', runs[0])
+        return array('I', sorted(row for rows in runs for row in rows)) # Merges the already sorted runs
+
+    # Returns a function that gives the sort key of a row for a column
+    def sort_key(self, column):
+        ledger = self.ledger
+        if column == 0:
+            return lambda row: ledger.names[row].lower()
+        elif column == 1:
+            return ledger.prices.__getitem__
+        elif column == 2:
+            return lambda row: categories[ledger.categories[row]]
+        elif column == 3:
+            return lambda row: cashflows[ledger.cashflows[row]]
+        elif column == 4:
+            return ledger.dates.__getitem__
+        return ledger.source
+
+    # Returns every row sorted by a column. Name order is built from the distinct names rather than every row
+    def order(self, column):
+        rows = self.orders.get(column)
+        if rows is None:
+            if column == 0:
+                rows = array('I')
+                for name in sorted(self.name_keys, key=lambda name: (name.lower(), name)):
+                    rows.extend(sorted(row for key in self.name_keys[name] for row in self.groups[(name,) + key]))
+            else:
+                rows = array('I', sorted(range(len(self.ledger)), key=self.sort_key(column)))
+            self.orders[column] = rows
+        return rows
+
+    # Sorts filtered rows (or every row when rows is None) by a column
+    def sort_rows(self, rows, column, descending=False):
+        if rows is None:
+            ordered = self.order(column)
+        elif len(rows) * 8 < len(self.ledger): # Few rows, they are sorted directly
+            ordered = sorted(rows, key=self.sort_key(column))
+        else: # Many rows, the full column order is walked and the filtered rows are kept
+            mask = bytearray(len(self.ledger))
+            for row in rows:
+                mask[row] = 1
+            ordered = [row for row in self.order(column) if mask[row]]
+        if descending:
+            ordered = reversed(ordered)
+        return array('I', ordered)
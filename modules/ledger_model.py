@@ -0,0 +1,237 @@
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex, QThreadPool
+
+from array import array
+from bisect import bisect_left
+
+from modules.ledger import Ledger, headers, source_header
+from modules.ledger_index import Ledger_Index
+from modules.csv_loader import Index_Task
+
+# Table model that serves cells straight out of a Ledger column store.
+# The view only asks for the rows that are visible so no widget item is created per row.
+# Searching, filtering and sorting map the rows of the view to ledger rows through self.view, looked up in a Ledger_Index
+class Ledger_Model(QAbstractTableModel):
+    def __init__(self, ledger: Ledger = None, parent=None):
+        super().__init__(parent)
+        self.ledger = ledger if ledger is not None else Ledger()
+        self.search_index = None # Built on a worker thread after a load, or the first time the rows are searched or sorted
+        self.index_task = None # Index_Task building search_index
+        self.view = None # Ledger rows in view order, None shows every row in ledger order
+        self.search_text = ""
+        self.category_filter = None
+        self.cashflow_filter = None
+        self.sort_column = -1
+        self.sort_order = Qt.AscendingOrder
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid(): # Table models have no child rows
+            return 0
+        return len(self.view) if self.view is not None else len(self.ledger)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(headers) + 1 if self.ledger.has_sources() else len(headers) # Source column only for imported files
+
+    # Returns the cell text only when the view asks for it
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return self.ledger.cell(self.source_row(index.row()), index.column())
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return headers[section] if section < len(headers) else source_header
+        return str(self.source_row(section) + 1) # Ledger row numbers down the vertical header
+
+    # Qt calls this when a header is clicked. A column of -1 returns the rows to ledger order
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self.beginResetModel()
+        self.update_view()
+        self.endResetModel()
+
+    # Shows only the rows whose name has words starting with each word of text and that match the category/cashflow codes
+    def set_filter(self, text="", category=None, cashflow=None):
+        self.search_text = text
+        self.category_filter = category
+        self.cashflow_filter = cashflow
+        self.beginResetModel()
+        self.update_view()
+        self.endResetModel()
+
+    # Shows every row in ledger order again
+    def clear_view(self):
+        self.search_text = ""
+        self.category_filter = self.cashflow_filter = None
+        self.sort_column = -1
+        self.beginResetModel()
+        self.view = None
+        self.endResetModel()
+
+    # Starts building the index of the ledger on a worker thread, e.g. when a file has loaded, or indexing the rows
+    # appended since it was last used. The index is handed to the task and only used again once the task is done
+    def build_index_in_background(self):
+        index = self.search_index
+        if self.index_task is not None or len(self.ledger) <= (index.indexed if index is not None else 0):
+            return
+        self.search_index = None
+        self.index_task = Index_Task(self.ledger, index)
+        QThreadPool.globalInstance().start(self.index_task)
+
+    # Waits for the index being built on a worker thread and keeps it. It covers the rows the ledger had when the build
+    # started, rows appended since are added by ledger_index
+    def finish_index_task(self):
+        task = self.index_task
+        if task is None:
+            return
+        self.index_task = None
+        task.done.wait()
+        if task.index is not None and self.search_index is None:
+            task.index.ledger = self.ledger # make_writable may have swapped in a copy of the same rows
+            self.search_index = task.index
+
+    # Returns the index of the ledger, building it or adding the rows appended since it was last used
+    def ledger_index(self):
+        self.finish_index_task()
+        if self.search_index is None:
+            self.search_index = Ledger_Index(self.ledger)
+        elif self.search_index.indexed < len(self.ledger):
+            self.search_index.add_rows(self.search_index.indexed, len(self.ledger))
+        return self.search_index
+
+    # Works out the ledger rows shown by the view from the filter and sort. Callers reset the model around it
+    def update_view(self):
+        if not self.search_text.strip() and self.category_filter is None and self.cashflow_filter is None and self.sort_column < 0:
+            self.view = None
+            return
+        index = self.ledger_index()
+        rows = index.filter_rows(self.search_text, self.category_filter, self.cashflow_filter)
+        if self.sort_column >= 0:
+            rows = index.sort_rows(rows, self.sort_column, self.sort_order == Qt.DescendingOrder)
+        self.view = rows
+
+    # Returns the ledger row shown at a row of the view
+    def source_row(self, row: int) -> int:
+        return self.view[row] if self.view is not None else row
+
+    # Swaps a read only ledger for an in-memory copy before it is changed. The rows are the same so the view is not reset
+    def make_writable(self):
+        if self.ledger.read_only:
+            self.ledger = self.ledger.copy()
+            if self.search_index is not None:
+                self.search_index.ledger = self.ledger
+
+    # Adds a single Item object to the end of the model. A filtered or sorted view shows it at the bottom
+    def append_item(self, item: object):
+        self.make_writable()
+        row = len(self.ledger)
+        view_row = len(self.view) if self.view is not None else row
+        self.beginInsertRows(QModelIndex(), view_row, view_row)
+        self.ledger.append(item)
+        if self.view is not None:
+            self.view.append(row)
+        self.endInsertRows()
+
+    # Adds a chunk of rows with one insert notification
+    def append_ledger(self, chunk: Ledger):
+        if not len(chunk):
+            return
+        self.make_writable()
+        # The Source column appears or the new rows have to be filtered and sorted, so the whole view is reset
+        if self.view is not None or (chunk.has_sources() and not self.ledger.has_sources()):
+            self.beginResetModel()
+            self.ledger.extend_ledger(chunk)
+            self.update_view()
+            self.endResetModel()
+            return
+        first = len(self.ledger)
+        self.beginInsertRows(QModelIndex(), first, first + len(chunk) - 1)
+        self.ledger.extend_ledger(chunk)
+        self.endInsertRows()
+
+    # Removes the row shown at a row of the view and returns the ledger row it was
+    def remove_row(self, row: int) -> int:
+        source = self.source_row(row)
+        self.remove_ledger_row(source)
+        return source
+
+    # Returns the row of the view showing a ledger row, or None when the row is filtered out
+    def view_row(self, source: int):
+        if self.view is None:
+            return source
+        try:
+            return self.view.index(source)
+        except ValueError:
+            return None
+
+    # Removes a ledger row, e.g. when an add is undone
+    def remove_ledger_row(self, source: int):
+        self.finish_index_task() # The worker reads the rows, so none are moved while it runs
+        self.make_writable()
+        row = self.view_row(source)
+        if row is None: # Not shown, the rows of the view are renumbered without removing one
+            self.layoutAboutToBeChanged.emit()
+        else:
+            self.beginRemoveRows(QModelIndex(), row, row)
+        if self.search_index is not None: # Reads the row, so it runs before the remove
+            self.search_index.remove_row(source)
+        self.ledger.remove(source)
+        if self.view is not None: # The ledger rows after the removed one move up by one
+            self.view = array('I', [other - (other > source) for other in self.view if other != source])
+        if row is None:
+            self.layoutChanged.emit()
+        else:
+            self.endRemoveRows()
+
+    # Puts a row back into the ledger before ledger row source, e.g. when a remove is undone or an add is redone.
+    # A filtered view shows it in ledger order, a sorted view at the bottom
+    def insert_ledger_row(self, source: int, name: str, cents: int, category_code: int, cashflow_code: int, source_code: int = 0, day: int = 0):
+        self.finish_index_task()
+        self.make_writable()
+        if self.view is None:
+            row = source
+        else:
+            self.view = array('I', [other + (other >= source) for other in self.view])
+            row = bisect_left(self.view, source) if self.sort_column < 0 else len(self.view)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.ledger.insert_row(source, name, cents, category_code, cashflow_code, source_code, day)
+        if self.view is not None:
+            self.view.insert(row, source)
+        if self.search_index is not None:
+            self.search_index.insert_row(source)
+        self.endInsertRows()
+
+    # Cuts the ledger rows from first to the end off the model and returns them as a Ledger, e.g. to undo an import
+    def split_rows(self, first: int) -> Ledger:
+        self.finish_index_task()
+        self.make_writable()
+        if self.view is None:
+            self.beginRemoveRows(QModelIndex(), first, len(self.ledger) - 1)
+        else:
+            self.beginResetModel()
+        tail = self.ledger.split(first)
+        if self.view is None:
+            self.endRemoveRows()
+        else:
+            self.view = array('I', [row for row in self.view if row < first])
+            self.endResetModel()
+        if self.search_index is not None:
+            self.search_index.remove_rows_from(first)
+        return tail
+
+    # Swaps in a new ledger, e.g. when a file is opened. The view is reset once instead of per row
+    def set_ledger(self, ledger: Ledger):
+        self.beginResetModel()
+        self.ledger = ledger
+        self.search_index = None
+        self.index_task = None # A build still running for the old ledger is left to finish and dropped
+        self.update_view()
+        self.endResetModel()
+
+    # Removes every row from the model
+    def clear(self):
+        self.set_ledger(Ledger())
@@ -0,0 +1,54 @@
+import os
+
+from array import array
+
+from modules import core
+from modules.ledger import Ledger, categories, add_category, category_table
+
+# Parses and validates many ledger files in a process pool and merges them into one ledger.
+# Each worker returns its file as a compact Ledger of typed columns so only the arrays and the names cross process boundaries
+
+# Worker run in a separate process. known_categories are the categories of the parent process, added first so the
+# worker gives them the same codes. Returns the path, the file's rows as a Ledger tagged with its full path, its Row_Error
+# list and the worker's categories, which can have grown with categories found in the file
+def parse_file(file_path, rules=None, known_categories=()):
+    for category in known_categories:
+        add_category(category)
+    ledger, errors = core.read_ledger(file_path, rules)
+    if ledger.read_only: # Mapped ledgers cannot be sent between processes, the columns are copied out
+        ledger = ledger.copy()
+    ledger.set_source(os.path.abspath(file_path)) # Statements with the same name in different folders are different sources
+    return file_path, ledger, errors, list(categories)
+
+# Imports every file and returns the merged Ledger, in the order the files were given, and {path: Row_Error list}.
+# progress(done, total) is called as each file finishes. start_method picks the multiprocessing start method, e.g. spawn.
+# rules categorize csv rows without a category
+def import_files(file_paths, workers=None, progress=None, start_method=None, rules=None):
+    import multiprocessing # Only loaded when an import runs
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    results = {}
+    if len(file_paths) == 1: # A single file is parsed in this process instead of starting a pool
+        _, ledger, errors, _ = parse_file(file_paths[0], rules)
+        results[file_paths[0]] = (ledger, errors)
+        if progress is not None:
+            progress(1, 1)
+    else:
+        workers = min(workers or os.cpu_count() or 1, len(file_paths))
+        context = multiprocessing.get_context(start_method)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [executor.submit(parse_file, file_path, rules, list(categories)) for file_path in file_paths]
+            for done, future in enumerate(as_completed(futures), start=1):
+                file_path, ledger, errors, worker_categories = future.result()
+                if worker_categories != categories[:len(worker_categories)]: # The worker added categories of its own
+                    ledger.categories = array('B', bytes(ledger.categories).translate(category_table(worker_categories)))
+                results[file_path] = (ledger, errors)
+                if progress is not None:
+                    progress(done, len(file_paths))
+
+    merged = Ledger()
+    errors = {}
+    for file_path in file_paths:
+        ledger, errors[file_path] = results[file_path]
+        merged.extend_ledger(ledger)
+    return merged, errors
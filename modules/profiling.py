@@ -0,0 +1,92 @@
+import json
+import time
+
+from functools import wraps
+
+from modules import config
+
+# Timing counters and latency histograms for the hot paths, switched on with MONEY_TRACKER_INSTRUMENT=1.
+# When it is off timed() hands back the function it was given, so the decorated code runs exactly as before
+enabled = config.instrument
+
+# Call count, total/max time and a histogram of one timed function. Bucket n counts the calls that took
+# from 2**(n-1) up to 2**n nanoseconds
+class Stat:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = [0] * 64
+
+    def add(self, nanoseconds: int):
+        self.count += 1
+        self.total += nanoseconds
+        if nanoseconds > self.max:
+            self.max = nanoseconds
+        self.buckets[min(nanoseconds.bit_length(), 63)] += 1
+
+    # Returns the stat as a JSON ready dict, times in microseconds and the histogram keyed by each bucket's upper bound in ns
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_us": round(self.total / 1000, 1),
+            "mean_us": round(self.total / self.count / 1000, 3) if self.count else 0,
+            "max_us": round(self.max / 1000, 1),
+            "histogram_ns": {str(1 << bucket): calls for bucket, calls in enumerate(self.buckets) if calls},
+        }
+
+stats = {} # name -> Stat
+
+# Decorator that records the run time of a function under name. Returns the function unchanged when instrumentation is off
+def timed(name: str):
+    def decorate(function):
+        if not enabled:
+            return function
+        stat = stats.setdefault(name, Stat())
+        clock = time.perf_counter_ns
+
+        @wraps(function) # Keeps the signature so Qt passes the same signal arguments to a decorated slot
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stat.add(clock() - start)
+        return wrapper
+    return decorate
+
+# Returns every stat as a dict, e.g. for the debug dialog or a JSON dump
+def snapshot() -> dict:
+    return {name: stat.as_dict() for name, stat in sorted(stats.items()) if stat.count}
+
+# Writes the stats to a JSON file
+def dump(path: str):
+    with open(path, mode='w', encoding='utf-8') as file:
+        json.dump({"enabled": enabled, "stats": snapshot()}, file, indent=2)
+
+# Sets every stat back to zero. The Stat objects are kept as the wrappers hold on to them
+def reset():
+    for stat in stats.values():
+        stat.clear()
+
+# Runs function under cProfile when MONEY_TRACKER_PROFILE is set and writes the stats file when it returns or raises,
+# and dumps the timings to MONEY_TRACKER_STATS. Returns the function's result
+def run_session(function, *args):
+    profiler = None
+    if config.profile_path:
+        import cProfile # Only loaded when a session is profiled
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        return function(*args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(config.profile_path)
+        if enabled and config.stats_path:
+            dump(config.stats_path)
@@ -0,0 +1,78 @@
+import json
+import os
+import time
+
+from modules import config
+from modules.binary_ledger import Mapped_Ledger, write_binary
+from modules.ledger import Ledger
+
+# Autosaved copies of unsaved ledgers. Each window writes its rows to a .mtl file in config.recovery_folder next to a
+# .json note naming the file it was editing. A clean close deletes both, so the files found when the program starts
+# were left by a session that crashed or was killed
+recovery_suffix = ".mtl"
+note_suffix = ".json"
+
+# Returns the recovery file of a window, named after the process so running sessions do not offer each other's files
+def recovery_path(window_id) -> str:
+    return os.path.join(config.recovery_folder, f"{os.getpid()}-{window_id}{recovery_suffix}")
+
+def note_path(path) -> str:
+    return path[:-len(recovery_suffix)] + note_suffix
+
+# Writes a snapshot of the ledger and a note with the file it belongs to, "" for an untitled ledger
+def write_recovery(path, ledger, file_path=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_binary(path, ledger) # Temp file and rename, a crash mid write keeps the previous autosave
+    note = note_path(path)
+    with open(note + ".tmp", mode='w', encoding='utf-8') as file:
+        json.dump({"file": file_path, "time": time.time(), "rows": len(ledger)}, file)
+    os.replace(note + ".tmp", note)
+
+# Deletes a recovery file and its note, e.g. after the changes have been saved
+def discard_recovery(path):
+    for file_path in (path, note_path(path)):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+# Checks if the process that wrote a recovery file is still running. Only POSIX can check another process,
+# elsewhere every file from another process is treated as left over
+def is_running(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    if os.name != "posix":
+        return False
+    try:
+        os.kill(pid, 0) # Signal 0 checks the process exists without signalling it
+    except ProcessLookupError:
+        return False
+    except PermissionError: # Exists but belongs to another user
+        return True
+    return True
+
+# Returns [(recovery path, note)] for the recovery files left by sessions that are no longer running, newest first
+def find_recoveries() -> list:
+    try:
+        names = os.listdir(config.recovery_folder)
+    except FileNotFoundError:
+        return []
+
+    recoveries = []
+    for name in names:
+        pid, _, rest = name.partition("-")
+        if not name.endswith(recovery_suffix) or not pid.isdigit() or not rest or is_running(int(pid)):
+            continue
+        path = os.path.join(config.recovery_folder, name)
+        try:
+            with open(note_path(path), mode='r', encoding='utf-8') as file:
+                note = json.load(file)
+        except (OSError, ValueError): # The note is written after the rows, a crash in between leaves no note
+            note = {"file": "", "time": os.path.getmtime(path), "rows": None}
+        recoveries.append((path, note))
+    recoveries.sort(key=lambda recovery: recovery[1].get("time", 0), reverse=True)
+    return recoveries
+
+# Reads a recovery file into an in-memory Ledger. The mapping is released on return so the file can be deleted straight away
+def load_recovery(path) -> Ledger:
+    return Mapped_Ledger(path).copy()
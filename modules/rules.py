@@ -0,0 +1,144 @@
+import csv
+import os
+import re
+
+from typing import NamedTuple
+
+from modules import config
+from modules.ledger import categories, add_category, cashflow_codes, builtin_category_count
+from modules.user_categories import remember_categories
+
+# Rules that pick the category and cashflow of a row from its name, used for bank exports that have no categories.
+# A rules file has one rule per line, Pattern,Category,Cashflow
+#
+#   tesco,Groceries,Expenditure         keyword, matches names containing the word(s) in any case
+#   /^salary\b/,Wages,Income            regular expression between slashes, case insensitive
+#   pure gym,Fitness,Expenditure        categories that are not built in are added to the category list
+#
+# Blank lines and lines starting with # are skipped. Regular expressions are tried first in the order they are listed,
+# then the keywords. When several keywords match, the one that starts first in the name wins, then the longest
+
+# A rule that could not be read, with its line number in the rules file
+class Rule_Error(ValueError):
+    def __init__(self, path, line, message):
+        super().__init__(f"{os.path.basename(path)} line {line}: {message}")
+
+class Rule(NamedTuple):
+    pattern: str # Keyword or regular expression text
+    category: int # Category code
+    cashflow: int # Cashflow code
+    regex: bool
+
+# Builds one regex for a set of lower case keywords, shaped like a trie so keywords sharing a prefix share the
+# work of matching it. A space in a keyword matches any run of whitespace
+def trie_pattern(keywords) -> str:
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {} # Marks the end of a keyword
+
+    def node_pattern(node):
+        branches = [(r"\s+" if char == " " else re.escape(char)) + node_pattern(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{pattern})?" if "" in node else pattern # Greedy, so the longer keyword is tried first
+
+    return node_pattern(trie)
+
+missing = object() # Marks a name that is not in the cache, None is cached for names no rule matches
+
+# Compiled rules. Every keyword is matched by a single combined regex and the result for each distinct name is cached,
+# names repeat a lot in statements so most rows are a dict lookup
+class Rules:
+    cache_size = 100000 # The cache is emptied when it reaches this many names, e.g. statements with a reference in every name
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.regexes = [(re.compile(rule.pattern, re.IGNORECASE), (rule.category, rule.cashflow)) for rule in self.rules if rule.regex]
+        self.keywords = {}
+        for rule in self.rules:
+            if not rule.regex:
+                self.keywords.setdefault(normalize(rule.pattern), (rule.category, rule.cashflow)) # The first of a repeated keyword wins
+        self.keyword_pattern = None
+        if self.keywords: # Keywords only match whole words, the lookarounds also work for keywords ending in punctuation.
+            # Names are lower cased before the search, which is about twice as fast as a case insensitive regex
+            self.keyword_pattern = re.compile(r"(?<!\w)" + trie_pattern(self.keywords) + r"(?!\w)")
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.rules)
+
+    # The cache is rebuilt by each process, so it is left out when the rules are sent to import workers
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["cache"] = {}
+        return state
+
+    # Returns (category code, cashflow code) for a name, or None when no rule matches
+    def match(self, name: str):
+        result = self.cache.get(name, missing)
+        if result is not missing:
+            return result
+        result = None
+        for regex, codes in self.regexes:
+            if regex.search(name):
+                result = codes
+                break
+        else:
+            if self.keyword_pattern is not None:
+                found = self.keyword_pattern.search(name.lower())
+                if found:
+                    keyword = found.group()
+                    result = self.keywords.get(keyword) or self.keywords[normalize(keyword)] # Only keywords with spaces need normalizing
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[name] = result
+        return result
+
+# Lower case with single spaces, the form keywords are stored and looked up in
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+# Reads a rules file. Raises Rule_Error for a line that is not a valid rule
+def load_rules(path) -> Rules:
+    cashflow_lookup = {cashflow.lower(): code for cashflow, code in cashflow_codes.items()}
+    rules = []
+    with open(path, mode='r', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        for row in reader:
+            if not any(field.strip() for field in row) or row[0].lstrip().startswith("#"):
+                continue
+            line = reader.line_num
+            if len(row) != 3:
+                raise Rule_Error(path, line, "Expected 3 fields: Pattern,Category,Cashflow")
+            pattern, category, cashflow = (field.strip() for field in row)
+            cashflow_code = cashflow_lookup.get(cashflow.lower())
+            if cashflow_code is None:
+                raise Rule_Error(path, line, f"'{cashflow}' - Expected: Income or Expenditure")
+            regex = len(pattern) > 2 and pattern.startswith("/") and pattern.endswith("/")
+            if regex:
+                pattern = pattern[1:-1]
+                try:
+                    re.compile(pattern)
+                except re.error as error:
+                    raise Rule_Error(path, line, f"'{pattern}' - {error}")
+            elif not normalize(pattern):
+                raise Rule_Error(path, line, "Expected a keyword or /regular expression/")
+            try:
+                category_code = add_category(category)
+            except ValueError as error:
+                raise Rule_Error(path, line, str(error))
+            rules.append(Rule(pattern, category_code, cashflow_code, regex))
+    # Categories the rules add are remembered, so rows saved with them load without this rules file
+    remember_categories(categories[rule.category] for rule in rules if rule.category >= builtin_category_count)
+    return Rules(rules)
+
+# Loads the rules file named by MONEY_TRACKER_RULES, None when there is no rules file
+def default_rules():
+    if not os.path.exists(config.rules_path):
+        return None
+    return load_rules(config.rules_path)
@@ -0,0 +1,254 @@
+import os
+import sqlite3
+
+from array import array
+from datetime import date
+from urllib.parse import quote
+
+from modules.ledger import Ledger, categories, cashflows, cashflow_codes, add_category, format_day
+from modules.totals import Totals
+from modules.time_index import period_start, next_period, period_label
+
+# SQLite ledger storage (.db). Rows live in a single table and are changed one row at a time, so saving an edit to a
+# large ledger writes a few pages instead of the whole file. Totals and date ranges are answered by indexed queries
+database_suffixes = (".db", ".sqlite", ".sqlite3")
+
+table_schema = """
+CREATE TABLE IF NOT EXISTS rows (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    cents INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    cashflow TEXT NOT NULL,
+    day TEXT
+)
+"""
+# The category index holds the cents too so totals are read from the index alone. The date index skips undated rows
+indexes = {
+    "rows_category": "CREATE INDEX IF NOT EXISTS rows_category ON rows (category, cashflow, cents)",
+    "rows_cashflow": "CREATE INDEX IF NOT EXISTS rows_cashflow ON rows (cashflow)",
+    "rows_day": "CREATE INDEX IF NOT EXISTS rows_day ON rows (day) WHERE day IS NOT NULL",
+}
+insert_row = "INSERT INTO rows (name, cents, category, cashflow, day) VALUES (?, ?, ?, ?, ?)"
+select_fields = "SELECT name, cents, category, cashflow, day FROM rows WHERE id = ?"
+sqlite_header = b"SQLite format 3\x00"
+row_columns = {"id", "name", "cents", "category", "cashflow", "day"}
+
+# Checks if a path is a SQLite ledger based on its extension
+def is_database(path):
+    return path.lower().endswith(database_suffixes)
+
+# Checks if a database file is new, empty or a SQLite database without tables, so the rows table can be created in it.
+# SQLite reads a short file of any other content as an empty database
+def is_empty_database(path) -> bool:
+    try:
+        with open(path, mode='rb') as file:
+            header = file.read(len(sqlite_header))
+    except FileNotFoundError:
+        return True
+    return not header or header == sqlite_header
+
+# Yields the rows of a ledger as insert parameters. Dates are stored as YYYY-MM-DD text, NULL when the row has none
+def insert_parameters(ledger):
+    for name, cents, category, cashflow, day in zip(ledger.names, ledger.prices, ledger.categories, ledger.cashflows, ledger.dates):
+        yield name, cents, categories[category], cashflows[cashflow], format_day(day) if day else None
+
+# Ledger stored in a SQLite database. self.ids holds the row id of each ledger row in order once the rows are loaded
+# or written, so a remove of ledger row n deletes the database row ids[n].
+# read_only opens the file without changing it, for commands that only read. Otherwise a new or empty database gets the
+# rows table and indexes, and is switched to WAL. Either way a database without the rows table raises ValueError
+class SQLite_Store:
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.ids = None
+        if read_only: # mode=ro never creates the file or writes to it
+            self.connection = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True)
+        else:
+            self.connection = sqlite3.connect(path)
+        try:
+            self.check_schema(read_only)
+            if not read_only:
+                self.connection.execute("PRAGMA journal_mode=WAL") # Readers are not blocked while a save writes
+                self.connection.execute("PRAGMA synchronous=NORMAL") # WAL stays consistent after a crash without a sync per commit
+                with self.connection:
+                    self.connection.execute(table_schema)
+                    self.create_indexes()
+        except BaseException:
+            self.connection.close()
+            raise
+
+    # Raises ValueError unless the database has the rows table, or is still empty and is opened for writing.
+    # Reading the schema also raises sqlite3.DatabaseError when the file is not a SQLite database
+    def check_schema(self, read_only):
+        columns = {column[1] for column in self.connection.execute("PRAGMA table_info(rows)")}
+        if columns:
+            if not row_columns <= columns:
+                raise ValueError(f"{os.path.basename(self.path)} is not a Money Tracker database, its rows table has other columns")
+            return
+        tables = self.connection.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0]
+        if read_only or tables or not is_empty_database(self.path):
+            raise ValueError(f"{os.path.basename(self.path)} is not a Money Tracker database, it has no rows table")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def create_indexes(self):
+        for statement in indexes.values():
+            self.connection.execute(statement)
+
+    # Deletes every row. The indexes are dropped too, building them once after a bulk insert is faster than
+    # updating them per row, so callers recreate them with create_indexes in the same transaction
+    def delete_all(self):
+        if not self.connection.in_transaction: # sqlite3 only opens a transaction by itself before a data change
+            self.connection.execute("BEGIN")
+        for index in indexes:
+            self.connection.execute(f"DROP INDEX IF EXISTS {index}")
+        self.connection.execute("DELETE FROM rows")
+
+    # Number of rows in the database, counted without reading them
+    def count(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    # Yields (id, name, cents, category code, cashflow code, day) for every row in id order as the cursor reads them,
+    # so the rows are never all in memory
+    def iter_rows(self):
+        days = {None: 0} # Dates repeat so each one is parsed once
+        cursor = self.connection.execute("SELECT id, name, cents, category, cashflow, day FROM rows ORDER BY id")
+        row_id = None
+        try:
+            for row_id, name, cents, category, cashflow, day in cursor:
+                if type(name) is not str or type(cents) is not int:
+                    raise TypeError(f"name {name!r}, cents {cents!r}")
+                day_number = days.get(day)
+                if day_number is None:
+                    day_number = days[day] = date.fromisoformat(day).toordinal()
+                yield row_id, name, cents, add_category(category), cashflow_codes[cashflow], day_number
+        except (KeyError, TypeError, AttributeError, OverflowError, ValueError) as error: # A row another program wrote
+            raise ValueError(f"{os.path.basename(self.path)}: row id {row_id} could not be read ({error!r})") from None
+
+    # Reads every row into a Ledger in id order
+    def load(self) -> Ledger:
+        ledger = Ledger()
+        ids = array('q')
+        append_row = ledger.append_row
+        add_id = ids.append
+        for row_id, name, cents, category, cashflow, day in self.iter_rows():
+            append_row(name, cents, category, cashflow, day=day)
+            add_id(row_id)
+        self.ids = ids
+        return ledger
+
+    # Inserts the rows of a ledger after the existing rows with one executemany, callers wrap it in a transaction
+    def insert_rows(self, ledger):
+        self.connection.executemany(insert_row, insert_parameters(ledger)) # Rows are streamed from the columns, no list is built
+        self.ids = None # The new ids are read back by load_ids when needed
+
+    # Reads the row ids in ledger order
+    def load_ids(self):
+        self.ids = array('q', (row_id for row_id, in self.connection.execute("SELECT id FROM rows ORDER BY id")))
+
+    # Replaces every row with the rows of a ledger, used for Save As and full saves
+    def replace(self, ledger):
+        with self.connection: # A failed write leaves the old rows and indexes in place
+            self.delete_all()
+            self.insert_rows(ledger)
+            self.create_indexes()
+        self.load_ids()
+
+    # Applies journal style changes, ["add", name, cents, category, cashflow, optional date] or ["remove", row, fields],
+    # as single row inserts and deletes in one transaction. Raises ValueError and changes nothing when a removed row
+    # does not hold the fields of the entry
+    def apply_changes(self, changes):
+        if self.ids is None:
+            self.load_ids()
+        ids = self.ids
+        try:
+            with self.connection:
+                for change in changes:
+                    if change[0] == "add":
+                        _, name, cents, category, cashflow, *day = change
+                        cursor = self.connection.execute(insert_row, (name, cents, category, cashflow, day[0] if day else None))
+                        ids.append(cursor.lastrowid)
+                        continue
+                    row = change[1]
+                    if not 0 <= row < len(ids):
+                        raise ValueError(f"Row {row + 1} is not the row that was removed")
+                    if len(change) > 2:
+                        stored = self.connection.execute(select_fields, (ids[row],)).fetchone()
+                        if ["remove", row, *(stored if stored[4] else stored[:4])] != change: # Undated rows have no date field
+                            raise ValueError(f"Row {row + 1} is not the row that was removed")
+                    self.connection.execute("DELETE FROM rows WHERE id = ?", (ids[row],))
+                    del ids[row]
+        except BaseException:
+            self.ids = None # The rows were rolled back, their ids are read again when needed
+            raise
+
+    # Returns the Totals of every row from one grouped query over the category index
+    def totals(self) -> Totals:
+        totals = Totals()
+        query = "SELECT category, cashflow, SUM(cents) FROM rows GROUP BY category, cashflow"
+        for category, cashflow, cents in self.connection.execute(query):
+            totals.add(add_category(category), cashflow_codes[cashflow], cents)
+        return totals
+
+    # Returns the same [(period start, {category code: cents})] as Time_Index.rollup from one grouped query over the date
+    # index, so no row is read into Python. Periods run from start to end (inclusive), or the first and last dated rows
+    def rollup(self, cashflow: int, period: str = "month", start: date = None, end: date = None) -> list:
+        first, last = self.connection.execute("SELECT MIN(day), MAX(day) FROM rows WHERE day IS NOT NULL").fetchone()
+        if first is None:
+            return []
+        lower = start or date.fromisoformat(first)
+        upper = end or date.fromisoformat(last)
+        width = 4 if period == "year" else 7 # Dates are YYYY-MM-DD text, so the year or month is a prefix
+        # The unary + keeps SQLite from picking the cashflow index, which would visit half the rows, over the date range
+        query = (f"SELECT substr(day, 1, {width}), category, SUM(cents) FROM rows "
+                 "WHERE day >= ? AND day <= ? AND +cashflow = ? GROUP BY 1, 2")
+        cells = {}
+        for label, category, cents in self.connection.execute(query, (lower.isoformat(), upper.isoformat(), cashflows[cashflow])):
+            if cents:
+                cells.setdefault(label, {})[add_category(category)] = cents
+
+        report = []
+        current = period_start(lower, period)
+        while current <= upper:
+            report.append((current, cells.get(period_label(current, period), {})))
+            current = next_period(current, period)
+        return report
+
+    # Appends the valid rows of a csv file chunk by chunk, so the whole file is never held in memory,
+    # then replays the csv's journal. replace drops the existing rows in the same transaction, rules categorize rows
+    # without a category. Returns the number of rows added and the Row_Error list
+    def import_csv(self, csv_path, replace=False, rules=None):
+        from modules.core import iter_row_chunks # core imports this module, so it is imported when first used
+        from modules.journal import Journal, journal_error
+        from modules.validator import validate_rows
+        from modules.compressed_io import open_text
+
+        rows = 0 if replace else self.count()
+        errors = []
+        with self.connection, open_text(csv_path) as file:
+            if replace: # Only once the csv has opened, a missing file leaves the database as it was
+                self.delete_all()
+            for lines, chunk_rows in iter_row_chunks(file):
+                chunk, chunk_errors = validate_rows(chunk_rows, rules, lines)
+                self.insert_rows(chunk)
+                errors.extend(chunk_errors)
+            self.create_indexes()
+        # Journal rows are numbered from the start of the csv, which starts after the rows already in the database.
+        # They only match the rows that loaded when no row was rejected
+        journal = Journal(csv_path)
+        changes = journal.read()
+        if changes and errors:
+            errors.append(journal_error(journal, changes, "rows of the file were rejected"))
+        elif changes:
+            try:
+                self.apply_changes([change if change[0] == "add" else ["remove", change[1] + rows, *change[2:]] for change in changes])
+            except ValueError as error:
+                errors.append(journal_error(journal, changes, str(error)))
+        return self.count() - rows, errors
@@ -0,0 +1,130 @@
+from array import array
+from bisect import bisect_left
+from datetime import date
+from itertools import accumulate
+
+# Sorted time index over the dated rows of a ledger, used for monthly and yearly reports.
+# For every (category code, cashflow code) the days with rows are kept sorted next to running totals of their cents, so
+# the total of any date range is two bisects and a subtraction instead of a scan of the ledger. Rows without a date are
+# left out. The window keeps its index up to date as rows are added, removed and imported, like the Dedup_Index, so only
+# the first report after a file is opened reads every row
+class Time_Index:
+    def __init__(self, ledger=None):
+        self.days = {} # (category code, cashflow code) -> sorted day numbers that have cents
+        self.sums = {} # (category code, cashflow code) -> cents of the days before each position, one longer than days
+        self.day_rows = {} # Day number -> number of rows dated that day, gives the date range
+        if ledger is not None:
+            self.add_ledger(ledger)
+
+    # Adds the given rows of a ledger, every row when rows is None. sign -1 takes them out again
+    def add_ledger(self, ledger, rows=None, sign=1):
+        if rows is None:
+            records = zip(ledger.dates, ledger.prices, ledger.categories, ledger.cashflows)
+        else:
+            dates, prices, categories, cashflows = ledger.dates, ledger.prices, ledger.categories, ledger.cashflows
+            records = ((dates[row], prices[row], categories[row], cashflows[row]) for row in rows)
+
+        changes = {} # (category code, cashflow code) -> {day number: cents}, merged into the sorted arrays once
+        day_rows = self.day_rows
+        for day, cents, category, cashflow in records:
+            if day:
+                key = (category, cashflow)
+                key_changes = changes.get(key)
+                if key_changes is None:
+                    key_changes = changes[key] = {}
+                key_changes[day] = key_changes.get(day, 0) + cents
+                count = day_rows.get(day, 0) + sign
+                if count:
+                    day_rows[day] = count
+                else:
+                    del day_rows[day]
+
+        for key, key_changes in changes.items():
+            self.merge(key, key_changes, sign)
+
+    def remove_ledger(self, ledger):
+        self.add_ledger(ledger, sign=-1)
+
+    # Adds a row of a ledger, e.g. one added by hand
+    def add_row(self, ledger, row: int):
+        self.add_ledger(ledger, (row,))
+
+    # Takes out a row of a ledger, runs before the row is removed
+    def remove_row(self, ledger, row: int):
+        self.add_ledger(ledger, (row,), -1)
+
+    # Rebuilds the arrays of one key with the cents of changed days. The cost depends on the number of days the key
+    # has rows on, not on the number of rows
+    def merge(self, key, changes, sign):
+        cells = {}
+        days = self.days.get(key)
+        if days is not None:
+            sums = self.sums[key]
+            cells = {day: sums[position + 1] - sums[position] for position, day in enumerate(days)}
+        for day, cents in changes.items():
+            cells[day] = cells.get(day, 0) + sign * cents
+
+        cells = sorted(cell for cell in cells.items() if cell[1]) # Days whose rows add up to 0 do not change any total
+        if not cells:
+            self.days.pop(key, None)
+            self.sums.pop(key, None)
+            return
+        self.days[key] = array('i', [day for day, _ in cells])
+        sums = array('q', [0])
+        sums.extend(accumulate(cents for _, cents in cells))
+        self.sums[key] = sums
+
+    # Checks if the ledger has any dated rows
+    def __bool__(self):
+        return bool(self.day_rows)
+
+    # Returns the first and last dates in the index, or None when no row has a date
+    def date_range(self):
+        if not self.day_rows:
+            return None
+        return date.fromordinal(min(self.day_rows)), date.fromordinal(max(self.day_rows))
+
+    # Returns the cents of a category and cashflow dated from start up to but not including end
+    def total(self, category: int, cashflow: int, start: date, end: date) -> int:
+        days = self.days.get((category, cashflow))
+        if days is None:
+            return 0
+        sums = self.sums[(category, cashflow)]
+        return sums[bisect_left(days, end.toordinal())] - sums[bisect_left(days, start.toordinal())]
+
+    # Returns [(period start, {category code: cents})] for each month or year from start to end (inclusive) for one cashflow.
+    # Each cell is a range query so the cost depends on the number of periods and categories, not the number of rows
+    def rollup(self, cashflow: int, period: str = "month", start: date = None, end: date = None) -> list:
+        if not self.day_rows:
+            return []
+        first, last = self.date_range()
+        lower = start or first
+        upper = date.fromordinal((end or last).toordinal() + 1) # Ranges include start and exclude upper
+        keys = sorted(key for key in self.days if key[1] == cashflow)
+
+        report = []
+        current = period_start(lower, period)
+        while current < upper:
+            following = next_period(current, period)
+            cents = {}
+            for category, _ in keys: # The first and last periods are cut to the requested dates
+                total = self.total(category, cashflow, max(current, lower), min(following, upper))
+                if total:
+                    cents[category] = total
+            report.append((current, cents))
+            current = following
+        return report
+
+# Returns the first day of the month or year that day falls in
+def period_start(day: date, period: str) -> date:
+    return date(day.year, 1, 1) if period == "year" else date(day.year, day.month, 1)
+
+# Returns the first day of the month or year after the one starting on start
+def next_period(start: date, period: str) -> date:
+    if period == "year":
+        return date(start.year + 1, 1, 1)
+    return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+# Formats the start of a period as 2024-03 for months or 2024 for years
+def period_label(start: date, period: str) -> str:
+    return str(start.year) if period == "year" else f"{start.year}-{start.month:02d}"
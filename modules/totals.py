@@ -0,0 +1,76 @@
+from modules.ledger import INCOME, EXPENDITURE
+
+# Running totals in whole cents for every category and cashflow pair.
+# Adding or removing a row is a single dictionary update so the ledger never has to be rescanned
+class Totals:
+    __slots__ = ("cents",)
+
+    def __init__(self, cents: dict = None):
+        self.cents = dict(cents) if cents else {} # (category code, cashflow code) -> cents
+
+    def add(self, category: int, cashflow: int, cents: int):
+        key = (category, cashflow)
+        self.cents[key] = self.cents.get(key, 0) + cents
+
+    def subtract(self, category: int, cashflow: int, cents: int):
+        self.add(category, cashflow, -cents)
+
+    # Adds a row of a ledger to the totals
+    def add_row(self, ledger, row: int):
+        self.add(ledger.categories[row], ledger.cashflows[row], ledger.prices[row])
+
+    # Subtracts a row of a ledger from the totals, used before the row is removed
+    def subtract_row(self, ledger, row: int):
+        self.subtract(ledger.categories[row], ledger.cashflows[row], ledger.prices[row])
+
+    # Adds every row of a ledger in one pass over its columns, used for bulk loads
+    def add_ledger(self, ledger):
+        sums = self.cents
+        get = sums.get
+        for cents, category, cashflow in zip(ledger.prices, ledger.categories, ledger.cashflows):
+            key = (category, cashflow)
+            sums[key] = get(key, 0) + cents
+
+    # Adds the totals of another Totals, e.g. of a block of rows that is restored
+    def add_totals(self, other: "Totals"):
+        for (category, cashflow), cents in other.cents.items():
+            self.add(category, cashflow, cents)
+
+    # Subtracts the totals of another Totals, e.g. of a block of rows that is taken away
+    def subtract_totals(self, other: "Totals"):
+        for (category, cashflow), cents in other.cents.items():
+            self.subtract(category, cashflow, cents)
+
+    # Replaces the totals with the totals of a ledger
+    def rebuild(self, ledger):
+        self.cents.clear()
+        self.add_ledger(ledger)
+
+    def clear(self):
+        self.cents.clear()
+
+    # Total cents of a cashflow across every category
+    def cashflow_total(self, cashflow: int) -> int:
+        return sum(cents for (_, key_cashflow), cents in self.cents.items() if key_cashflow == cashflow)
+
+    def income(self) -> int:
+        return self.cashflow_total(INCOME)
+
+    def expenditure(self) -> int:
+        return self.cashflow_total(EXPENDITURE)
+
+    # Income minus expenditure in cents
+    def net(self) -> int:
+        return self.income() - self.expenditure()
+
+    # Returns {category code: (income cents, expenditure cents)} for every category that has rows
+    def by_category(self) -> dict:
+        breakdown = {}
+        for (category, cashflow), cents in self.cents.items():
+            income, expenditure = breakdown.get(category, (0, 0))
+            if cashflow == INCOME:
+                income += cents
+            else:
+                expenditure += cents
+            breakdown[category] = (income, expenditure)
+        return breakdown
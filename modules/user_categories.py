@@ -0,0 +1,42 @@
+import os
+
+from modules import config
+from modules.ledger import add_category
+
+# User defined categories, e.g. Fitness from a rules file, kept in a file with one name per line so a csv saved with
+# them still opens when the rules file is not loaded. Only these and the built in categories are accepted in csv rows,
+# any other name is rejected so a typo never becomes a category. See MONEY_TRACKER_CATEGORIES
+
+# Adds the categories listed in the file to the category list. A missing file has none. Returns the names read
+def load_user_categories(path=None) -> list:
+    path = path or config.categories_path
+    try:
+        with open(path, mode='r', encoding='utf-8') as file:
+            names = [line.strip() for line in file]
+    except FileNotFoundError:
+        return []
+    names = [name for name in names if name and not name.startswith("#")]
+    for name in names:
+        add_category(name) # Raises ValueError past the category limit
+    return names
+
+# Appends the given category names that are not in the file yet. The file is a convenience, so a folder that cannot
+# be written only means the categories are not remembered
+def remember_categories(names, path=None):
+    path = path or config.categories_path
+    try:
+        with open(path, mode='r', encoding='utf-8') as file:
+            saved = {line.strip().lower() for line in file}
+    except FileNotFoundError:
+        saved = set()
+    except OSError:
+        return
+    new = list(dict.fromkeys(name for name in names if name.lower() not in saved)) # In order, without repeats
+    if not new:
+        return
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, mode='a', encoding='utf-8') as file:
+            file.write("".join(name + "\n" for name in new))
+    except OSError:
+        pass
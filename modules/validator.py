@@ -0,0 +1,156 @@
+import re
+import sys
+
+from datetime import date
+from typing import NamedTuple
+
+from modules.ledger import Ledger, categories, cashflows, category_lookup
+from modules.profiling import timed
+
+# Patterns are compiled once when the module is imported rather than once per row
+price_pattern = re.compile(r'^\s*\+?(?=\.?\d)(\d*)(?:\.(\d*))?\s*$') # Whole number part and optional decimal part
+date_pattern = re.compile(r'^\s*(\d{4})-(\d{2})-(\d{2})\s*$') # YYYY-MM-DD
+
+# Lookup from the csv text to the cashflow codes stored in the ledger, category_lookup grows with the categories
+cashflow_lookup = {cashflow.lower(): code for code, cashflow in enumerate(cashflows)}
+cashflow_lookup.update({cashflow: code for code, cashflow in enumerate(cashflows)})
+
+field_count = 4 # Name,Price,Category,Cashflow
+dated_field_count = 5 # Name,Price,Category,Cashflow,Date
+named_field_count = 2 # Name,Price, only when rules pick the category and cashflow
+
+# A single rejected field of an imported row
+class Row_Error(NamedTuple):
+    line: int # Line number in the csv file
+    column: str # Name of the column that failed, or Row when the row itself has the wrong shape
+    value: str # The text that was rejected
+    message: str
+
+    def __str__(self): # Line 0 is a problem with the file rather than a row, e.g. its journal
+        return f"{f'Line {self.line}, ' if self.line else ''}{self.column}: '{self.value}' - {self.message}"
+
+# Converts price text to whole cents, returns None when the text is not a number 0.0 or greater
+def parse_cents(price: str):
+    match = price_pattern.match(price)
+    if match is None:
+        return None
+    whole, fraction = match.groups()
+    cents = int(whole or 0) * 100
+    if fraction: # Rounds half up when more than 2 decimal places are given
+        cents += int(fraction[:2].ljust(2, "0"))
+        if len(fraction) > 2 and fraction[2] >= "5":
+            cents += 1
+    return cents
+
+# Converts YYYY-MM-DD text to the day number stored in the ledger. Empty text is 0, returns None when it is not a real date
+def parse_day(text: str):
+    if not text.strip():
+        return 0
+    match = date_pattern.match(text)
+    if match is None:
+        return None
+    try:
+        return date(*map(int, match.groups())).toordinal()
+    except ValueError: # e.g. 2023-02-30
+        return None
+
+# Returns the line number in the file of the row at index in a chunk
+def row_line(lines, index) -> int:
+    return lines + index if isinstance(lines, int) else lines[index]
+
+# Validates a chunk of rows in one pass, skipping empty rows. lines is the line number of the first row or the list of
+# line numbers from core.iter_row_chunks. With Rules, rows whose category or cashflow is empty or unknown get them from
+# the first rule matching the name. User defined categories are known once their file is loaded, see user_categories.
+# Returns a Ledger holding the good rows and a list of Row_Error for every bad field in the chunk
+@timed("validate_rows")
+def validate_rows(rows, rules=None, lines=1):
+    chunk = Ledger()
+    errors = []
+    # Local lookups are faster inside the loop, rows are appended straight to the columns
+    add_name = chunk.names.append
+    add_price = chunk.prices.append
+    add_category_code = chunk.categories.append
+    add_cashflow = chunk.cashflows.append
+    add_day = chunk.dates.append
+    add_error = errors.append
+    intern = sys.intern
+    get_category = category_lookup.get
+    get_cashflow = cashflow_lookup.get
+    # Dates, prices and names repeat across rows so each one is parsed once per chunk. Line numbers are only
+    # worked out for rows with an error
+    days = {}
+    prices = {}
+    names = {}
+    match_rule = rules.match if rules is not None else None
+
+    for index, row in enumerate(rows):
+        length = len(row)
+        if length == field_count:
+            name, price, category, cashflow = row
+            day = 0
+        elif length == dated_field_count:
+            name, price, category, cashflow, day_text = row
+            day = days.get(day_text)
+            if day is None:
+                day = days[day_text] = parse_day(day_text)
+        elif length == named_field_count and match_rule is not None: # e.g. a bank export without categories
+            name, price = row
+            category = cashflow = ""
+            day = 0
+        elif not any(row): # An empty line
+            continue
+        else:
+            add_error(Row_Error(row_line(lines, index), "Row", ",".join(row), "Expected 4 or 5 fields: Name,Price,Category,Cashflow[,Date]"))
+            continue
+
+        valid = True
+
+        cents = prices.get(price)
+        if cents is None:
+            cents = prices[price] = parse_cents(price)
+            if cents is None:
+                if not any(row): # Only commas e.g. ,,,
+                    continue
+                add_error(Row_Error(row_line(lines, index), "Price", price, "Expected a number 0.0 or greater"))
+                valid = False
+
+        rule = None
+        category_code = get_category(category)
+        if category_code is None:
+            category_code = get_category(category.strip().lower())
+            if category_code is None and match_rule is not None:
+                rule = match_rule(name) # Cached per name, so repeated names cost a dict lookup
+                if rule is not None:
+                    category_code = rule[0]
+            if category_code is None:
+                add_error(Row_Error(row_line(lines, index), "Category", category, f"Expected categories: {', '.join(categories)}"
+                                                                + (" or a name matching a rule" if match_rule is not None else "")))
+                valid = False
+
+        cashflow_code = get_cashflow(cashflow)
+        if cashflow_code is None:
+            cashflow_code = get_cashflow(cashflow.strip().lower())
+            if cashflow_code is None and match_rule is not None:
+                rule = rule or match_rule(name)
+                if rule is not None:
+                    cashflow_code = rule[1]
+            if cashflow_code is None:
+                add_error(Row_Error(row_line(lines, index), "Cashflow", cashflow, "Expected: Income or Expenditure"))
+                valid = False
+
+        if day is None:
+            add_error(Row_Error(row_line(lines, index), "Date", day_text, "Expected a date: YYYY-MM-DD"))
+            valid = False
+
+        if valid:
+            stripped = names.get(name)
+            if stripped is None:
+                stripped = names[name] = intern(name.strip() or "-") # Repeated names share a single string
+            add_name(stripped)
+            add_price(cents)
+            add_category_code(category_code)
+            add_cashflow(cashflow_code)
+            add_day(day)
+
+    chunk.sources.frombytes(bytes(2 * len(chunk.names))) # Every row starts without a source file
+    return chunk, errors
@@ -1,12 +1,24 @@
 import sys
 
-from PySide6.QtWidgets import QApplication
-from modules import UI # Imports the UI module
+from modules import cli # Command line tools, does not import Qt
+from modules.profiling import run_session # Runs the session under cProfile when MONEY_TRACKER_PROFILE is set
+
+# Creates the main window and runs the Qt event loop until it closes
+def run_gui():
+    # Qt is only imported when the GUI is started
+    from PySide6.QtWidgets import QApplication
+    from modules import UI # Imports the UI module
 
-if __name__ == '__main__':
     app = QApplication(sys.argv)
 
     window = UI.Money_Tracker() # Creates a Money_Tracker object from the main_ui module
     window.show()
+    window.offer_recovery() # Changes autosaved by a session that crashed
+
+    return app.exec_()
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in cli.commands: # e.g. python money_tracker.py summarize ledger.csv
+        sys.exit(run_session(cli.main, sys.argv[1:]))
 
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(run_session(run_gui))
@@ -0,0 +1,34 @@
+import random
+
+from modules.ledger import Ledger
+from modules.journal import add_change, remove_change
+
+names = ("Coffee", "Coffee beans", "Rent", "Bus fare", "Tesco", "Tesco Express", "Salary", "Gym")
+
+# Returns a ledger of random rows. Names, prices and dates come from small sets so rows repeat, as real ledgers do
+def random_ledger(rng: random.Random, rows: int) -> Ledger:
+    ledger = Ledger()
+    for _ in range(rows):
+        add_random_row(ledger, rng)
+    return ledger
+
+# Appends a random row to the ledger
+def add_random_row(ledger, rng):
+    day = rng.choice((0, 738000, 738001, 738400))
+    ledger.append_row(rng.choice(names), rng.choice((0, 350, 1299, 50000)), rng.randrange(4), rng.randrange(2), day=day)
+
+# Makes random adds and removes on a copy of the ledger and returns it with the journal entries the window would save.
+# Some removes are written as entries from before rows were checked, which only hold the row number
+def random_changes(ledger, count, rng):
+    edited = ledger.copy()
+    changes = []
+    for _ in range(count):
+        if len(edited) and rng.random() < 0.5:
+            row = rng.randrange(len(edited))
+            change = remove_change(edited, row)
+            changes.append(change if rng.random() < 0.9 else change[:2])
+            edited.remove(row)
+        else:
+            add_random_row(edited, rng)
+            changes.append(add_change(edited, len(edited) - 1))
+    return edited, changes
@@ -0,0 +1,81 @@
+import csv
+import io
+import random
+
+import pytest
+
+from modules.core import iter_row_chunks, row_line_numbers
+from modules.validator import validate_rows, row_line
+from modules.export import iter_records
+
+# Returns csv text of random rows, some of them bad or empty, and names holding every kind of line break
+def random_csv(rng, rows, line_break):
+    buffer = io.StringIO(newline="")
+    writer = csv.writer(buffer, lineterminator=line_break)
+    for _ in range(rows):
+        kind = rng.random()
+        if kind < 0.1:
+            buffer.write(line_break) # An empty line
+        elif kind < 0.15:
+            writer.writerow(["Only", "three", "fields"])
+        else:
+            name = rng.choice(("Coffee", "Two\nlines", "Three\r\nlines\rhere", "Rent"))
+            price = rng.choice(("3.50", "12", "abc"))
+            category = rng.choice(("Restaurants", "Rent", "Grocries"))
+            writer.writerow([name, price, category, "Expenditure", *rng.choice(((), ("2024-01-02",)))])
+    return buffer.getvalue()
+
+# Line of the file each row starts on, read a row at a time
+def first_lines(text):
+    reader = csv.reader(io.StringIO(text, newline=""))
+    lines = []
+    while True:
+        line = reader.line_num + 1
+        if next(reader, None) is None:
+            return lines
+        lines.append(line)
+
+def chunk_lines(text, chunk_size, first_size=None):
+    rows = []
+    lines = []
+    for chunk_lines, chunk_rows in iter_row_chunks(io.StringIO(text, newline=""), chunk_size, first_size):
+        rows.extend(chunk_rows)
+        lines.extend(row_line(chunk_lines, index) for index in range(len(chunk_rows)))
+    return lines, rows
+
+def test_row_line_numbers_counts_the_line_breaks_in_fields():
+    rows = [["a", "b"], ["two\nlines", "x"], ["c"], ["crlf\r\nand\rcr", "y"], []]
+    assert row_line_numbers(rows, 10) == [10, 11, 13, 14, 17]
+
+@pytest.mark.parametrize("line_break", ["\n", "\r\n"])
+@pytest.mark.parametrize("seed", range(20))
+def test_chunks_number_rows_like_the_file(seed, line_break):
+    rng = random.Random(seed)
+    text = random_csv(rng, rng.randrange(0, 200), line_break)
+    expected = first_lines(text)
+    for chunk_size, first_size in ((2, None), (50000, None), (50000, 3), (7, 1)):
+        lines, rows = chunk_lines(text, chunk_size, first_size)
+        assert lines == expected
+        assert rows == list(csv.reader(io.StringIO(text, newline="")))
+
+# Validating in small or large chunks loads the same rows and reports the same errors on the same lines
+@pytest.mark.parametrize("seed", range(20))
+def test_validation_does_not_depend_on_chunk_size(seed):
+    rng = random.Random(seed)
+    text = random_csv(rng, 300, rng.choice(("\n", "\r\n")))
+    results = []
+    for chunk_size in (2, 50000):
+        records = []
+        errors = []
+        for lines, rows in iter_row_chunks(io.StringIO(text, newline=""), chunk_size, 2):
+            chunk, chunk_errors = validate_rows(rows, None, lines)
+            records.extend(iter_records(chunk))
+            errors.extend(chunk_errors)
+        results.append((records, errors))
+    assert results[0] == results[1]
+
+    # Each error names a line a bad row starts on
+    starts = dict(zip(first_lines(text), csv.reader(io.StringIO(text, newline=""))))
+    for error in results[0][1]:
+        row = starts[error.line]
+        assert error.value in row or error.value == ",".join(row)
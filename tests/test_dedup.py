@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from modules.dedup import Dedup_Index, ledger_keys
+from modules.export import iter_records
+from modules.ledger import Ledger
+
+from helpers import random_ledger
+
+# Merges files as multi_import does, every row tagged with the file it came from
+def merged_import(files):
+    merged = Ledger()
+    for number, ledger in enumerate(files):
+        ledger.set_source(f"/imports/{number}.csv")
+        merged.extend_ledger(ledger)
+    return merged
+
+def one_row(name, cents=350):
+    ledger = Ledger()
+    ledger.append_row(name, cents, 4, 1)
+    return ledger
+
+def repeated(name, copies):
+    ledger = Ledger()
+    for _ in range(copies):
+        ledger.extend_ledger(one_row(name))
+    return ledger
+
+# Rows kept and skipped for each import file, by name
+def filtered_names(ledger, files):
+    kept, keys, duplicates = Dedup_Index.build(ledger).filter(merged_import(files))
+    assert keys == ledger_keys(kept)
+    return sorted(kept.names), sorted(duplicates.names)
+
+# A file skips as many copies of a row as the ledger, or an earlier file, already holds. The copies within one file are
+# real repeats e.g. two coffees on one day, so they are all kept when nothing held the row before
+@pytest.mark.parametrize("ledger_copies, file_copies, kept, skipped", [
+    (0, [2], 2, 0),
+    (2, [3], 1, 2),
+    (3, [2], 0, 2),
+    (0, [1, 1], 1, 1),
+    (1, [2, 3], 2, 3),
+    (2, [1, 1, 4], 2, 4),
+])
+def test_filter_skips_copies_already_held(ledger_copies, file_copies, kept, skipped):
+    files = [repeated("Coffee", copies) for copies in file_copies]
+    assert filtered_names(repeated("Coffee", ledger_copies), files) == (["Coffee"] * kept, ["Coffee"] * skipped)
+
+def test_filter_keeps_rows_that_differ_in_any_field():
+    ledger = one_row("Coffee")
+    files = [one_row("Coffee", 351), one_row("coffee  "), one_row("Tea")]
+    kept, _, duplicates = Dedup_Index.build(ledger).filter(merged_import(files))
+    assert len(kept) == 2 and len(duplicates) == 1 # Names match without case and runs of spaces
+
+# The rows filter keeps match a count of each row: every file keeps the copies of a row past the most any earlier file
+# or the ledger held, and the first copies of each file are the ones skipped
+@pytest.mark.parametrize("seed", range(100))
+def test_filter_matches_a_multiset_model(seed):
+    rng = random.Random(seed)
+    ledger = random_ledger(rng, rng.randrange(0, 20))
+    files = [random_ledger(rng, rng.randrange(0, 15)) for _ in range(rng.randrange(1, 4))]
+    merged = merged_import(files)
+    kept, keys, duplicates = Dedup_Index.build(ledger).filter(merged)
+
+    present = {}
+    for record in iter_records(ledger):
+        present[record] = present.get(record, 0) + 1
+    expected_kept = []
+    expected_duplicates = []
+    row = 0
+    for file in files:
+        seen = {}
+        for record in iter_records(file):
+            seen[record] = seen.get(record, 0) + 1
+            (expected_duplicates if seen[record] <= present.get(record, 0) else expected_kept).append(row)
+            row += 1
+        for record, count in seen.items():
+            present[record] = max(present.get(record, 0), count)
+
+    assert list(iter_records(kept)) == list(iter_records(merged.take(expected_kept)))
+    assert list(iter_records(duplicates)) == list(iter_records(merged.take(expected_duplicates)))
+    assert list(kept.sources) == [merged.sources[row] for row in expected_kept]
+    assert keys == ledger_keys(kept)
@@ -0,0 +1,73 @@
+import random
+from datetime import date
+
+import pytest
+
+from modules.core import iter_ledger_records, read_ledger, write_ledger
+from modules.export import export_records, export_file, filter_records, iter_records
+from modules.journal import Journal
+
+from helpers import random_ledger, random_changes
+
+# Streaming a file gives the rows, and the errors, of loading the whole ledger
+def assert_streams_like_a_load(path):
+    errors = []
+    records = list(iter_ledger_records(path, errors))
+    ledger, load_errors = read_ledger(path)
+    assert records == list(iter_records(ledger))
+    assert errors == load_errors
+    return ledger
+
+# Writes a csv ledger with a journal of random changes, as a window saves them
+def csv_with_journal(path, rng, changes=None):
+    ledger = random_ledger(rng, rng.randrange(0, 60))
+    write_ledger(path, ledger)
+    if changes is None:
+        _, changes = random_changes(ledger, rng.randrange(1, 30), rng)
+    Journal(path).append(changes)
+    return changes
+
+@pytest.mark.parametrize("seed", range(30))
+def test_csv_journal_streams_like_a_load(tmp_path, seed):
+    path = str(tmp_path / "ledger.csv")
+    csv_with_journal(path, random.Random(seed))
+    assert_streams_like_a_load(path)
+
+# A journal that does not fit the csv is dropped the same way, with the same error, on both paths
+def test_damaged_journal_streams_like_a_load(tmp_path):
+    path = str(tmp_path / "ledger.csv")
+    csv_with_journal(path, random.Random(1), [["add", "Coffee", 350, "Restaurants", "Expenditure"], ["remove", 0, "Not", 1, "Rent", "Income"]])
+    assert_streams_like_a_load(path)
+
+# Rejected rows are reported on both paths, and the journal is not replayed onto the rows that loaded
+def test_rejected_rows_stream_like_a_load(tmp_path):
+    path = str(tmp_path / "ledger.csv")
+    with open(path, mode='w', encoding='utf-8', newline='') as file:
+        file.write("Coffee,3.50,Restaurants,Expenditure\nTea,abc,Restaurants,Expenditure\n\n\"Two\nlines\",1,Rent,Income,2024-01-02\nBus,2,Grocries,Expenditure\n")
+    Journal(path).append([["add", "Milk", 120, "Groceries", "Expenditure"], ["remove", 0]])
+    ledger = assert_streams_like_a_load(path)
+    assert ledger.names == ["Coffee", "Two\nlines"]
+
+@pytest.mark.parametrize("suffix", [".db", ".mtl", ".csv.gz"])
+def test_other_ledgers_stream_like_a_load(tmp_path, suffix):
+    path = str(tmp_path / f"ledger{suffix}")
+    write_ledger(path, random_ledger(random.Random(2), 500))
+    assert_streams_like_a_load(path)
+
+# Exporting streamed records writes the same file as exporting the loaded ledger's rows, filtered the same way
+@pytest.mark.parametrize("output", ["out.csv", "out.jsonl", "out.csv.gz"])
+@pytest.mark.parametrize("summary", [False, True])
+@pytest.mark.parametrize("filters", [{}, {"category": 1}, {"cashflow": 0, "start": date.fromordinal(738001)}])
+def test_streamed_export_matches_a_ledger_export(tmp_path, output, summary, filters):
+    path = str(tmp_path / "ledger.csv")
+    csv_with_journal(path, random.Random(3))
+    ledger, _ = read_ledger(path)
+    rows = [row for row, record in enumerate(iter_records(ledger)) if list(filter_records([record], **filters))]
+
+    streamed = str(tmp_path / f"streamed-{output}")
+    loaded = str(tmp_path / f"loaded-{output}")
+    errors = []
+    written = export_records(streamed, filter_records(iter_ledger_records(path, errors), **filters), summary)
+    assert written == export_file(loaded, ledger, rows, summary)
+    with open(streamed, mode='rb') as streamed_file, open(loaded, mode='rb') as loaded_file:
+        assert streamed_file.read() == loaded_file.read()
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from modules.export import iter_records
+from modules.journal import apply_changes, plan_changes, record_fields
+
+from helpers import random_ledger, random_changes
+
+# Plans the changes over the rows of ledger as core.iter_csv_records does, with the fields of just the rows that look
+# like a removed row, and returns the records it streams
+def streamed_records(ledger, changes):
+    wanted = {tuple(change[2:]) for change in changes if change[0] == "remove" and len(change) > 2}
+    fields = {}
+    for row, record in enumerate(iter_records(ledger)):
+        if tuple(record_fields(record)) in wanted:
+            fields[row] = record_fields(record)
+    removed, added = plan_changes(len(ledger), changes, fields)
+    return [record for row, record in enumerate(iter_records(ledger)) if row not in removed] + added
+
+@pytest.mark.parametrize("seed", range(200))
+def test_plan_changes_matches_apply_changes(seed):
+    rng = random.Random(seed)
+    ledger = random_ledger(rng, rng.randrange(0, 30))
+    edited, changes = random_changes(ledger, rng.randrange(1, 40), rng)
+
+    applied = ledger.copy()
+    apply_changes(applied, changes)
+    assert list(iter_records(applied)) == list(iter_records(edited))
+    assert streamed_records(ledger, changes) == list(iter_records(applied))
+
+# A remove that names another row fails both ways with the same message
+@pytest.mark.parametrize("seed", range(50))
+def test_plan_changes_rejects_the_changes_apply_changes_rejects(seed):
+    rng = random.Random(seed)
+    ledger = random_ledger(rng, 20)
+    _, changes = random_changes(ledger, 30, rng)
+    removes = [position for position, change in enumerate(changes) if change[0] == "remove" and len(change) > 2]
+    if not removes:
+        pytest.skip("no checked remove to damage")
+    damaged = list(changes)
+    position = rng.choice(removes)
+    damaged[position] = [*damaged[position][:2], "Not a row", *damaged[position][3:]]
+
+    with pytest.raises(ValueError) as applied:
+        apply_changes(ledger.copy(), damaged)
+    with pytest.raises(ValueError) as streamed:
+        streamed_records(ledger, damaged)
+    assert str(streamed.value) == str(applied.value)
+
+@pytest.mark.parametrize("change", [["remove", 5], ["remove", -1], ["remove", "1"], ["add", "Coffee"], []])
+def test_plan_changes_rejects_entries_outside_the_ledger(change):
+    with pytest.raises(ValueError):
+        apply_changes(random_ledger(random.Random(0), 5), [change])
+    with pytest.raises(ValueError):
+        plan_changes(5, [change], {})
@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from modules.ledger_index import Ledger_Index
+
+from helpers import random_ledger, add_random_row
+
+searches = ("", "c", "coffee", "tesco ex", "bus", "nothing")
+columns = range(6)
+
+# Checks an index patched row by row holds the same rows as one built from the ledger as it is now
+def assert_same_as_rebuilt(index, ledger):
+    fresh = Ledger_Index(ledger)
+    assert index.indexed == fresh.indexed == len(ledger)
+    assert index.postings == fresh.postings
+    assert index.groups == fresh.groups
+    assert {name: sorted(keys) for name, keys in index.name_keys.items()} == {name: sorted(keys) for name, keys in fresh.name_keys.items()}
+    assert index.tokens == fresh.tokens
+    assert {token: sorted(names) for token, names in index.token_names.items()} == {token: sorted(names) for token, names in fresh.token_names.items()}
+    for column, rows in index.orders.items(): # Orders built before the edits were patched rather than rebuilt
+        assert rows == fresh.order(column)
+    for text in searches:
+        for category in (None, 0, 3):
+            rows = index.filter_rows(text, category, None)
+            assert rows == fresh.filter_rows(text, category, None)
+            for column in columns:
+                assert index.sort_rows(rows, column, descending=True) == fresh.sort_rows(rows, column, descending=True)
+
+# Edits the ledger the way Ledger_Model does, with the index patched around each change
+@pytest.mark.parametrize("seed", range(100))
+def test_patched_index_matches_a_rebuild(seed):
+    rng = random.Random(seed)
+    ledger = random_ledger(rng, rng.randrange(0, 40))
+    index = Ledger_Index(ledger)
+    for column in rng.sample(columns, 3):
+        index.order(column)
+
+    for _ in range(40):
+        action = rng.random()
+        if action < 0.35 and len(ledger):
+            row = rng.randrange(len(ledger))
+            index.remove_row(row) # Reads the row, so it runs before the remove
+            ledger.remove(row)
+        elif action < 0.65:
+            row = rng.randrange(len(ledger) + 1)
+            new = random_ledger(rng, 1)
+            ledger.insert_row(row, new.names[0], new.prices[0], new.categories[0], new.cashflows[0], day=new.dates[0])
+            index.insert_row(row) # Reads the row, so it runs after the insert
+        elif action < 0.9:
+            first = len(ledger)
+            for _ in range(rng.choice((1, 3, 100))): # Past max_order_inserts the orders are dropped instead
+                add_random_row(ledger, rng)
+            index.add_rows(first, len(ledger))
+        elif len(ledger):
+            first = rng.randrange(len(ledger))
+            ledger.split(first)
+            index.remove_rows_from(first)
+    assert_same_as_rebuilt(index, ledger)
+
+# Rows appended after the index was built are only indexed once add_rows is called, as ledger_index does
+def test_rows_past_indexed_are_left_for_add_rows():
+    rng = random.Random(1)
+    ledger = random_ledger(rng, 10)
+    index = Ledger_Index(ledger)
+    add_random_row(ledger, rng)
+    index.remove_row(len(ledger) - 1)
+    ledger.remove(len(ledger) - 1)
+    for _ in range(5):
+        add_random_row(ledger, rng)
+    index.add_rows(index.indexed, len(ledger))
+    assert_same_as_rebuilt(index, ledger)